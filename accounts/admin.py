@@ -5,9 +5,12 @@ Django Admin 配置
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.html import format_html
 
-from .models import UserProfile, LoginRecord
+from .models import UserProfile, LoginRecord, LoginDailyRollup, OutboundEmail, UserAgent
+from .avatars import clear_avatar, schedule_avatar
+from .pagination import BoundedCountPaginator
 
 
 class UserProfileInline(admin.StackedInline):
@@ -55,14 +58,14 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone', 'gender', 'is_verified', 'created_at')
     list_filter = ('gender', 'is_verified', 'created_at')
     search_fields = ('user__username', 'user__email', 'phone')
-    readonly_fields = ('created_at', 'updated_at', 'age_display')
+    readonly_fields = ('created_at', 'updated_at', 'age_display', 'avatar_status')
     
     fieldsets = (
         ('关联用户', {
             'fields': ('user',)
         }),
         ('基本信息', {
-            'fields': ('avatar', 'phone', 'birth_date', 'gender', 'age_display')
+            'fields': ('avatar', 'avatar_status', 'phone', 'birth_date', 'gender', 'age_display')
         }),
         ('详细信息', {
             'fields': ('bio', 'location', 'website')
@@ -78,17 +81,32 @@ class UserProfileAdmin(admin.ModelAdmin):
         return f"{age}岁" if age else "未知"
     age_display.short_description = '年龄'
 
+    def save_model(self, request, obj, form, change):
+        """后台上传的头像同样交给后台线程生成缩略图"""
+        if 'avatar' in form.changed_data:
+            if obj.avatar:
+                obj.avatar_status = UserProfile.AVATAR_PENDING
+            else:
+                clear_avatar(obj)
+        super().save_model(request, obj, form, change)
+        if 'avatar' in form.changed_data and obj.avatar:
+            schedule_avatar(obj)
+
 
 @admin.register(LoginRecord)
 class LoginRecordAdmin(admin.ModelAdmin):
     """登录记录管理"""
     list_display = ('user', 'ip_address', 'login_method', 'is_successful', 
                    'login_time', 'user_agent_short')
-    list_filter = ('login_method', 'is_successful', 'login_time')
-    search_fields = ('user__username', 'ip_address', 'user_agent')
+    list_filter = ('login_method', 'is_successful', 'login_time', 'user_agent__device')
+    search_fields = ('user__username', 'ip_address', 'user_agent__raw')
     readonly_fields = ('login_time',)
+    raw_id_fields = ('user_agent',)
     date_hierarchy = 'login_time'
     ordering = ('-login_time',)
+    # 大表上不做精确计数：不显示未筛选的总数，分页计数最多扫描 LOGIN_RECORD_ADMIN_COUNT_LIMIT 行
+    show_full_result_count = False
+    paginator = BoundedCountPaginator
     
     fieldsets = (
         ('用户信息', {
@@ -106,13 +124,70 @@ class LoginRecordAdmin(admin.ModelAdmin):
     def user_agent_short(self, obj):
         """显示简短的用户代理信息"""
         if obj.user_agent:
-            return obj.user_agent[:50] + "..." if len(obj.user_agent) > 50 else obj.user_agent
+            return str(obj.user_agent)
         return "-"
     user_agent_short.short_description = '用户代理'
     
     def get_queryset(self, request):
         """优化查询"""
-        return super().get_queryset(request).select_related('user')
+        return super().get_queryset(request).select_related('user', 'user_agent')
+
+
+@admin.register(LoginDailyRollup)
+class LoginDailyRollupAdmin(admin.ModelAdmin):
+    """每日登录汇总管理（由归档命令生成，只读）"""
+    list_display = ('user', 'date', 'total_logins', 'successful_logins', 'failed_logins')
+    search_fields = ('user__username',)
+    date_hierarchy = 'date'
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UserAgent)
+class UserAgentAdmin(admin.ModelAdmin):
+    """用户代理管理（登录时自动去重写入，只读）"""
+    list_display = ('__str__', 'browser', 'browser_version', 'os', 'os_version', 'device', 'created_at')
+    list_filter = ('device', 'browser', 'os')
+    search_fields = ('raw',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """发件箱管理（只读，可将失败的邮件重新加入发送队列）"""
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    date_hierarchy = 'created_at'
+    actions = ['retry_now']
+
+    def recipients(self, obj):
+        return ', '.join(obj.to)
+    recipients.short_description = '收件人'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='立即重新发送')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_PENDING, attempts=0,
+            next_attempt_at=timezone.now(), locked_until=None, claim_token='',
+        )
+        self.message_user(request, f'已将 {updated} 封邮件重新加入发送队列')
 
 
 # 重新注册User模型以使用自定义的UserAdmin
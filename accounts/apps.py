@@ -12,4 +12,6 @@ class AccountsConfig(AppConfig):
     
     def ready(self):
         """应用准备完成后的初始化"""
-        import accounts.signals 
\ No newline at end of file
+        import accounts.signals
+        import accounts.db
+        import accounts.metrics 
\ No newline at end of file
@@ -0,0 +1,338 @@
+"""
+异步视图
+
+密码哈希等 CPU 密集的工作放到进程池中执行，视图本身只 await 结果。
+响应格式与 views.py 中对应的同步视图一致。
+
+ASYNC_VIEWS 开启时（ASGI 部署），读多写少的接口也使用这里的异步版本：
+    - 认证、缓存、统计、分页和黑名单都走异步 ORM 或进程内缓存，不占用线程池；
+      只有访问网络的缓存后端（Redis 等）通过 sync_to_async 放到线程池
+    - 视图中剩下的计算（HMAC 验签、序列化一页记录）是微秒级的，直接在事件循环中执行
+    - 不经过 DRF 的 APIView，由 async_api_view 完成方法检查、认证和异常渲染
+    - 与同步视图一样在 replica_reads() 中查询，配置了副本时读副本
+"""
+
+import functools
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .backends import identifier_queryset, pick_user
+from .blacklist import ablacklist_token, ais_blacklisted
+from .cache import acached_response
+from .db import replica_reads
+from .models import LoginRecord, UserProfile
+from .pagination import LoginRecordPagination
+from .password_pool import PasswordPoolBusy, get_password_pool
+from .representations import login_record_rows, login_record_values, profile_representation, user_representation
+from .serializers import LoginCredentialsSerializer
+from .stats import aget_login_stats
+from .views import UserLoginView
+
+logger = logging.getLogger(__name__)
+
+
+def _render(data, status_code):
+    """用 DRF 的 JSONRenderer 渲染，保证与同步视图输出一致"""
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status_code,
+        content_type='application/json'
+    )
+
+
+def _parse_body(request):
+    """解析 JSON 或表单请求体"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST.dict()
+
+
+async def _find_user(identifier):
+    """与 UsernameOrEmailBackend 相同：一次查询解析用户名或邮箱"""
+    candidates = [user async for user in identifier_queryset(identifier)]
+    return pick_user(candidates, identifier)
+
+
+async def async_login_view(request):
+    """
+    异步用户登录视图（PASSWORD_HASH_OFFLOAD 开启时使用）
+    POST /api/auth/login/
+
+    与 UsernameOrEmailBackend 一样一次查询解析用户名或邮箱，密码最多只校验一次；
+    用户不存在时对假哈希校验一次以保持耗时一致。进程池排队已满时返回 503。
+    """
+    if request.method != 'POST':
+        return _render({'detail': f'方法 “{request.method}” 不被允许。'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    data = _parse_body(request)
+    if data is None:
+        return _render({'detail': 'JSON 解析错误'}, status.HTTP_400_BAD_REQUEST)
+
+    view = UserLoginView()
+    throttled = await sync_to_async(view.check_throttle)(request, data.get('username', ''))
+    if throttled is not None:
+        response = _render(view.throttled_payload(throttled), status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(throttled.retry_after)
+        return response
+
+    credentials = LoginCredentialsSerializer(data=data)
+    if not credentials.is_valid():
+        payload = await sync_to_async(view.login_failed)(
+            request, data.get('username', ''), credentials.errors
+        )
+        return _render(payload, status.HTTP_400_BAD_REQUEST)
+
+    username = credentials.validated_data['username']
+    password = credentials.validated_data['password']
+    user = await _find_user(username)
+
+    try:
+        is_correct, new_encoded = await get_password_pool().acheck_password(
+            password, user.password if user else None
+        )
+    except PasswordPoolBusy as e:
+        logger.warning("登录请求被拒绝: %s", e)
+        response = _render({'message': '登录请求过多，请稍后重试'}, status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '1'
+        return response
+
+    # 与 ModelBackend 一致：停用的账户按认证失败处理
+    if not is_correct or not user.is_active:
+        errors = {'non_field_errors': ['用户名/邮箱或密码错误']}
+        payload = await sync_to_async(view.login_failed)(request, username, errors, user)
+        return _render(payload, status.HTTP_400_BAD_REQUEST)
+
+    if new_encoded:
+        # 哈希策略变化，按当前策略升级存储的哈希
+        user.password = new_encoded
+        await user.asave(update_fields=['password'])
+
+    payload = await sync_to_async(view.login_succeeded)(request, user)
+    return _render(payload, status.HTTP_200_OK)
+
+
+# Django 4.2 的 csrf_exempt 装饰器不支持协程函数，直接设置标记
+async_login_view.csrf_exempt = True
+
+
+def _authenticators():
+    return [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+
+async def _authenticate(request, authenticators):
+    """
+    与 DRF 相同：按顺序尝试认证类，第一个返回结果的生效
+
+    提供 aauthenticate 的认证类（CachedJWTAuthentication）直接 await，
+    其余的（SessionAuthentication）在线程中调用。
+    """
+    for authenticator in authenticators:
+        if hasattr(authenticator, 'aauthenticate'):
+            result = await authenticator.aauthenticate(request)
+        else:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        if result is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = result
+            return
+    raise exceptions.NotAuthenticated()
+
+
+def _handle_exception(exc, request, authenticators):
+    """与 APIView.handle_exception 相同：未认证时有 WWW-Authenticate 头返回 401，否则 403"""
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        auth_header = authenticators[0].authenticate_header(request) if authenticators else None
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            exc.status_code = status.HTTP_403_FORBIDDEN
+    response = exception_handler(exc, {'request': request})
+    if response is None:
+        raise exc
+    rendered = _render(response.data, response.status_code)
+    for header in ('WWW-Authenticate', 'Retry-After'):
+        if header in response:
+            rendered[header] = response[header]
+    return rendered
+
+
+def async_api_view(methods, authenticated=True):
+    """
+    异步视图装饰器
+
+    视图收到的是 DRF 的 Request（可以使用 query_params、data），返回 HttpResponse。
+    authenticated 为 True 时要求登录（相当于 IsAuthenticated）。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def view(request, *args, **kwargs):
+            authenticators = _authenticators()
+            request = Request(
+                request,
+                parsers=[JSONParser(), FormParser(), MultiPartParser()],
+                authenticators=authenticators,
+            )
+            try:
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                if authenticated:
+                    await _authenticate(request, authenticators)
+                response = await func(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                response = _handle_exception(exc, request, authenticators)
+            # 与 APIView.finalize_response 添加的响应头一致
+            response['Allow'] = ', '.join(methods)
+            patch_vary_headers(response, ('Accept',))
+            return response
+
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+async def _attach_profile(user):
+    """
+    异步查询用户资料并写入 user.profile 的关联缓存
+
+    之后序列化器访问 user.profile 不会在事件循环中触发同步查询；
+    没有资料时缓存 None，访问时与同步视图一样抛出 DoesNotExist。
+    """
+    profile = await UserProfile.objects.filter(user=user).afirst()
+    if profile is None:
+        User.profile.related.set_cached_value(user, None)
+    else:
+        user.profile = profile
+    return profile
+
+
+@async_api_view(['GET'])
+async def async_user_info_view(request):
+    """
+    获取当前用户信息（异步版本）
+    GET /api/auth/me/
+    """
+    async def build():
+        await _attach_profile(request.user)
+        return user_representation(request.user, request)
+
+    with replica_reads():
+        data = await acached_response(request.user, 'me', build)
+    return _render(data, status.HTTP_200_OK)
+
+
+@async_api_view(['GET'])
+async def async_dashboard_stats_view(request):
+    """
+    用户仪表板统计信息（异步版本）
+    GET /api/auth/dashboard/
+    """
+    user = request.user
+
+    async def build():
+        stats = {
+            'user_info': {
+                'username': user.username,
+                'email': user.email,
+                'date_joined': user.date_joined,
+                'last_login': user.last_login,
+                'is_active': user.is_active,
+            },
+            'login_stats': await aget_login_stats(user),
+        }
+        profile = await _attach_profile(user)
+        stats['profile'] = profile_representation(profile) if profile is not None else None
+        return stats
+
+    with replica_reads():
+        data = await acached_response(user, 'dashboard', build)
+    return _render(data, status.HTTP_200_OK)
+
+
+@async_api_view(['GET'])
+async def async_login_record_list_view(request):
+    """
+    用户登录记录列表（异步版本）
+    GET /api/auth/login-records/
+    GET /api/auth/login-records/?paginate=cursor - 键集分页
+    """
+    try:
+        days = int(request.query_params.get('days', 30))
+    except (ValueError, TypeError):
+        days = 30
+    queryset = login_record_values(LoginRecord.objects.for_user(request.user).since(
+        timezone.now() - timedelta(days=days)
+    ).recent_first())
+
+    paginator = LoginRecordPagination()
+    with replica_reads():
+        page = await paginator.apaginate_queryset(queryset, request)
+        if page is None:
+            records = [record async for record in queryset]
+            return _render(login_record_rows(records), status.HTTP_200_OK)
+    data = login_record_rows(page)
+    return _render(paginator.get_paginated_response(data).data, status.HTTP_200_OK)
+
+
+@async_api_view(['POST'], authenticated=False)
+async def async_refresh_token_view(request):
+    """
+    刷新 token（异步版本）
+    POST /api/auth/refresh/
+    """
+    try:
+        refresh_token = request.data.get('refresh')
+        if not refresh_token:
+            return _render({'error': '需要提供refresh token'}, status.HTTP_400_BAD_REQUEST)
+
+        refresh = RefreshToken(refresh_token)
+        if await ais_blacklisted(refresh):
+            return _render({'error': 'Token已失效'}, status.HTTP_401_UNAUTHORIZED)
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                await ablacklist_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return _render(data, status.HTTP_200_OK)
+
+    except Exception:
+        return _render({'error': 'Token无效或已过期'}, status.HTTP_401_UNAUTHORIZED)
+
+
+@async_api_view(['POST'])
+async def async_logout_view(request):
+    """
+    用户注销（异步版本）
+    POST /api/auth/logout/
+    """
+    try:
+        refresh_token = request.data.get('refresh')
+        if refresh_token:
+            await ablacklist_token(RefreshToken(refresh_token))
+        logger.info("用户注销: %s", request.user.username)
+        return _render({'message': '注销成功'}, status.HTTP_200_OK)
+    except Exception as e:
+        logger.error("用户注销失败: %s", e)
+        return _render({'message': '注销失败', 'error': str(e)}, status.HTTP_400_BAD_REQUEST)
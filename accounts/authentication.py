@@ -0,0 +1,279 @@
+"""
+JWT 认证
+
+CachedJWTAuthentication 在校验签名之后，先从进程内 LRU（以及可选的共享缓存）
+读取用户，命中时不再查询 auth_user。缓存里保存的是字段值而不是 User 实例（不含密码哈希），
+每个请求拿到的都是新构造的对象，视图修改 request.user 不会污染缓存。
+用户保存或删除时由信号清除缓存（停用账户、修改密码都会触发），
+其它进程中的本地缓存最多在 LOCAL_TTL 秒后过期。
+"""
+
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import LRUCache
+from .db import get_primary
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'LOCAL_TTL': 5,
+    'MAX_ENTRIES': 10000,
+    # CACHES 中的别名，例如指向 Redis 的缓存；None 表示只用进程内缓存
+    'SHARED_CACHE': None,
+    'SHARED_TTL': 60,
+    'KEY_PREFIX': 'accounts:jwt-user',
+}
+
+
+class UserCache:
+    """
+    按用户ID缓存 User 字段值的两级缓存
+
+    缓存中不保存密码哈希，只保存 check_user 校验 token 用的摘要（get_md5_hash_password），
+    取出的用户对象 password 为延迟字段，确实用到时才查询数据库。
+
+    失效与并发填充：未命中的请求先取 generation()，再查数据库，最后 set(user, generation)。
+    invalidate() 递增代数（本地为进程内计数，共享缓存为每个用户一个计数键），
+    这样在失效之前读到的旧数据即使在失效之后才写入，也会因为代数不符被丢弃或视为未命中。
+    共享缓存的计数键不设过期时间，每个修改过的用户占用一个整数。
+    """
+
+    def __init__(self, local_ttl=5, max_entries=10000, shared_cache=None, shared_ttl=60,
+                 key_prefix='accounts:jwt-user'):
+        self.local = LRUCache(max_entries=max_entries, ttl=local_ttl)
+        self.shared = caches[shared_cache] if shared_cache else None
+        self.shared_ttl = shared_ttl
+        self.key_prefix = key_prefix
+        self.model = get_user_model()
+        self.field_names = [
+            f.attname for f in self.model._meta.concrete_fields if f.attname != 'password'
+        ]
+        # 本进程内的失效计数，和本地缓存的写入在同一把锁下进行
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def _key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def _generation_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}:gen'
+
+    def _set_local(self, key, values, epoch):
+        with self._lock:
+            if epoch == self._epoch:
+                self.local.set(key, values)
+
+    def generation(self, user_id):
+        """查询数据库之前调用，返回值原样传给 set()"""
+        shared_generation = 0
+        if self.shared is not None:
+            try:
+                shared_generation = self.shared.get(self._generation_key(user_id), 0)
+            except Exception as e:
+                logger.warning("读取共享用户缓存失败: %s", e)
+                shared_generation = None
+        return self._epoch, shared_generation
+
+    def get(self, user_id):
+        """返回新构造的用户对象，未命中时返回 None"""
+        key = self._key(user_id)
+        values = self.local.get(key)
+        if values is None and self.shared is not None:
+            epoch = self._epoch
+            generation_key = self._generation_key(user_id)
+            try:
+                found = self.shared.get_many([key, generation_key])
+            except Exception as e:
+                logger.warning("读取共享用户缓存失败: %s", e)
+                found = {}
+            entry = found.get(key)
+            if entry is not None and entry[0] == found.get(generation_key, 0):
+                values = entry[1:]
+                self._set_local(key, values, epoch)
+        record_cache('user', values is not None)
+        if values is None:
+            return None
+        digest, *values = values
+        user = self.model.from_db(get_primary(), self.field_names, values)
+        user._password_digest = digest
+        return user
+
+    async def aget(self, user_id):
+        """异步视图使用：本地缓存直接读取，共享缓存（访问网络）放到线程池"""
+        if self.shared is None:
+            return self.get(user_id)
+        return await sync_to_async(self.get, thread_sensitive=False)(user_id)
+
+    async def ageneration(self, user_id):
+        if self.shared is None:
+            return self.generation(user_id)
+        return await sync_to_async(self.generation, thread_sensitive=False)(user_id)
+
+    async def aset(self, user, generation):
+        if self.shared is None:
+            self.set(user, generation)
+        else:
+            await sync_to_async(self.set, thread_sensitive=False)(user, generation)
+
+    def set(self, user, generation):
+        """写入 generation() 之后从数据库读到的用户；期间发生过失效时不写入本地缓存"""
+        key = self._key(user.pk)
+        epoch, shared_generation = generation
+        values = (password_digest(user), *(getattr(user, name) for name in self.field_names))
+        self._set_local(key, values, epoch)
+        if self.shared is not None and shared_generation is not None:
+            try:
+                self.shared.set(key, (shared_generation, *values), self.shared_ttl)
+            except Exception as e:
+                logger.warning("写入共享用户缓存失败: %s", e)
+
+    def invalidate(self, user_id):
+        key = self._key(user_id)
+        with self._lock:
+            self._epoch += 1
+            self.local.delete(key)
+        if self.shared is not None:
+            generation_key = self._generation_key(user_id)
+            try:
+                try:
+                    self.shared.incr(generation_key)
+                except ValueError:
+                    if not self.shared.add(generation_key, 1, None):
+                        self.shared.incr(generation_key)
+                self.shared.delete(key)
+            except Exception as e:
+                logger.warning("删除共享用户缓存失败: %s", e)
+
+
+def password_digest(user):
+    """token 中记录的密码摘要；缓存取出的用户直接使用缓存中的摘要"""
+    digest = getattr(user, '_password_digest', None)
+    if digest is None:
+        digest = get_md5_hash_password(user.password)
+    return digest
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """根据 JWT_USER_CACHE 配置返回进程内共享的用户缓存；未启用时返回 None"""
+    global _user_cache
+    conf = {**DEFAULTS, **getattr(settings, 'JWT_USER_CACHE', {})}
+    if not conf['ENABLED']:
+        return None
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = UserCache(
+                    local_ttl=conf['LOCAL_TTL'],
+                    max_entries=conf['MAX_ENTRIES'],
+                    shared_cache=conf['SHARED_CACHE'],
+                    shared_ttl=conf['SHARED_TTL'],
+                    key_prefix=conf['KEY_PREFIX'],
+                )
+    return _user_cache
+
+
+def invalidate_cached_user(user_id):
+    """清除某个用户的认证缓存（立即一次，事务提交后再一次）"""
+    cache = get_user_cache()
+    if cache is not None and user_id is not None:
+        cache.invalidate(user_id)
+        transaction.on_commit(lambda: cache.invalidate(user_id))
+
+
+@receiver(setting_changed)
+def reset_user_cache(setting, **kwargs):
+    """测试中修改配置时重新创建缓存实例"""
+    global _user_cache
+    if setting == 'JWT_USER_CACHE':
+        _user_cache = None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    校验 JWT 签名后从缓存解析用户的认证类
+    """
+
+    def get_user(self, validated_token):
+        cache = get_user_cache()
+        if cache is None:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = cache.get(user_id)
+        if user is None:
+            generation = cache.generation(user_id)
+            user = super().get_user(validated_token)
+            cache.set(user, generation)
+            return user
+        return self.check_user(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate 的异步版本，供不经过 DRF 的异步视图使用
+
+        解析和校验签名是纯计算（HMAC），直接在事件循环中执行；
+        缓存未命中时用异步 ORM 查询用户。
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = get_user_cache()
+        user = await cache.aget(user_id) if cache is not None else None
+        if user is None:
+            generation = await cache.ageneration(user_id) if cache is not None else None
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            user = self.check_user(user, validated_token)
+            if cache is not None:
+                await cache.aset(user, generation)
+            return user
+        return self.check_user(user, validated_token)
+
+    def check_user(self, user, validated_token):
+        """与父类 get_user 相同的检查"""
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_digest(user):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code='password_changed'
+                )
+        return user
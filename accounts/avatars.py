@@ -0,0 +1,285 @@
+"""
+头像处理
+
+上传：
+    - validate_avatar 用 Pillow 读取文件头校验真实格式（JPEG/PNG/GIF/WebP）、文件大小
+      和像素尺寸，不解码整张图片，超大尺寸的“像素炸弹”在解码前就被拒绝
+    - 超过 FILE_UPLOAD_MAX_MEMORY_SIZE 的上传由 Django 按块写入临时文件，保存时
+      storage.save 再按块写入存储，整个过程不会把文件整体读入内存
+处理（后台线程，或 process_avatars 命令补处理）：
+    - 按 EXIF 方向旋转后居中裁剪成正方形，生成 AVATAR_SIZES 中每种尺寸的
+      AVATAR_FORMATS 格式缩略图；新生成的图片不带 EXIF 等元数据
+    - avatar 字段改为指向最大尺寸的缩略图，删除原始上传文件和上一版缩略图
+    - 处理失败时删除原始上传文件并清空 avatar 字段
+处理期间用户再次上传时，旧任务的结果会被丢弃（按 avatar 文件名做条件更新）。
+原始上传文件可能带 EXIF/GPS 等元数据，处理完成（状态为 ready）之前接口不输出 avatar 地址（见 avatar_url）。
+"""
+
+import logging
+import queue
+import threading
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import invalidate_user
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+DEFAULT_SIZES = {'small': 64, 'medium': 128, 'large': 256}
+DEFAULT_FORMATS = ('webp', 'jpeg')
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+def get_avatar_sizes():
+    return getattr(settings, 'AVATAR_SIZES', DEFAULT_SIZES)
+
+
+def get_avatar_formats():
+    return getattr(settings, 'AVATAR_FORMATS', DEFAULT_FORMATS)
+
+
+def validate_avatar(file):
+    """
+    校验上传的头像，返回 Pillow 识别出的格式名
+
+    只读取文件头（Image.open 是惰性的），verify() 检查文件结构完整性。
+    """
+    max_size = getattr(settings, 'AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+    max_pixels = getattr(settings, 'AVATAR_MAX_PIXELS', 4096 * 4096)
+    if file.size > max_size:
+        raise ValidationError(f'头像文件不能超过 {max_size // 1024 // 1024}MB')
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+            if image_format not in ALLOWED_FORMATS:
+                raise ValidationError('头像只支持 JPEG、PNG、GIF、WebP 格式')
+            if width * height > max_pixels:
+                raise ValidationError('头像尺寸过大')
+            if min(width, height) < 16:
+                raise ValidationError('头像尺寸过小')
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValidationError('上传的文件不是有效的图片')
+    finally:
+        file.seek(0)
+    return image_format
+
+
+def render_variants(source, sizes, formats):
+    """
+    生成缩略图，返回 {名称: {格式: 图片字节}}
+
+    JPEG 用 draft() 在解码时直接按 2 的幂缩小，大图的解码开销和内存占用成倍下降。
+    """
+    with Image.open(source) as image:
+        largest = max(sizes.values())
+        if image.format == 'JPEG':
+            image.draft('RGB', (largest * 2, largest * 2))
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        side = min(image.size)
+        left, top = (image.width - side) // 2, (image.height - side) // 2
+        square = image.crop((left, top, left + side, top + side))
+
+    variants = {}
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        resized = square.resize((size, size), Image.LANCZOS, reducing_gap=3.0) if side != size else square
+        variants[name] = {}
+        for fmt in formats:
+            output = resized
+            if fmt == 'jpeg' and resized.mode == 'RGBA':
+                # JPEG 没有透明通道，铺白色背景
+                flattened = Image.new('RGB', resized.size, (255, 255, 255))
+                flattened.paste(resized, mask=resized.getchannel('A'))
+                output = flattened
+            buffer = BytesIO()
+            # 新建的图片对象不带 info 中的 EXIF/ICC 等元数据，保存时也不传 exif 参数
+            output.save(buffer, **SAVE_OPTIONS[fmt])
+            variants[name][fmt] = buffer.getvalue()
+    return variants
+
+
+def _variant_names(variants):
+    return [path for formats in variants.values() for path in formats.values()]
+
+
+def process_avatar(profile_id):
+    """
+    处理某个用户资料当前的头像，返回是否生成了缩略图
+
+    源文件就是 avatar 字段；已处理过（avatar 指向缩略图）或没有头像时直接返回。
+    """
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.avatar or profile.avatar_status != UserProfile.AVATAR_PENDING:
+        return False
+    source_name = profile.avatar.name
+    storage = profile.avatar.storage
+    sizes, formats = get_avatar_sizes(), get_avatar_formats()
+
+    try:
+        with storage.open(source_name, 'rb') as source:
+            rendered = render_variants(source, sizes, formats)
+    except Exception as e:
+        logger.warning("头像处理失败: 用户资料 %s - %s", profile_id, e)
+        updated = UserProfile.objects.filter(pk=profile_id, avatar=source_name).update(
+            avatar='', avatar_status=UserProfile.AVATAR_FAILED
+        )
+        if updated:
+            _delete_files(storage, [source_name])
+        invalidate_user(profile.user_id)
+        return False
+
+    token = uuid.uuid4().hex[:12]
+    variants = {}
+    for name, by_format in rendered.items():
+        variants[name] = {}
+        for fmt, content in by_format.items():
+            path = f'avatars/{profile.user_id}/{token}-{sizes[name]}.{"jpg" if fmt == "jpeg" else fmt}'
+            variants[name][fmt] = storage.save(path, ContentFile(content))
+
+    largest = max(sizes, key=sizes.get)
+    with transaction.atomic():
+        updated = UserProfile.objects.filter(pk=profile_id, avatar=source_name).update(
+            avatar=variants[largest][formats[0]],
+            avatar_variants=variants,
+            avatar_status=UserProfile.AVATAR_READY,
+        )
+    if not updated:
+        # 处理期间用户又上传了新头像，丢弃本次结果
+        _delete_files(storage, _variant_names(variants))
+        return False
+
+    _delete_files(storage, [source_name, *_variant_names(profile.avatar_variants)])
+    invalidate_user(profile.user_id)
+    return True
+
+
+def _delete_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.warning("删除头像文件失败: %s - %s", name, e)
+
+
+def clear_avatar(profile):
+    """删除头像时清掉缩略图记录，文件在事务提交后删除"""
+    storage = profile.avatar.storage
+    names = _variant_names(profile.avatar_variants)
+    profile.avatar_variants = {}
+    profile.avatar_status = ''
+    if names:
+        transaction.on_commit(lambda: _delete_files(storage, names))
+
+
+def avatar_url(profile, request=None):
+    """avatar 的地址（有请求对象时为绝对地址）；未处理完成时原始文件不对外，返回 None"""
+    if not profile.avatar or profile.avatar_status != UserProfile.AVATAR_READY:
+        return None
+    url = profile.avatar.url
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def variant_urls(profile, request=None):
+    """
+    返回 {名称: {格式: URL}}；有请求对象时返回绝对地址（与 ImageField 一致）
+
+    新头像处理完成之前返回上一版缩略图。
+    """
+    if not profile.avatar_variants:
+        return {}
+    storage = profile.avatar.storage
+    urls = {}
+    for name, by_format in profile.avatar_variants.items():
+        urls[name] = {}
+        for fmt, path in by_format.items():
+            url = storage.url(path)
+            urls[name][fmt] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+class AvatarProcessor:
+    """
+    后台头像处理线程池
+
+    任务只包含用户资料 id，进程退出时未处理的任务仍是 pending 状态，
+    由 process_avatars 命令补处理。
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, profile_id):
+        self._queue.put(profile_id)
+        self._ensure_threads()
+
+    def join(self):
+        """等待队列中的任务全部处理完（测试和命令使用）"""
+        self._queue.join()
+
+    def _ensure_threads(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run, name=f'avatar-processor-{len(self._threads)}', daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def _run(self):
+        while True:
+            profile_id = self._queue.get()
+            try:
+                close_old_connections()
+                process_avatar(profile_id)
+            except Exception as e:
+                logger.error("头像处理任务失败: %s - %s", profile_id, e)
+            finally:
+                self._queue.task_done()
+                close_old_connections()
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_processor():
+    """获取进程内共享的头像处理线程池"""
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = AvatarProcessor(getattr(settings, 'AVATAR_WORKERS', 1))
+    return _processor
+
+
+def schedule_avatar(profile):
+    """
+    在事务提交后处理头像
+
+    AVATAR_PROCESSING_ASYNC 为 False 时在当前线程内处理（测试、命令行）。
+    """
+    profile_id = profile.pk
+    if getattr(settings, 'AVATAR_PROCESSING_ASYNC', True):
+        transaction.on_commit(lambda: get_processor().submit(profile_id))
+    else:
+        transaction.on_commit(lambda: process_avatar(profile_id))
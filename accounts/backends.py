@@ -0,0 +1,58 @@
+"""
+认证后端
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+def identifier_queryset(identifier):
+    """
+    用一条查询找出用户名等于 identifier 或邮箱（忽略大小写）等于 identifier 的用户
+
+    用户名走唯一索引，邮箱走 LOWER(email) 函数索引（见迁移 0005）。
+    """
+    return UserModel._default_manager.alias(
+        email_lower=Lower('email')
+    ).filter(
+        Q(username=identifier) | Q(email_lower=identifier.lower())
+    ).order_by('pk')[:3]
+
+
+def pick_user(candidates, identifier):
+    """用户名精确匹配优先，其次是按主键最小的邮箱匹配"""
+    for user in candidates:
+        if user.username == identifier:
+            return user
+    return candidates[0] if candidates else None
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    用户名或邮箱登录的认证后端
+
+    一次索引查询解析标识，密码最多校验一次；用户不存在时对假密码做一次哈希，
+    保持与存在用户相同的耗时。解析到的用户（不论密码是否正确）保存在
+    request.login_candidate 上，登录失败时用来把失败记录关联到该用户，不必再查一次。
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        user = pick_user(list(identifier_queryset(username)), username)
+        if request is not None:
+            request.login_candidate = user
+        if user is None:
+            # 与 ModelBackend 一致，运行一次默认哈希器抵御计时攻击
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,367 @@
+"""
+Refresh token 黑名单
+
+由两部分组成：
+    - 过滤器（FILTER）：按 token 过期时间分桶的布隆过滤器。查询时只看 token
+      exp 所在的桶，判断“肯定不在黑名单”是 O(1) 的；桶在其时间段结束后整体丢弃，
+      内存占用与历史上拉黑过多少 token 无关。
+        local: 进程内位数组，按主键增量同步数据库中的新增记录。只有同步是最新的时候
+               （距上次同步不超过 SYNC_INTERVAL 秒）才相信“不在过滤器中”，否则先同步或直接查存储，
+               其它进程的拉黑最多延迟 SYNC_INTERVAL 秒才生效。SYNC_INTERVAL 为 0（默认）时
+               每次查询前都要同步一次，比直接按 jti 查存储还多一条查询，此时不启用过滤器
+        redis: Redis 位图，所有进程共享，键随桶一起过期
+    - 存储（STORE）：精确判断，只在过滤器命中时查询。
+        db:    jwt_blacklist 表，过期记录由 purge_token_blacklist 命令按批清理（用 cron 等定期运行）
+        redis: 每个 JTI 一个带 EXPIREAT 的键，由 Redis 自动清理
+过滤器和存储都提供 a 开头的异步方法：数据库存储使用异步 ORM，Redis 调用放到线程池，
+进程内过滤器直接在事件循环中计算。
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'STORE': 'db',
+    'FILTER': 'local',
+    'REDIS_URL': 'redis://127.0.0.1:6379/2',
+    'KEY_PREFIX': 'accounts:blacklist',
+    'BUCKET_SECONDS': 3600,
+    'BITS_PER_BUCKET': 1 << 20,
+    'HASHES': 7,
+    'SYNC_INTERVAL': 0,
+    'PURGE_BATCH_SIZE': 1000,
+}
+
+
+# 同步本地过滤器时回看的主键数：PostgreSQL 等数据库在插入时分配主键、提交较晚，
+# 较小的主键可能在较大的主键之后才可见
+SYNC_ID_OVERLAP = 100
+
+
+def _positions(jti, bits, hashes):
+    """双重哈希得到 k 个位位置"""
+    digest = hashlib.blake2b(jti.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class LocalBloomFilter:
+    """进程内按过期时间分桶的布隆过滤器"""
+
+    def __init__(self, bucket_seconds=3600, bits=1 << 20, hashes=7):
+        self.bucket_seconds = bucket_seconds
+        self.bits = bits
+        self.hashes = hashes
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, exp):
+        return int(exp) // self.bucket_seconds
+
+    def _drop_expired(self):
+        current = self._bucket(time.time())
+        for bucket in [b for b in self._buckets if b < current]:
+            del self._buckets[bucket]
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._drop_expired()
+            array = self._buckets.get(self._bucket(exp))
+            if array is None:
+                array = self._buckets[self._bucket(exp)] = bytearray(self.bits // 8)
+            for pos in _positions(jti, self.bits, self.hashes):
+                array[pos >> 3] |= 1 << (pos & 7)
+
+    def might_contain(self, jti, exp):
+        with self._lock:
+            array = self._buckets.get(self._bucket(exp))
+            if array is None:
+                return False
+            return all(array[pos >> 3] & (1 << (pos & 7)) for pos in _positions(jti, self.bits, self.hashes))
+
+    async def aadd(self, jti, exp):
+        self.add(jti, exp)
+
+    async def amight_contain(self, jti, exp):
+        return self.might_contain(jti, exp)
+
+    def memory_bytes(self):
+        return len(self._buckets) * (self.bits // 8)
+
+
+class RedisBloomFilter:
+    """Redis 位图实现的分桶布隆过滤器，所有进程共享"""
+
+    def __init__(self, client, key_prefix, bucket_seconds=3600, bits=1 << 20, hashes=7):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.bucket_seconds = bucket_seconds
+        self.bits = bits
+        self.hashes = hashes
+
+    def _key(self, exp):
+        return f'{self.key_prefix}:bloom:{int(exp) // self.bucket_seconds}'
+
+    def add(self, jti, exp):
+        key = self._key(exp)
+        pipe = self.client.pipeline(transaction=False)
+        for pos in _positions(jti, self.bits, self.hashes):
+            pipe.setbit(key, pos, 1)
+        # 桶在其时间段结束后整体过期
+        pipe.expireat(key, (int(exp) // self.bucket_seconds + 1) * self.bucket_seconds)
+        pipe.execute()
+
+    def might_contain(self, jti, exp):
+        pipe = self.client.pipeline(transaction=False)
+        for pos in _positions(jti, self.bits, self.hashes):
+            pipe.getbit(self._key(exp), pos)
+        return all(pipe.execute())
+
+    async def aadd(self, jti, exp):
+        await sync_to_async(self.add, thread_sensitive=False)(jti, exp)
+
+    async def amight_contain(self, jti, exp):
+        return await sync_to_async(self.might_contain, thread_sensitive=False)(jti, exp)
+
+
+class DatabaseBlacklistStore:
+    """jwt_blacklist 表存储"""
+
+    def __init__(self, purge_batch_size=1000):
+        self.purge_batch_size = purge_batch_size
+
+    def add(self, jti, exp):
+        expires_at = datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+        BlacklistedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+
+    def contains(self, jti):
+        return BlacklistedToken.objects.filter(jti=jti).exists()
+
+    async def aadd(self, jti, exp):
+        expires_at = datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+        await BlacklistedToken.objects.aget_or_create(jti=jti, defaults={'expires_at': expires_at})
+
+    async def acontains(self, jti):
+        return await BlacklistedToken.objects.filter(jti=jti).aexists()
+
+    def purge_expired(self):
+        """按批删除已过期的记录，避免长时间锁表，返回删除条数"""
+        now = timezone.now()
+        deleted = 0
+        while True:
+            ids = list(
+                BlacklistedToken.objects.filter(expires_at__lt=now)
+                .values_list('id', flat=True)[:self.purge_batch_size]
+            )
+            if not ids:
+                return deleted
+            deleted += BlacklistedToken.objects.filter(id__in=ids).delete()[0]
+
+    def entries_after(self, last_id):
+        """主键大于 last_id 的未过期记录，用于同步进程内过滤器"""
+        entries = BlacklistedToken.objects.filter(expires_at__gte=timezone.now())
+        if last_id is not None:
+            entries = entries.filter(id__gt=last_id)
+        return entries.order_by('id').values_list('id', 'jti', 'expires_at')
+
+
+class RedisBlacklistStore:
+    """每个 JTI 一个键，EXPIREAT 为 token 的过期时间"""
+
+    def __init__(self, client, key_prefix):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def add(self, jti, exp):
+        key = f'{self.key_prefix}:jti:{jti}'
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, 1)
+        pipe.expireat(key, int(exp))
+        pipe.execute()
+
+    def contains(self, jti):
+        return bool(self.client.exists(f'{self.key_prefix}:jti:{jti}'))
+
+    async def aadd(self, jti, exp):
+        await sync_to_async(self.add, thread_sensitive=False)(jti, exp)
+
+    async def acontains(self, jti):
+        return await sync_to_async(self.contains, thread_sensitive=False)(jti)
+
+    def purge_expired(self):
+        # 键到期由 Redis 自动删除
+        return 0
+
+
+class TokenBlacklist:
+    """过滤器 + 存储组合的黑名单"""
+
+    def __init__(self, store, bloom=None, sync_interval=None):
+        self.store = store
+        self.bloom = bloom
+        # 只有“本地过滤器 + 数据库存储”需要从数据库同步其它进程拉黑的 JTI
+        self.sync_interval = sync_interval
+        self._synced_id = None
+        self._last_sync = None
+        self._sync_lock = threading.Lock()
+
+    def add(self, jti, exp):
+        self.store.add(jti, exp)
+        if self.bloom is not None:
+            self.bloom.add(jti, exp)
+
+    def contains(self, jti, exp):
+        if exp <= time.time():
+            # 已过期的 token 本身就无效，不需要查黑名单
+            return False
+        if self.bloom is None:
+            return self.store.contains(jti)
+        if self._sync() and not self.bloom.might_contain(jti, exp):
+            return False
+        return self.store.contains(jti)
+
+    async def aadd(self, jti, exp):
+        await self.store.aadd(jti, exp)
+        if self.bloom is not None:
+            await self.bloom.aadd(jti, exp)
+
+    async def acontains(self, jti, exp):
+        if exp <= time.time():
+            return False
+        if self.bloom is None:
+            return await self.store.acontains(jti)
+        current = await sync_to_async(self._sync)() if self._sync_due() else True
+        if current and not await self.bloom.amight_contain(jti, exp):
+            return False
+        return await self.store.acontains(jti)
+
+    def _sync_due(self):
+        if self.sync_interval is None:
+            return False
+        return self._last_sync is None or time.monotonic() - self._last_sync >= self.sync_interval
+
+    def _sync(self):
+        """
+        按需增量同步，返回过滤器现在能否用来做否定判断
+
+        其它线程正在同步或同步失败时返回 False，调用方直接查存储。
+        """
+        if not self._sync_due():
+            return True
+        if not self._sync_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self._sync_due():
+                return True
+            now = time.monotonic()
+            # 回看少量主键，覆盖同步时尚未提交的事务；重复加入布隆过滤器没有影响
+            last_id = self._synced_id - SYNC_ID_OVERLAP if self._synced_id else None
+            try:
+                for pk, jti, expires_at in self.store.entries_after(last_id):
+                    self.bloom.add(jti, expires_at.timestamp())
+                    self._synced_id = max(self._synced_id or 0, pk)
+            except DatabaseError as e:
+                logger.warning("同步 token 黑名单过滤器失败: %s", e)
+                return False
+            self._last_sync = now
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def purge_expired(self):
+        return self.store.purge_expired()
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def build_blacklist(conf):
+    """根据配置构造黑名单"""
+    client = None
+    if conf['STORE'] == 'redis' or conf['FILTER'] == 'redis':
+        import redis
+        client = redis.Redis.from_url(conf['REDIS_URL'])
+
+    if conf['STORE'] == 'redis':
+        store = RedisBlacklistStore(client, conf['KEY_PREFIX'])
+    elif conf['STORE'] == 'db':
+        store = DatabaseBlacklistStore(conf['PURGE_BATCH_SIZE'])
+    else:
+        raise ValueError(f"未知的黑名单存储: {conf['STORE']}")
+
+    bloom_options = {
+        'bucket_seconds': conf['BUCKET_SECONDS'],
+        'bits': conf['BITS_PER_BUCKET'],
+        'hashes': conf['HASHES'],
+    }
+    sync_interval = None
+    if conf['FILTER'] == 'redis':
+        bloom = RedisBloomFilter(client, conf['KEY_PREFIX'], **bloom_options)
+    elif conf['FILTER'] == 'local':
+        bloom = LocalBloomFilter(**bloom_options)
+        if conf['STORE'] == 'db':
+            sync_interval = conf['SYNC_INTERVAL']
+            if not sync_interval:
+                # 每次查询前都要同步，过滤器省不下任何查询，直接按 jti 查表
+                bloom = None
+        else:
+            # 本地过滤器看不到其它进程写入 Redis 的 JTI，不能用它做否定判断
+            logger.warning("TOKEN_BLACKLIST: redis 存储不支持 local 过滤器，已关闭过滤器")
+            bloom = None
+    else:
+        bloom = None
+    return TokenBlacklist(store, bloom, sync_interval)
+
+
+def get_blacklist():
+    """获取进程内共享的黑名单实例"""
+    global _blacklist
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                _blacklist = build_blacklist({**DEFAULTS, **getattr(settings, 'TOKEN_BLACKLIST', {})})
+    return _blacklist
+
+
+def blacklist_token(token):
+    """拉黑一个 refresh token"""
+    get_blacklist().add(token['jti'], token['exp'])
+
+
+def is_blacklisted(token):
+    """判断 refresh token 是否已被拉黑"""
+    return get_blacklist().contains(token['jti'], token['exp'])
+
+
+async def ablacklist_token(token):
+    """blacklist_token 的异步版本"""
+    await get_blacklist().aadd(token['jti'], token['exp'])
+
+
+async def ais_blacklisted(token):
+    """is_blacklisted 的异步版本"""
+    return await get_blacklist().acontains(token['jti'], token['exp'])
+
+
+@receiver(setting_changed)
+def reset_blacklist(setting, **kwargs):
+    """测试中修改配置时重新创建黑名单实例"""
+    global _blacklist
+    if setting == 'TOKEN_BLACKLIST':
+        _blacklist = None
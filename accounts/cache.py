@@ -0,0 +1,411 @@
+"""
+按用户缓存的接口响应
+
+/me/、/profile/ 和 /dashboard/ 的响应数据按用户缓存，用户、用户资料或
+登录统计变化时由信号失效。后端可插拔：
+    - locmem: 进程内 LRU + TTL（开发和测试）
+    - redis:  共享缓存，TTL 由 SETEX 控制，淘汰依赖 Redis 的 maxmemory-policy（建议 allkeys-lru）
+也可以在 BACKEND 中填写自定义后端类的导入路径。
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .db import primary_reads
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# 会被缓存的响应名称，失效时一并删除
+CACHED_VIEWS = ('me', 'profile', 'dashboard')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BACKEND': 'locmem',
+    'LOCATION': 'redis://127.0.0.1:6379/1',
+    'TTL': 60,
+    'MAX_ENTRIES': 10000,
+    'KEY_PREFIX': 'accounts:resp',
+}
+
+
+class BaseResponseCache:
+    """
+    响应缓存后端基类
+
+    子类实现 _get/_set/_delete 以及 _incr/_counters；值以 JSON 文本存储，
+    读出来的数据与 JSONRenderer 渲染结果一致，也避免调用方修改缓存中的对象。
+    blocking 为 True 的后端（访问网络）在异步视图中通过线程池调用。
+
+    未命中时先用 _generation 取该用户的代数，再 build()，最后 _set_if_current 只在代数
+    没有变化时写入：build 期间发生的 invalidate 会递增代数，build 读到的旧数据不会写回缓存。
+    基类的默认实现不做这项检查，自定义后端应覆盖 _generation/_set_if_current/_invalidate。
+    """
+    blocking = True
+
+    def __init__(self, ttl=60, key_prefix='accounts:resp', **options):
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def make_key(self, user_id, name):
+        return f'{self.key_prefix}:{user_id}:{name}'
+
+    def get_or_set(self, user_id, name, build):
+        """命中时返回缓存数据，否则调用 build() 生成并写入缓存"""
+        key = self.make_key(user_id, name)
+        try:
+            cached = self._get(key)
+        except Exception as e:
+            logger.warning("读取响应缓存失败: %s", e)
+            return build()
+        record_cache('response', cached is not None)
+        if cached is not None:
+            self._incr('hits')
+            return json.loads(cached)
+
+        self._incr('misses')
+        try:
+            generation = self._generation(user_id)
+        except Exception as e:
+            logger.warning("读取响应缓存失败: %s", e)
+            return build()
+        data = build()
+        try:
+            self._set_if_current(user_id, generation, key, json.dumps(data, cls=JSONEncoder, ensure_ascii=False))
+        except Exception as e:
+            logger.warning("写入响应缓存失败: %s", e)
+        return data
+
+    async def aget_or_set(self, user_id, name, build):
+        """get_or_set 的异步版本，build 为返回协程的函数"""
+        key = self.make_key(user_id, name)
+        try:
+            cached = await self._acall(self._get, key)
+        except Exception as e:
+            logger.warning("读取响应缓存失败: %s", e)
+            return await build()
+        record_cache('response', cached is not None)
+        if cached is not None:
+            await self._acall(self._incr, 'hits')
+            return json.loads(cached)
+
+        await self._acall(self._incr, 'misses')
+        try:
+            generation = await self._acall(self._generation, user_id)
+        except Exception as e:
+            logger.warning("读取响应缓存失败: %s", e)
+            return await build()
+        data = await build()
+        try:
+            await self._acall(
+                self._set_if_current, user_id, generation, key,
+                json.dumps(data, cls=JSONEncoder, ensure_ascii=False),
+            )
+        except Exception as e:
+            logger.warning("写入响应缓存失败: %s", e)
+        return data
+
+    async def _acall(self, func, *args):
+        if self.blocking:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return func(*args)
+
+    def invalidate(self, user_id):
+        """删除某个用户的全部缓存响应"""
+        try:
+            self._invalidate(user_id, [self.make_key(user_id, name) for name in CACHED_VIEWS])
+        except Exception as e:
+            logger.warning("删除响应缓存失败: %s", e)
+
+    def stats(self):
+        """命中/未命中计数和命中率"""
+        counters = self._counters()
+        hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+        total = hits + misses
+        counters['hit_rate'] = round(hits / total, 4) if total else 0.0
+        return counters
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def _delete(self, keys):
+        raise NotImplementedError
+
+    def _generation(self, user_id):
+        return None
+
+    def _set_if_current(self, user_id, generation, key, value):
+        self._set(key, value)
+
+    def _invalidate(self, user_id, keys):
+        self._delete(keys)
+
+    def _incr(self, counter):
+        raise NotImplementedError
+
+    def _counters(self):
+        raise NotImplementedError
+
+
+class LRUCache:
+    """线程安全的进程内 LRU 缓存，条目带过期时间，超过 max_entries 时淘汰最久未使用的条目"""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def items(self):
+        """未过期条目的快照，不改变 LRU 顺序"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at >= now]
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.evictions = 0
+
+
+class LocMemResponseCache(BaseResponseCache):
+    """进程内 LRU 响应缓存"""
+    blocking = False
+
+    def __init__(self, max_entries=10000, **options):
+        super().__init__(**options)
+        self.max_entries = max_entries
+        self._lru = LRUCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+        # 进程内的失效计数（所有用户共用），和写入、删除在同一把锁下进行；
+        # build 期间任何用户失效都会放弃这次写入，只是少缓存一次
+        self._epoch = 0
+        self._write_lock = threading.Lock()
+
+    def clear(self):
+        self._lru.clear()
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0}
+
+    def _get(self, key):
+        return self._lru.get(key)
+
+    def _set(self, key, value):
+        self._lru.set(key, value, self.ttl)
+
+    def _delete(self, keys):
+        self._lru.delete(*keys)
+
+    def _generation(self, user_id):
+        return self._epoch
+
+    def _set_if_current(self, user_id, generation, key, value):
+        with self._write_lock:
+            if generation == self._epoch:
+                self._lru.set(key, value, self.ttl)
+
+    def _invalidate(self, user_id, keys):
+        with self._write_lock:
+            self._epoch += 1
+            self._lru.delete(*keys)
+
+    def _incr(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _counters(self):
+        with self._lock:
+            counters = dict(self._stats)
+        counters['evictions'] = self._lru.evictions
+        counters['entries'] = len(self._lru)
+        counters['max_entries'] = self.max_entries
+        return counters
+
+
+class RedisResponseCache(BaseResponseCache):
+    """Redis 缓存，命中计数保存在 Redis 中，所有进程共享"""
+
+    def __init__(self, location='redis://127.0.0.1:6379/1', **options):
+        super().__init__(**options)
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.stats_key = f'{self.key_prefix}:stats'
+        self._watch_error = redis.WatchError
+
+    def _generation_key(self, user_id):
+        # 不在 key_prefix: 命名空间下，不计入条目数
+        return f'{self.key_prefix}-gen:{user_id}'
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{self.key_prefix}:*', count=1000))
+        if keys:
+            self.client.delete(*keys)
+
+    def _get(self, key):
+        value = self.client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def _set(self, key, value):
+        self.client.setex(key, self.ttl, value)
+
+    def _delete(self, keys):
+        self.client.delete(*keys)
+
+    def _generation(self, user_id):
+        return int(self.client.get(self._generation_key(user_id)) or 0)
+
+    def _set_if_current(self, user_id, generation, key, value):
+        """WATCH 代数键：检查之后、写入之前发生的失效会让 EXEC 失败"""
+        generation_key = self._generation_key(user_id)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(generation_key)
+                if int(pipe.get(generation_key) or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.setex(key, self.ttl, value)
+                pipe.execute()
+            except self._watch_error:
+                pass
+
+    def _invalidate(self, user_id, keys):
+        # 代数键只需要比正在进行的 build 活得久；过期后读作 0，只会多放弃一次写入
+        generation_key = self._generation_key(user_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incr(generation_key)
+        pipe.expire(generation_key, self.ttl)
+        pipe.delete(*keys)
+        pipe.execute()
+
+    def _incr(self, counter):
+        try:
+            self.client.hincrby(self.stats_key, counter, 1)
+        except Exception:
+            pass
+
+    def _counters(self):
+        counters = {k.decode(): int(v) for k, v in self.client.hgetall(self.stats_key).items()}
+        counters['entries'] = sum(1 for _ in self.client.scan_iter(match=f'{self.key_prefix}:*:*', count=1000))
+        return counters
+
+
+BACKENDS = {
+    'locmem': LocMemResponseCache,
+    'redis': RedisResponseCache,
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """根据 ACCOUNTS_RESPONSE_CACHE 配置返回进程内共享的缓存实例；未启用时返回 None"""
+    global _cache
+    conf = {**DEFAULTS, **getattr(settings, 'ACCOUNTS_RESPONSE_CACHE', {})}
+    if not conf['ENABLED']:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = conf['BACKEND']
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _cache = backend_class(
+                    ttl=conf['TTL'],
+                    key_prefix=conf['KEY_PREFIX'],
+                    max_entries=conf['MAX_ENTRIES'],
+                    location=conf['LOCATION'],
+                )
+    return _cache
+
+
+def cached_response(user, name, build):
+    """
+    读取或生成某个用户的缓存响应数据
+
+    写入缓存的数据只从主库生成（见 db.primary_reads），未启用缓存时 build() 按调用方的上下文读副本。
+    """
+    cache = get_response_cache()
+    if cache is None or not user.is_authenticated:
+        return build()
+    with primary_reads():
+        return cache.get_or_set(user.pk, name, build)
+
+
+async def acached_response(user, name, build):
+    """cached_response 的异步版本，build 为返回协程的函数"""
+    cache = get_response_cache()
+    if cache is None or not user.is_authenticated:
+        return await build()
+    with primary_reads():
+        return await cache.aget_or_set(user.pk, name, build)
+
+
+def invalidate_user(user_id):
+    """
+    失效某个用户的缓存响应
+
+    立即删除一次，事务提交后再删除一次，避免并发请求在提交前
+    把旧数据重新写回缓存。
+    """
+    cache = get_response_cache()
+    if cache is None or user_id is None:
+        return
+    cache.invalidate(user_id)
+    transaction.on_commit(lambda: cache.invalidate(user_id))
+
+
+@receiver(setting_changed)
+def reset_response_cache(setting, **kwargs):
+    """测试中修改缓存配置时重新创建缓存实例"""
+    global _cache
+    if setting == 'ACCOUNTS_RESPONSE_CACHE':
+        _cache = None
@@ -0,0 +1,124 @@
+"""
+客户端 IP 解析
+
+只有直连地址（REMOTE_ADDR）属于 TRUSTED_PROXIES 时才读取 X-Forwarded-For，
+并从右往左跳过可信代理，第一个不可信的地址就是客户端地址；左边更早的部分
+可以由客户端任意伪造，不会被采用。
+
+地址统一解析为整数（packed 字节的大端值）后比较：可信网段按前缀长度分组，
+每组是一个网络地址集合，判断一个地址是否可信只需对每种前缀长度做一次掩码和
+集合查找，开销与网段数量无关。输出的文本形式也是规范化的（去空白、去端口，
+IPv4 映射的 IPv6 地址转换为 IPv4），保证同一个客户端在登录记录中只有一种写法。
+
+REMOTE_ADDR 为空或无法解析（unix socket 上的代理、部分 ASGI 服务器）时解析结果为 None：
+登录记录写入 UNKNOWN_IP，登录限流跳过按 IP 的计数，避免这些客户端共用一个计数桶。
+"""
+
+import ipaddress
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# 无法确定客户端地址时登录记录中写入的值（ip_address 列非空）
+UNKNOWN_IP = '0.0.0.0'
+
+
+@lru_cache(maxsize=4096)
+def parse_ip(value):
+    """
+    解析一个地址，返回 (版本, 整数值, 规范文本)，无法解析时返回 None
+
+    接受两端带空白、带端口（1.2.3.4:80、[::1]:80）的写法。
+    """
+    value = value.strip()
+    if value.startswith('['):
+        value = value[1:value.find(']')] if ']' in value else value[1:]
+    elif value.count(':') == 1:
+        value = value.split(':', 1)[0]
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.version, int.from_bytes(address.packed, 'big'), str(address)
+
+
+class TrustedNetworks:
+    """预编译的网段集合：{版本: [(掩码, 网络地址集合), ...]}"""
+
+    def __init__(self, cidrs):
+        groups = {4: {}, 6: {}}
+        for cidr in cidrs:
+            cidr = cidr.strip()
+            if not cidr:
+                continue
+            network = ipaddress.ip_network(cidr, strict=False)
+            bits = network.max_prefixlen
+            mask = ((1 << network.prefixlen) - 1) << (bits - network.prefixlen)
+            groups[network.version].setdefault(mask, set()).add(int(network.network_address))
+        # 前缀长的网段在前（更具体），集合冻结后只读，无需加锁
+        self._groups = {
+            version: sorted(((mask, frozenset(nets)) for mask, nets in masks.items()), reverse=True)
+            for version, masks in groups.items()
+        }
+
+    def __contains__(self, parsed):
+        version, value, _ = parsed
+        for mask, networks in self._groups[version]:
+            if value & mask in networks:
+                return True
+        return False
+
+
+class ClientIPResolver:
+    """根据可信代理网段解析客户端地址"""
+
+    def __init__(self, trusted_proxies=(), header='HTTP_X_FORWARDED_FOR'):
+        self.trusted = TrustedNetworks(trusted_proxies)
+        self.header = header
+
+    def resolve(self, meta):
+        """返回规范化的客户端地址文本；REMOTE_ADDR 缺失或无法解析时返回 None"""
+        remote = parse_ip(meta.get('REMOTE_ADDR') or '')
+        if remote is None:
+            return None
+        forwarded = meta.get(self.header)
+        if not forwarded or remote not in self.trusted:
+            return remote[2]
+
+        client = remote
+        for hop in reversed(forwarded.split(',')):
+            parsed = parse_ip(hop)
+            if parsed is None:
+                # 无法解析的值说明这一跳之前的内容不可信，停在最近的可信代理
+                break
+            client = parsed
+            if parsed not in self.trusted:
+                break
+        return client[2]
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """根据 TRUSTED_PROXIES 配置返回进程内共享的解析器"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = ClientIPResolver(getattr(settings, 'TRUSTED_PROXIES', ()))
+    return _resolver
+
+
+@receiver(setting_changed)
+def reset_resolver(setting, **kwargs):
+    """测试中修改配置时重新创建解析器"""
+    global _resolver
+    if setting == 'TRUSTED_PROXIES':
+        _resolver = None
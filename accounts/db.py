@@ -0,0 +1,117 @@
+"""
+数据库连接配置与读写分离
+
+SQLite 调优：
+    每个新连接建立后按 SQLITE_PRAGMAS 执行 PRAGMA。默认开启 WAL（读写互不阻塞，
+    只有写与写互斥），synchronous=NORMAL（WAL 下只在检查点时 fsync），
+    busy_timeout 让并发写入排队等待而不是立即报 database is locked，
+    mmap_size 让读取直接走内存映射。配合 CONN_MAX_AGE 复用连接，PRAGMA 每个连接只执行一次。
+
+读写分离：
+    ReadReplicaRouter 只在 replica_reads() 上下文中把 REPLICA_APPS 中模型的读查询
+    发往 DATABASE_REPLICAS 中的副本，其余读查询和所有写入都走主库。
+    只读接口（/me/、/login-records/、仪表板）在视图中进入该上下文；处于事务中时
+    读主库，保证读到本事务刚写入的数据。响应缓存的填充在 primary_reads() 中进行：
+    副本落后时刚写入的数据还没复制过去，从副本生成的旧响应会在缓存中保留整个 TTL。
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 64 * 1024 * 1024,
+    'cache_size': -16000,
+    'temp_store': 'memory',
+}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def get_sqlite_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    新建 SQLite 连接时执行 PRAGMA；内存数据库不支持 WAL，跳过 journal_mode
+
+    直接在底层 sqlite3 连接上执行，不经过 Django 的游标包装，不计入请求的 SQL 统计。
+    """
+    if connection.vendor != 'sqlite':
+        return
+    in_memory = connection.is_in_memory_db()
+    for name, value in get_sqlite_pragmas().items():
+        if value is None or (in_memory and name in ('journal_mode', 'mmap_size')):
+            continue
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def get_primary():
+    return getattr(settings, 'DATABASE_PRIMARY', DEFAULT_DB_ALIAS)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def replica_reads():
+    """
+    在上下文中允许读查询使用副本
+
+    基于 contextvars，异步视图中同样有效（sync_to_async 会把上下文带到线程中）。
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """在上下文中（即使外层处于 replica_reads() 中）读查询都走主库"""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    """主库写、副本读的数据库路由"""
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or not _replica_reads.get():
+            return get_primary()
+        if model._meta.app_label not in getattr(settings, 'REPLICA_APPS', ('accounts', 'auth')):
+            return get_primary()
+        if connections[get_primary()].in_atomic_block:
+            return get_primary()
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return get_primary()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {get_primary(), *get_replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """副本是主库的拷贝，不单独迁移"""
+        if db in get_replicas():
+            return False
+        return None
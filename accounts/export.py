@@ -0,0 +1,142 @@
+"""
+登录记录导出
+
+字段与 LoginRecordSerializer 一致。查询用 values_list + iterator(chunk_size=...)
+逐批读取（PostgreSQL 上是服务端游标），生成器边读边输出，内存占用与导出行数无关。
+CSV 中以公式字符开头的单元格加单引号前缀，防止在 Excel/LibreOffice 中打开时执行公式；NDJSON 原样输出。
+"""
+
+import csv
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import TextField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from .models import LoginRecord
+from .serializers import LoginRecordSerializer
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+FIELDS = LoginRecordSerializer.Meta.fields
+
+# 与 FIELDS 一一对应的查询列；未关联用户的记录导出尝试登录的账号，UA 取自去重表
+_ALIASES = {'username': 'account', 'user_agent': 'agent'}
+_COLUMNS = tuple(_ALIASES.get(name, name) for name in FIELDS)
+
+
+def parse_time_bound(value, end=False):
+    """解析日期或日期时间；只给日期时 end=True 表示当天结束（不含次日零点）"""
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'无法解析的时间: {value}')
+        parsed = datetime.combine(day, time.max if end else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_flag(value):
+    """解析 true/false/1/0；空值表示不过滤"""
+    if value in (None, ''):
+        return None
+    lowered = str(value).lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'无法解析的布尔值: {value}')
+
+
+def export_rows(user_id=None, start=None, end=None, is_successful=None, chunk_size=None):
+    """按 (login_time, id) 顺序逐批产出导出行（元组）"""
+    records = LoginRecord.objects.all()
+    if user_id is not None:
+        records = records.filter(user_id=user_id)
+    if start is not None:
+        records = records.filter(login_time__gte=start)
+    if end is not None:
+        records = records.filter(login_time__lte=end)
+    if is_successful is not None:
+        records = records.filter(is_successful=is_successful)
+    chunk_size = chunk_size or getattr(settings, 'LOGIN_RECORD_EXPORT_CHUNK_SIZE', 2000)
+
+    login_time = FIELDS.index('login_time')
+    datetime_field = serializers.DateTimeField()
+    rows = records.annotate(
+        account=Coalesce('user__username', 'username'),
+        agent=Coalesce('user_agent__raw', Value('', output_field=TextField())),
+    ).order_by('login_time', 'id').values_list(*_COLUMNS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        row = list(row)
+        # 与接口相同的时间格式（REST_FRAMEWORK['DATETIME_FORMAT']，本地时区）
+        row[login_time] = datetime_field.to_representation(row[login_time])
+        yield row
+
+
+class _Echo:
+    """csv.writer 的伪文件对象，write 直接返回写入的文本"""
+
+    def write(self, value):
+        return value
+
+
+def _batched(lines, size=500):
+    """把多行合并成一次输出，减少生成器和网络写入的次数"""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+# 表格软件把以这些字符开头的单元格当作公式；用户名和 UA 由客户端提交，可能是 =HYPERLINK(...) 之类
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _neutralize(value):
+    """以公式字符开头的文本前加单引号，表格软件会把它当作普通文本"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows, header=True):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        if header:
+            yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow([_neutralize(value) for value in row])
+    return _batched(lines())
+
+
+def iter_ndjson(rows):
+    def lines():
+        for row in rows:
+            yield json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n'
+    return _batched(lines())
+
+
+def iter_export(export_format, rows):
+    """按格式输出文本块"""
+    if export_format == 'csv':
+        return iter_csv(rows)
+    if export_format == 'ndjson':
+        return iter_ndjson(rows)
+    raise ValueError(f'不支持的导出格式: {export_format}')
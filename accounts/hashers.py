@@ -0,0 +1,53 @@
+"""
+可配置成本的密码哈希器
+
+工作因子从 settings 读取，按部署调整：
+    PASSWORD_HASH_PBKDF2_ITERATIONS
+    PASSWORD_HASH_ARGON2_TIME_COST / _MEMORY_COST / _PARALLELISM
+
+算法名与 Django 自带哈希器一致，已有的哈希可以直接校验；当存储的参数与当前
+配置不同（或首选算法变了）时，must_update 返回 True，Django 会在下一次登录
+校验成功后用当前策略重新哈希并保存，不需要单独的迁移任务。
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+
+from .metrics import timed
+
+
+class TimedHasherMixin:
+    """哈希和校验的耗时计入请求指标"""
+
+    def encode(self, *args, **kwargs):
+        with timed('password_hash'):
+            return super().encode(*args, **kwargs)
+
+    def verify(self, password, encoded):
+        with timed('password_hash'):
+            return super().verify(password, encoded)
+
+
+class TunedPBKDF2PasswordHasher(TimedHasherMixin, PBKDF2PasswordHasher):
+    """迭代次数由 PASSWORD_HASH_PBKDF2_ITERATIONS 决定的 PBKDF2-SHA256"""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class TunedArgon2PasswordHasher(TimedHasherMixin, Argon2PasswordHasher):
+    """时间、内存和并行度由 settings 决定的 Argon2id（需要 argon2-cffi）"""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_HASH_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_HASH_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_HASH_ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
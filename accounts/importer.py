@@ -0,0 +1,328 @@
+"""
+批量导入用户
+
+按批处理输入行：
+    1. 逐行校验字段（规则与注册接口一致），批内查重
+    2. 一条查询取出本批已存在的用户名、一条查询取出已存在的邮箱（走 LOWER(email) 索引）
+    3. 密码哈希分发到多个进程并行计算
+    4. bulk_create 用户和用户资料
+单行出错（包括无法解码或解析的行）只记录错误，不影响同批其它行。批量插入遇到并发注册导致的唯一约束冲突时，
+该批退回逐行插入，冲突的行记为错误。
+"""
+
+import csv
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .models import UserProfile
+from .password_pool import _init_worker
+
+logger = logging.getLogger(__name__)
+
+USERNAME_RE = re.compile(r'^[a-zA-Z0-9_]+$')
+USER_FIELDS = ('first_name', 'last_name')
+PROFILE_FIELDS = ('phone', 'birth_date', 'bio', 'location', 'website', 'gender')
+
+
+class UnparsableRow:
+    """无法解码或解析的一行，导入时记为该行的错误，不影响其它行"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class _UndecodableLine(str):
+    """不是合法 UTF-8 的一行，内容按 replace 解码，仅用于定位"""
+
+
+def iter_csv_users(lines):
+    """从 CSV 文本行逐行读取用户（首行为表头）"""
+    undecodable = []
+
+    def track(lines):
+        for line in lines:
+            if isinstance(line, _UndecodableLine):
+                undecodable.append(line)
+            yield line
+
+    reader = csv.DictReader(track(lines))
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield UnparsableRow(f'CSV 解析错误: {e}')
+            continue
+        if undecodable:
+            # DictReader 按需读取，这一行（含引号内的换行）用到的原始行里有无法解码的内容
+            undecodable.clear()
+            yield UnparsableRow('不是有效的 UTF-8 编码')
+            continue
+        yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+
+def _parse_json_line(line):
+    if isinstance(line, _UndecodableLine):
+        return UnparsableRow('不是有效的 UTF-8 编码')
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return UnparsableRow(f'JSON 解析错误: {e}')
+
+
+def iter_json_users(lines):
+    """
+    读取 JSON 数组或 NDJSON（每行一个对象）
+
+    NDJSON 逐行解析，解析失败的行记为该行的错误；JSON 数组需要整体载入，
+    无法解析时在导入任何一行之前抛出 ValueError，超大文件建议使用 NDJSON 或 CSV。
+    """
+    lines = iter(lines)
+    for line in lines:
+        if line.strip():
+            break
+    else:
+        return
+    if line.lstrip().startswith('['):
+        content = [line, *lines]
+        if any(isinstance(item, _UndecodableLine) for item in content):
+            raise ValueError('不是有效的 UTF-8 编码')
+        yield from json.loads(''.join(content))
+        return
+    yield _parse_json_line(line)
+    for line in lines:
+        if line.strip():
+            yield _parse_json_line(line)
+
+
+def _decode_lines(stream):
+    """逐行解码二进制流（上传文件、以 rb 打开的文件），去掉 UTF-8 BOM；无法解码的行交给解析器报错"""
+    first = True
+    for line in stream:
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                line = _UndecodableLine(line.decode('utf-8', errors='replace'))
+        if first:
+            if line.startswith('\ufeff'):
+                line = type(line)(line[1:])
+            first = False
+        yield line
+
+
+def open_users(stream, name=''):
+    """根据文件名选择解析器，stream 为可按行迭代的文本或二进制流"""
+    lines = _decode_lines(stream)
+    if name.endswith(('.json', '.ndjson', '.jsonl')):
+        return iter_json_users(lines)
+    return iter_csv_users(lines)
+
+
+def _hash_passwords(passwords):
+    """在子进程中按当前首选哈希器计算一组密码哈希"""
+    return [make_password(password) for password in passwords]
+
+
+class UserImporter:
+    """
+    批量用户导入器
+
+    workers 为 1 时在当前进程内计算哈希；on_error(row_number, errors) 在每个
+    出错的行上调用，便于调用方边导入边输出错误报告。
+    """
+
+    def __init__(self, batch_size=None, workers=None, validate_passwords=True,
+                 dry_run=False, on_error=None, max_errors=None):
+        self.batch_size = batch_size or getattr(settings, 'USER_IMPORT_BATCH_SIZE', 1000)
+        self.workers = workers or getattr(settings, 'USER_IMPORT_WORKERS', None) or os.cpu_count() or 1
+        self.validate_passwords = validate_passwords
+        self.dry_run = dry_run
+        self.on_error = on_error
+        # 报告中保留的错误条数上限，超过后只计数
+        self.max_errors = max_errors
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self._executor = None
+
+    def run(self, rows):
+        """导入全部行，返回报告字典"""
+        try:
+            batch = []
+            for number, row in enumerate(rows, start=1):
+                batch.append((number, row))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch)
+                    batch = []
+            if batch:
+                self._import_batch(batch)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        return self.report()
+
+    def report(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+    def _error(self, number, errors):
+        self.failed += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'errors': errors})
+        if self.on_error is not None:
+            self.on_error(number, errors)
+
+    def _clean(self, row):
+        """校验一行，返回 (用户字段, 资料字段, 密码) 或抛出 ValidationError(dict)"""
+        if isinstance(row, UnparsableRow):
+            raise ValidationError({'non_field_errors': [row.message]})
+        if not isinstance(row, dict):
+            raise ValidationError({'non_field_errors': ['每一行必须是一个对象']})
+        errors = {}
+        username = str(row.get('username') or '').strip()
+        email = str(row.get('email') or '').strip()
+        password = str(row.get('password') or '')
+
+        if not username:
+            errors['username'] = ['该字段是必填项。']
+        elif len(username) > 150 or not USERNAME_RE.match(username):
+            errors['username'] = ['用户名只能包含字母、数字和下划线']
+        if not email:
+            errors['email'] = ['该字段是必填项。']
+        else:
+            try:
+                validate_email(email)
+            except ValidationError as e:
+                errors['email'] = list(e.messages)
+
+        user_fields = {'username': username, 'email': email}
+        for name in USER_FIELDS:
+            self._clean_field(User, name, row, user_fields, errors)
+        profile_fields = {}
+        for name in PROFILE_FIELDS:
+            self._clean_field(UserProfile, name, row, profile_fields, errors)
+
+        if len(password) < 8:
+            errors['password'] = ['密码长度至少8位']
+        elif self.validate_passwords:
+            try:
+                validate_password(password, User(username=username, email=email))
+            except ValidationError as e:
+                errors['password'] = list(e.messages)
+
+        if errors:
+            raise ValidationError(errors)
+        return user_fields, profile_fields, password
+
+    @staticmethod
+    def _clean_field(model, name, row, cleaned, errors):
+        value = row.get(name)
+        if value in (None, ''):
+            return
+        try:
+            cleaned[name] = model._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            errors[name] = list(e.messages)
+
+    def _import_batch(self, batch):
+        valid = []
+        usernames, emails = set(), set()
+        for number, row in batch:
+            try:
+                user_fields, profile_fields, password = self._clean(row)
+            except ValidationError as e:
+                self._error(number, e.message_dict)
+                continue
+            email_key = user_fields['email'].lower()
+            if user_fields['username'] in usernames:
+                self._error(number, {'username': ['用户名在导入数据中重复']})
+                continue
+            if email_key in emails:
+                self._error(number, {'email': ['邮箱在导入数据中重复']})
+                continue
+            usernames.add(user_fields['username'])
+            emails.add(email_key)
+            valid.append((number, user_fields, profile_fields, password))
+        if not valid:
+            return
+
+        existing_usernames = set(
+            User.objects.filter(username__in=usernames).values_list('username', flat=True)
+        )
+        existing_emails = set(
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=emails).values_list('email_lower', flat=True)
+        )
+        to_create = []
+        for number, user_fields, profile_fields, password in valid:
+            if user_fields['username'] in existing_usernames:
+                self._error(number, {'username': ['用户名已存在']})
+            elif user_fields['email'].lower() in existing_emails:
+                self._error(number, {'email': ['邮箱已被注册']})
+            else:
+                to_create.append((number, user_fields, profile_fields, password))
+        if not to_create or self.dry_run:
+            self.created += len(to_create)
+            return
+
+        hashes = self._hash([password for _, _, _, password in to_create])
+        entries = [
+            (number, User(password=encoded, **user_fields), profile_fields)
+            for (number, user_fields, profile_fields, _), encoded in zip(to_create, hashes)
+        ]
+        try:
+            with transaction.atomic():
+                self._insert(entries)
+            self.created += len(entries)
+        except IntegrityError:
+            # 导入期间有用户通过注册接口创建了相同用户名，逐行插入找出冲突的行
+            logger.warning("批量插入唯一约束冲突，退回逐行插入")
+            for entry in entries:
+                entry[1].pk = None
+                try:
+                    with transaction.atomic():
+                        self._insert([entry])
+                    self.created += 1
+                except IntegrityError:
+                    self._error(entry[0], {'username': ['用户名已存在']})
+        logger.info("用户导入：已创建 %d，失败 %d", self.created, self.failed)
+
+    def _insert(self, entries):
+        users = User.objects.bulk_create([user for _, user, _ in entries])
+        if any(user.pk is None for user in users):
+            # 数据库不支持批量插入返回主键时按用户名取回
+            ids = dict(User.objects.filter(
+                username__in=[user.username for user in users]
+            ).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, **profile_fields) for (_, user, profile_fields) in entries
+        ])
+
+    def _hash(self, passwords):
+        if self.workers <= 1 or len(passwords) < 2:
+            return _hash_passwords(passwords)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'settings'),),
+            )
+        size = -(-len(passwords) // self.workers)
+        chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        return [encoded for chunk in self._executor.map(_hash_passwords, chunks) for encoded in chunk]
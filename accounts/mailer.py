@@ -0,0 +1,228 @@
+"""
+邮件发件箱
+
+enqueue_email 只在 email_outbox 表中写入一行，请求不再等待 SMTP。
+send_queued_emails 命令启动若干工作线程，每个线程循环：
+    1. 领取一批到期的邮件（写入领取标记和租约，多个进程同时运行也不会重复领取）
+    2. 用同一个邮件连接（SMTP 连接在批次之间保持打开）逐封发送
+    3. 成功的邮件批量标记为已发送；失败的按 RETRY_BASE * 2 ** (次数 - 1) 秒退避
+       （不超过 RETRY_MAX），达到 MAX_ATTEMPTS 次后标记为失败
+发送进程中途退出时，租约（LEASE 秒）到期后邮件会被重新领取，因此极端情况下
+同一封邮件可能发送两次。
+
+发送使用 EMAIL_OUTBOX['BACKEND']（为空时使用 EMAIL_BACKEND），开发和测试中
+可以配置为 console 或 filebased 后端，不需要网络。
+"""
+
+import logging
+import random
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BACKEND': '',
+    'BATCH_SIZE': 50,
+    'WORKERS': 2,
+    'POLL_INTERVAL': 2.0,
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BASE': 30,
+    'RETRY_MAX': 3600,
+}
+
+
+def get_outbox_conf():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_OUTBOX', {})}
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    """
+    写入一封待发邮件，返回 OutboundEmail 实例
+
+    EMAIL_OUTBOX['ENABLED'] 为 False 时直接同步发送（返回 None），发送失败抛出异常。
+    """
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    if not get_outbox_conf()['ENABLED']:
+        EmailMessage(subject, body, from_email, list(to)).send()
+        return None
+    return OutboundEmail.objects.create(subject=subject, body=body, from_email=from_email, to=list(to))
+
+
+def retry_delay(attempts, conf):
+    """第 attempts 次失败后的等待秒数，带 ±10% 抖动，避免同时失败的邮件同时重试"""
+    delay = min(conf['RETRY_BASE'] * 2 ** (attempts - 1), conf['RETRY_MAX'])
+    return delay * random.uniform(0.9, 1.1)
+
+
+class OutboxDelivery:
+    """
+    发件箱投递器，每个工作线程一个实例
+
+    邮件连接在批次之间复用，发送出错后关闭，下一批重新建立。
+    """
+
+    def __init__(self, conf=None):
+        self.conf = conf or get_outbox_conf()
+        self.sent = 0
+        self.failed = 0
+        self._connection = None
+
+    def claim(self):
+        """领取一批到期邮件"""
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        ids = list(
+            OutboundEmail.objects.due(now).order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:self.conf['BATCH_SIZE']]
+        )
+        if not ids:
+            return []
+        # 条件更新：并发领取同一批时，只有先更新的一方拿到这些行
+        OutboundEmail.objects.due(now).filter(id__in=ids).update(
+            status=OutboundEmail.STATUS_SENDING,
+            claim_token=token,
+            locked_until=now + timedelta(seconds=self.conf['LEASE']),
+            attempts=F('attempts') + 1,
+        )
+        return list(OutboundEmail.objects.filter(claim_token=token).order_by('next_attempt_at', 'id'))
+
+    def run_once(self):
+        """领取并发送一批，返回本批邮件数"""
+        emails = self.claim()
+        if not emails:
+            return 0
+        sent, failures = [], []
+        for email in emails:
+            try:
+                self._send(email)
+                sent.append(email.pk)
+            except Exception as e:
+                failures.append((email, e))
+                self.close()
+        self._finish(sent, failures)
+        return len(emails)
+
+    def drain(self):
+        """发送所有到期邮件，返回发送的邮件数"""
+        total = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return total
+            total += count
+
+    def close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def _send(self, email):
+        if self._connection is None:
+            self._connection = get_connection(self.conf['BACKEND'] or None, fail_silently=False)
+            self._connection.open()
+        message = EmailMessage(
+            email.subject, email.body, email.from_email or settings.DEFAULT_FROM_EMAIL,
+            email.to, connection=self._connection,
+        )
+        if not self._connection.send_messages([message]):
+            raise RuntimeError('邮件后端未发送任何邮件')
+
+    def _finish(self, sent, failures):
+        now = timezone.now()
+        with transaction.atomic():
+            if sent:
+                OutboundEmail.objects.filter(id__in=sent).update(
+                    status=OutboundEmail.STATUS_SENT, sent_at=now,
+                    locked_until=None, claim_token='', last_error='',
+                )
+            for email, error in failures:
+                if email.attempts >= self.conf['MAX_ATTEMPTS']:
+                    status, next_attempt_at = OutboundEmail.STATUS_FAILED, email.next_attempt_at
+                else:
+                    status = OutboundEmail.STATUS_PENDING
+                    next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts, self.conf))
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status=status, next_attempt_at=next_attempt_at,
+                    locked_until=None, claim_token='', last_error=str(error)[:1000],
+                )
+        self.sent += len(sent)
+        self.failed += len(failures)
+        for email, error in failures:
+            logger.warning("邮件发送失败（第 %d 次）: %s - %s", email.attempts, email.to, error)
+
+
+class OutboxWorkerPool:
+    """在多个线程中运行 OutboxDelivery，直到 stop() 被调用"""
+
+    def __init__(self, workers=None, conf=None):
+        self.conf = conf or get_outbox_conf()
+        self.workers = workers or self.conf['WORKERS']
+        self.deliveries = []
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.workers):
+            delivery = OutboxDelivery(self.conf)
+            thread = threading.Thread(
+                target=self._run, args=(delivery,), name=f'email-outbox-{number}', daemon=True
+            )
+            self.deliveries.append(delivery)
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait(self):
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(1)
+
+    def stats(self):
+        return {
+            'sent': sum(delivery.sent for delivery in self.deliveries),
+            'failed': sum(delivery.failed for delivery in self.deliveries),
+        }
+
+    def _run(self, delivery):
+        try:
+            while not self._stop.is_set():
+                close_old_connections()
+                try:
+                    count = delivery.run_once()
+                except Exception as e:
+                    logger.error("发件箱处理失败: %s", e)
+                    count = 0
+                if not count:
+                    # 空闲时关闭邮件连接，避免 SMTP 服务器超时断开
+                    delivery.close()
+                    self._stop.wait(self.conf['POLL_INTERVAL'])
+        finally:
+            delivery.close()
+            close_old_connections()
+
+
+def purge_sent_emails(before):
+    """删除 before 之前发送成功的邮件，返回删除行数"""
+    deleted, _ = OutboundEmail.objects.filter(
+        status=OutboundEmail.STATUS_SENT, sent_at__lt=before
+    ).delete()
+    return deleted
@@ -0,0 +1,61 @@
+"""
+归档超过保留期的登录记录
+
+用法:
+    python manage.py archive_login_records
+    python manage.py archive_login_records --days 365 --batch-size 5000
+    python manage.py archive_login_records --dry-run
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.retention import archive_login_records, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = '把超过保留期的登录记录汇总到每日汇总表、写入归档文件并从热表删除'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='保留天数，默认使用 LOGIN_RECORD_RETENTION_DAYS'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'LOGIN_RECORD_ARCHIVE_BATCH_SIZE', 1000),
+            help='每个事务处理的记录数'
+        )
+        parser.add_argument(
+            '--archive-dir', default=getattr(settings, 'LOGIN_RECORD_ARCHIVE_DIR', None),
+            help='归档文件目录，默认使用 LOGIN_RECORD_ARCHIVE_DIR'
+        )
+        parser.add_argument(
+            '--no-archive', action='store_true',
+            help='只写每日汇总，不保留原始记录'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='只统计将被归档的记录数'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = retention_cutoff(options['days'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        result = archive_login_records(
+            cutoff,
+            batch_size=options['batch_size'],
+            archive_dir=None if options['no_archive'] else options['archive_dir'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{cutoff:%Y-%m-%d} 之前共有 {result['archived']} 条登录记录待归档")
+            return
+        for path in result['files']:
+            self.stdout.write(f'归档文件: {path}')
+        self.stdout.write(self.style.SUCCESS(
+            f"已归档 {result['archived']} 条登录记录（{cutoff:%Y-%m-%d} 之前）"
+        ))
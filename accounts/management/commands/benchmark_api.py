@@ -0,0 +1,376 @@
+"""
+认证接口负载基准
+
+完全离线运行：在临时 SQLite 文件中建库并写入 N 个用户和 M 条登录记录，然后按场景
+（注册、用户名/邮箱登录、密码错误、刷新、/me/、资料修改、仪表板、登录记录）发送请求：
+    - client：Django 测试客户端，单线程顺序请求
+    - wsgi：进程内的多线程 WSGI 服务器（本机回环地址），WORKERS 个线程并发请求
+每个场景输出 p50/p95/p99 延迟、每秒请求数和平均每个请求的 SQL 条数（来自请求指标中间件）。
+
+结果可以保存为 JSON，并与基线文件比较：p95 延迟变慢或吞吐量下降超过 --threshold，
+或平均 SQL 条数比基线多 0.5 条以上时视为回退，命令以非零状态退出。有请求返回了非预期的
+状态码时同样视为回退（快速返回的 4xx/5xx 会让延迟和吞吐量看起来更好）。
+
+为了结果可复现：用户和令牌由 --seed 决定；关闭登录限流，登录记录同步写入，
+响应缓存使用进程内后端，运行期间屏蔽 WARNING 及以下的日志。
+
+用法:
+    python manage.py benchmark_api
+    python manage.py benchmark_api --users 500 --records 20000 --requests 300 --workers 16
+    python manage.py benchmark_api --hash-iterations 10000 --output bench.json
+    python manage.py benchmark_api --baseline bench.json --threshold 0.15
+"""
+
+import http.client
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import connection
+from django.test import Client
+from django.test.testcases import QuietWSGIRequestHandler
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.metrics import get_exporter, reset_exporter
+from accounts.models import LoginRecord, UserProfile
+from accounts.stats import rebuild_login_stats
+from accounts.user_agents import intern_user_agent
+
+BENCH_PASSWORD = 'Bench!pass2024'
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) Version/17.1 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_1) Gecko/20100101 Firefox/121.0',
+)
+SCENARIOS = (
+    'register', 'login_username', 'login_email', 'login_wrong_password', 'refresh',
+    'me', 'profile_patch', 'dashboard', 'login_records',
+)
+# 场景: 期望的状态码
+EXPECTED_STATUS = {'register': 201, 'login_wrong_password': 400}
+BENCH_SETTINGS = {
+    'LOGIN_RECORD_ASYNC': False,
+    'AVATAR_PROCESSING_ASYNC': False,
+    'DATABASE_REPLICAS': [],
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def seed_data(users, records, seed):
+    """写入 users 个用户（共用同一个密码哈希）和 records 条登录记录，返回用户列表"""
+    rng = random.Random(seed)
+    encoded = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=encoded)
+        for i in range(users)
+    ], batch_size=1000)
+    seeded = list(User.objects.filter(username__startswith='bench').order_by('id'))
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in seeded], batch_size=1000)
+
+    agents = [intern_user_agent(raw) for raw in USER_AGENTS]
+    now = timezone.now()
+    batch = []
+    for _ in range(records):
+        batch.append(LoginRecord(
+            user=rng.choice(seeded),
+            ip_address=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            user_agent=rng.choice(agents),
+            login_time=now - timedelta(minutes=rng.randrange(60 * 24 * 60)),
+            is_successful=rng.random() > 0.1,
+        ))
+        if len(batch) >= 5000:
+            LoginRecord.objects.bulk_create(batch)
+            batch = []
+    LoginRecord.objects.bulk_create(batch)
+    rebuild_login_stats()
+    return seeded
+
+
+class ScenarioFactory:
+    """为每个场景生成请求 (方法, 路径, 请求体, Authorization)；令牌在计时之外生成"""
+
+    def __init__(self, users, seed):
+        self.users = users
+        self.rng = random.Random(seed)
+        self.access = {user.pk: f'Bearer {RefreshToken.for_user(user).access_token}' for user in users}
+        self.counter = itertools.count()
+        self.run_id = seed
+
+    def build(self, scenario, count):
+        return [getattr(self, scenario)() for _ in range(count)]
+
+    def _user(self):
+        return self.rng.choice(self.users)
+
+    def register(self):
+        number = next(self.counter)
+        username = f'new{self.run_id}x{number}'
+        return 'POST', '/api/auth/register/', {
+            'username': username, 'email': f'{username}@example.com',
+            'password': BENCH_PASSWORD, 'password_confirm': BENCH_PASSWORD,
+        }, None
+
+    def login_username(self):
+        return 'POST', '/api/auth/login/', {'username': self._user().username, 'password': BENCH_PASSWORD}, None
+
+    def login_email(self):
+        return 'POST', '/api/auth/login/', {'username': self._user().email, 'password': BENCH_PASSWORD}, None
+
+    def login_wrong_password(self):
+        return 'POST', '/api/auth/login/', {'username': self._user().username, 'password': 'wrong-password'}, None
+
+    def refresh(self):
+        return 'POST', '/api/auth/refresh/', {'refresh': str(RefreshToken.for_user(self._user()))}, None
+
+    def me(self):
+        return 'GET', '/api/auth/me/', None, self.access[self._user().pk]
+
+    def profile_patch(self):
+        return 'PATCH', '/api/auth/profile/', {'bio': f'bench {next(self.counter)}'}, self.access[self._user().pk]
+
+    def dashboard(self):
+        return 'GET', '/api/auth/dashboard/', None, self.access[self._user().pk]
+
+    def login_records(self):
+        return 'GET', '/api/auth/login-records/', None, self.access[self._user().pk]
+
+
+def run_client(requests, workers):
+    """Django 测试客户端顺序请求，返回 [(耗时, 状态码)]；workers 不使用"""
+    client = Client()
+    results = []
+    for method, path, body, auth in requests:
+        extra = {'HTTP_AUTHORIZATION': auth} if auth else {}
+        data = json.dumps(body) if body is not None else ''
+        start = time.perf_counter()
+        response = client.generic(method, path, data, content_type='application/json', **extra)
+        results.append((time.perf_counter() - start, response.status_code))
+    return results
+
+
+class BenchServer:
+    """后台线程中运行的多线程 WSGI 服务器"""
+
+    def __init__(self):
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+        self.server.set_app(WSGIHandler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='benchmark-wsgi', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def run(self, requests, workers):
+        """workers 个线程并发请求，返回 [(耗时, 状态码)]"""
+        def call(request):
+            method, path, body, auth = request
+            headers = {'Content-Type': 'application/json'}
+            if auth:
+                headers['Authorization'] = auth
+            payload = json.dumps(body).encode() if body is not None else None
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return time.perf_counter() - start, response.status
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(call, requests))
+
+
+def queries_per_request():
+    """本轮请求的平均 SQL 条数（请求指标中间件按视图记录的直方图）"""
+    total = count = 0
+    for name, labels, buckets, value_sum, value_count in get_exporter().registry.snapshot()['histograms']:
+        if name == 'accounts_request_sql_queries':
+            total += value_sum
+            count += value_count
+    return round(total / count, 2) if count else 0.0
+
+
+def compare(results, baseline, threshold):
+    """与基线比较，返回回退说明列表"""
+    previous = {(item['driver'], item['scenario']): item for item in baseline.get('results', [])}
+    regressions = []
+    for item in results:
+        name = f"{item['driver']}/{item['scenario']}"
+        if item.get('errors', 0) > 0:
+            regressions.append(f"{name}: {item['errors']} 个请求返回了非预期的状态码")
+        base = previous.get((item['driver'], item['scenario']))
+        if base is None:
+            continue
+        if item['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {item['p95_ms']}ms")
+        if item['requests_per_second'] < base['requests_per_second'] * (1 - threshold):
+            regressions.append(
+                f"{name}: 吞吐量 {base['requests_per_second']} -> {item['requests_per_second']} 请求/秒"
+            )
+        if item['queries_per_request'] > base['queries_per_request'] + 0.5:
+            regressions.append(
+                f"{name}: 每个请求 SQL {base['queries_per_request']} -> {item['queries_per_request']} 条"
+            )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = '在临时数据库上对认证接口做可复现的负载基准，并与基线比较'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='预置用户数')
+        parser.add_argument('--records', type=int, default=5000, help='预置登录记录数')
+        parser.add_argument('--requests', type=int, default=100, help='每个场景、每种方式的请求数')
+        parser.add_argument('--warmup', type=int, default=5, help='每个场景计时前的预热请求数')
+        parser.add_argument('--workers', type=int, default=8, help='wsgi 方式的并发线程数')
+        parser.add_argument(
+            '--drivers', nargs='*', choices=('client', 'wsgi'), default=['client', 'wsgi'], help='请求方式'
+        )
+        parser.add_argument('--scenarios', nargs='*', choices=SCENARIOS, default=list(SCENARIOS), help='场景')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子')
+        parser.add_argument(
+            '--hash-iterations', type=int, default=None,
+            help='PBKDF2 迭代次数，默认使用 PASSWORD_HASH_PBKDF2_ITERATIONS'
+        )
+        parser.add_argument('--output', help='结果 JSON 的保存路径')
+        parser.add_argument('--baseline', help='基线 JSON 文件')
+        parser.add_argument('--threshold', type=float, default=0.2, help='允许的相对回退比例')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'无法读取基线文件: {e}')
+
+        overrides = {
+            **BENCH_SETTINGS,
+            'LOGIN_THROTTLE': {**getattr(settings, 'LOGIN_THROTTLE', {}), 'ENABLED': False},
+            'ACCOUNTS_RESPONSE_CACHE': {**getattr(settings, 'ACCOUNTS_RESPONSE_CACHE', {}), 'BACKEND': 'locmem'},
+            'METRICS': {
+                **getattr(settings, 'METRICS', {}), 'ENABLED': True, 'MULTIPROC_DIR': '',
+                'SLOW_REQUEST_MS': 10 ** 9, 'SLOW_QUERY_COUNT': 10 ** 9,
+            },
+        }
+        if options['hash_iterations']:
+            overrides['PASSWORD_HASH_PBKDF2_ITERATIONS'] = options['hash_iterations']
+
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(**overrides):
+            results = self._run(options, os.path.join(tmpdir, 'benchmark.sqlite3'))
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'python': sys.version.split()[0],
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'pbkdf2_iterations': overrides.get(
+                    'PASSWORD_HASH_PBKDF2_ITERATIONS', getattr(settings, 'PASSWORD_HASH_PBKDF2_ITERATIONS', None)
+                ),
+                **{key: options[key] for key in ('users', 'records', 'requests', 'workers', 'seed')},
+            },
+            'results': results,
+        }
+        self._print(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f'结果已保存到 {options["output"]}')
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(line)
+                raise CommandError(f'与基线相比有 {len(regressions)} 项性能回退')
+            self.stdout.write(self.style.SUCCESS('与基线相比没有性能回退'))
+
+    def _run(self, options, db_path):
+        """在临时数据库上预置数据并依次运行各场景"""
+        setup_test_environment(debug=False)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = db_path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        logging.disable(logging.WARNING)
+        server = None
+        try:
+            users = seed_data(options['users'], options['records'], options['seed'])
+            factory = ScenarioFactory(users, options['seed'])
+            results = []
+            for driver in options['drivers']:
+                if driver == 'wsgi':
+                    server = BenchServer()
+                runner = server.run if driver == 'wsgi' else run_client
+                for scenario in options['scenarios']:
+                    runner(factory.build(scenario, options['warmup']), options['workers'])
+                    requests = factory.build(scenario, options['requests'])
+                    reset_exporter(setting='METRICS')
+                    start = time.perf_counter()
+                    timings = runner(requests, options['workers'])
+                    elapsed = time.perf_counter() - start
+                    results.append(self._summarize(driver, scenario, timings, elapsed))
+            return results
+        finally:
+            if server is not None:
+                server.stop()
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    @staticmethod
+    def _summarize(driver, scenario, timings, elapsed):
+        expected = EXPECTED_STATUS.get(scenario, 200)
+        durations = [duration for duration, _ in timings]
+        return {
+            'driver': driver,
+            'scenario': scenario,
+            'requests': len(timings),
+            'errors': sum(1 for _, status_code in timings if status_code != expected),
+            'requests_per_second': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(durations, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(durations, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(durations, 0.99) * 1000, 2),
+            'queries_per_request': queries_per_request(),
+        }
+
+    def _print(self, results):
+        self.stdout.write(
+            f'{"方式":<8}{"场景":<22}{"请求/秒":>10}{"p50(ms)":>10}{"p95(ms)":>10}{"p99(ms)":>10}'
+            f'{"SQL/请求":>10}{"错误":>6}'
+        )
+        for item in results:
+            self.stdout.write(
+                f'{item["driver"]:<8}{item["scenario"]:<22}{item["requests_per_second"]:>10}'
+                f'{item["p50_ms"]:>10}{item["p95_ms"]:>10}{item["p99_ms"]:>10}'
+                f'{item["queries_per_request"]:>10}{item["errors"]:>6}'
+            )
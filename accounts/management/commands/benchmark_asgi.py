@@ -0,0 +1,188 @@
+"""
+同步视图（WSGI）与异步视图（ASGI）的负载对比
+
+在当前进程内直接驱动 Django 的 WSGIHandler 和 ASGIHandler，不经过网络和应用服务器：
+    - WSGI：同步视图，THREADS 个线程并发（相当于 gunicorn --threads）
+    - ASGI：异步视图，CONCURRENCY 个请求并发（单个事件循环）
+输出每秒请求数、p50/p99 延迟，以及单独一轮（开启 tracemalloc）测得的 Python 内存分配峰值，
+用于在相同内存预算下比较两种部署方式。
+
+用法:
+    python manage.py benchmark_asgi --username alice
+    python manage.py benchmark_asgi --username alice --endpoints me login-records --threads 8 --concurrency 64
+    python manage.py benchmark_asgi --username alice --requests 5000 --json
+"""
+
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import WSGIHandler
+from django.test.utils import override_settings
+from django.urls import path
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import async_views, views
+
+ENDPOINTS = {
+    'me': (views.UserInfoView.as_view(), async_views.async_user_info_view),
+    'dashboard': (views.dashboard_stats_view, async_views.async_dashboard_stats_view),
+    'login-records': (views.LoginRecordListView.as_view(), async_views.async_login_record_list_view),
+}
+
+
+def make_urlconf(mode):
+    """只包含被测接口的 URL 配置，mode 为 0（同步）或 1（异步）"""
+    urlconf = types.ModuleType(f'benchmark_urls_{mode}')
+    urlconf.urlpatterns = [path(f'{name}/', pair[mode]) for name, pair in ENDPOINTS.items()]
+    return urlconf
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_wsgi(path_info, token, requests, threads):
+    """返回 (每个请求的耗时, 非 2xx 响应数)"""
+    handler = WSGIHandler()
+
+    def call(_):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path_info, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'HTTP_AUTHORIZATION': f'Bearer {token}', 'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        statuses = []
+        start = time.perf_counter()
+        result = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            b''.join(result)
+        finally:
+            result.close()
+        return time.perf_counter() - start, not statuses[0].startswith('2')
+
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(call, range(requests)))
+    return [elapsed for elapsed, _ in results], sum(failed for _, failed in results)
+
+
+def run_asgi(path_info, token, requests, concurrency):
+    """返回 (每个请求的耗时, 非 2xx 响应数)"""
+    handler = ASGIHandler()
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path_info, 'raw_path': path_info.encode(), 'query_string': b'',
+        'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+    }
+
+    async def call(semaphore):
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # 请求体已读完，之后一直等待（客户端不会断开）
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with semaphore:
+            start = time.perf_counter()
+            await handler(dict(scope), receive, send)
+            return time.perf_counter() - start, not 200 <= statuses[0] < 300
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(call(semaphore) for _ in range(requests)))
+
+    results = asyncio.run(main())
+    return [elapsed for elapsed, _ in results], sum(failed for _, failed in results)
+
+
+def peak_memory(func, *args):
+    """单独跑一轮测量 Python 内存分配峰值（tracemalloc 会拖慢执行，不计入吞吐量）"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = '在进程内对比同步视图（WSGI 线程）和异步视图（ASGI 事件循环）的吞吐量、延迟和内存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='用于认证的已有用户')
+        parser.add_argument(
+            '--endpoints', nargs='*', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS),
+            help='被测接口'
+        )
+        parser.add_argument('--requests', type=int, default=2000, help='每个接口、每种方式的请求数')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI 线程数')
+        parser.add_argument('--concurrency', type=int, default=64, help='ASGI 并发请求数')
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f'用户不存在: {options["username"]}')
+        token = str(RefreshToken.for_user(user).access_token)
+        requests = options['requests']
+        memory_requests = max(1, requests // 10)
+
+        runs = [
+            ('wsgi', 0, run_wsgi, options['threads']),
+            ('asgi', 1, run_asgi, options['concurrency']),
+        ]
+        results = []
+        for endpoint in options['endpoints']:
+            path_info = f'/{endpoint}/'
+            for server, mode, runner, workers in runs:
+                with override_settings(ROOT_URLCONF=make_urlconf(mode)):
+                    runner(path_info, token, min(requests, 50), workers)  # 预热缓存和连接
+                    start = time.perf_counter()
+                    timings, errors = runner(path_info, token, requests, workers)
+                    elapsed = time.perf_counter() - start
+                    memory = peak_memory(runner, path_info, token, memory_requests, workers)
+                results.append({
+                    'endpoint': endpoint,
+                    'server': server,
+                    'workers': workers,
+                    'requests_per_second': round(requests / elapsed, 1),
+                    'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+                    'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+                    'peak_memory_kb': round(memory / 1024, 1),
+                    'errors': errors,
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps({'requests': requests, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(
+            f'{"接口":<16}{"方式":<6}{"并发":>6}{"请求/秒":>10}{"p50(ms)":>10}{"p99(ms)":>10}'
+            f'{"内存峰值(KB)":>14}{"错误":>6}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["endpoint"]:<16}{result["server"]:<6}{result["workers"]:>6}'
+                f'{result["requests_per_second"]:>10}{result["p50_ms"]:>10}{result["p99_ms"]:>10}'
+                f'{result["peak_memory_kb"]:>14}{result["errors"]:>6}'
+            )
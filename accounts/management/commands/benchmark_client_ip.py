@@ -0,0 +1,99 @@
+"""
+客户端 IP 解析性能基准
+
+生成指定数量的可信代理网段和 X-Forwarded-For 链，测量每次解析的耗时，
+并与逐个网段调用 ipaddress 判断的朴素写法对比。
+
+用法:
+    python manage.py benchmark_client_ip
+    python manage.py benchmark_client_ip --networks 10 50 200 --hops 3 --iterations 100000 --json
+"""
+
+import ipaddress
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.client_ip import ClientIPResolver, parse_ip
+
+
+def make_networks(count):
+    """生成 count 个前缀长度各异的可信网段，包含 IPv4 和 IPv6"""
+    networks = []
+    for i in range(count):
+        if i % 4 == 3:
+            networks.append(f'2001:db8:{i:x}::/{48 + i % 16}')
+        else:
+            networks.append(f'10.{i % 256}.{(i * 7) % 256}.0/{16 + i % 13}')
+    return networks
+
+
+def make_meta(networks, hops):
+    """REMOTE_ADDR 和 XFF 中的代理地址都落在可信网段内，最左边是客户端"""
+    proxies = [str(ipaddress.ip_network(net, strict=False).network_address + 1) for net in networks[:hops]]
+    return {
+        'REMOTE_ADDR': proxies[0] if proxies else '127.0.0.1',
+        'HTTP_X_FORWARDED_FOR': ', '.join(['203.0.113.7'] + proxies[1:]),
+    }
+
+
+def naive_resolve(networks, meta):
+    """对比基线：每次请求逐个网段解析、逐个判断"""
+    parsed = [ipaddress.ip_network(net, strict=False) for net in networks]
+    remote = ipaddress.ip_address(meta['REMOTE_ADDR'].strip())
+    if not any(remote in net for net in parsed):
+        return str(remote)
+    client = remote
+    for hop in reversed(meta['HTTP_X_FORWARDED_FOR'].split(',')):
+        client = ipaddress.ip_address(hop.strip())
+        if not any(client in net for net in parsed):
+            break
+    return str(client)
+
+
+def measure(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+class Command(BaseCommand):
+    help = '测量客户端 IP 解析在不同可信网段数量下的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--networks', type=int, nargs='*', default=[1, 10, 50, 200], help='可信网段数量')
+        parser.add_argument('--hops', type=int, default=3, help='经过的代理层数')
+        parser.add_argument('--iterations', type=int, default=50000, help='每个配置的解析次数')
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+
+    def handle(self, *args, **options):
+        results = []
+        for count in options['networks']:
+            networks = make_networks(count)
+            meta = make_meta(networks, max(1, min(options['hops'], count)))
+            resolver = ClientIPResolver(networks)
+            assert resolver.resolve(meta) == naive_resolve(networks, meta) == '203.0.113.7'
+
+            parse_ip.cache_clear()
+            cold = measure(lambda: (parse_ip.cache_clear(), resolver.resolve(meta)), options['iterations'] // 10)
+            warm = measure(lambda: resolver.resolve(meta), options['iterations'])
+            naive = measure(lambda: naive_resolve(networks, meta), max(1, options['iterations'] // 10))
+            results.append({
+                'networks': count,
+                'resolver_us': round(warm * 1e6, 3),
+                'resolver_cold_us': round(cold * 1e6, 3),
+                'naive_us': round(naive * 1e6, 3),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps({'hops': options['hops'], 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f'{"网段数":>8}{"解析(µs)":>12}{"冷缓存(µs)":>14}{"朴素写法(µs)":>16}')
+        for result in results:
+            self.stdout.write(
+                f'{result["networks"]:>8}{result["resolver_us"]:>12}'
+                f'{result["resolver_cold_us"]:>14}{result["naive_us"]:>16}'
+            )
@@ -0,0 +1,118 @@
+"""
+密码哈希性能基准
+
+在当前机器上测量各候选哈希配置单核每秒可完成的登录校验次数，
+用于在安全强度和登录延迟之间选择工作因子。
+
+用法:
+    python manage.py benchmark_hashers
+    python manage.py benchmark_hashers --pbkdf2 260000 600000 1000000 --argon2 2:65536:1 3:102400:8
+    python manage.py benchmark_hashers --target-ms 100 --json
+"""
+
+import json
+import os
+import time
+
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.hashers import TunedArgon2PasswordHasher, TunedPBKDF2PasswordHasher
+
+BENCH_PASSWORD = 'correct horse battery staple'
+
+
+def pbkdf2_candidate(iterations):
+    """生成指定迭代次数的 PBKDF2 哈希器"""
+    hasher_class = type('BenchPBKDF2', (PBKDF2PasswordHasher,), {'iterations': iterations})
+    return f'pbkdf2_sha256 iterations={iterations}', hasher_class()
+
+
+def argon2_candidate(spec):
+    """根据 time_cost:memory_cost:parallelism 生成 Argon2 哈希器"""
+    try:
+        time_cost, memory_cost, parallelism = (int(part) for part in spec.split(':'))
+    except ValueError:
+        raise CommandError(f'Argon2 参数格式应为 time_cost:memory_cost:parallelism，收到 {spec}')
+    hasher_class = type('BenchArgon2', (Argon2PasswordHasher,), {
+        'time_cost': time_cost,
+        'memory_cost': memory_cost,
+        'parallelism': parallelism,
+    })
+    return f'argon2 t={time_cost} m={memory_cost} p={parallelism}', hasher_class()
+
+
+def measure(hasher, rounds):
+    """返回单次 verify 的耗时列表（秒）"""
+    encoded = hasher.encode(BENCH_PASSWORD, hasher.salt())
+    hasher.verify(BENCH_PASSWORD, encoded)  # 预热
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.verify(BENCH_PASSWORD, encoded)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+class Command(BaseCommand):
+    help = '测量候选密码哈希配置的单核登录吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pbkdf2', type=int, nargs='*', default=[260000, 390000, 600000],
+            help='候选 PBKDF2 迭代次数'
+        )
+        parser.add_argument(
+            '--argon2', nargs='*', default=['2:19456:1', '2:65536:1', '2:102400:8'],
+            help='候选 Argon2 参数，格式 time_cost:memory_cost:parallelism'
+        )
+        parser.add_argument('--rounds', type=int, default=10, help='每个配置的测量次数')
+        parser.add_argument(
+            '--target-ms', type=float, default=None,
+            help='单次校验的目标延迟（毫秒），标记满足目标的配置'
+        )
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+
+    def handle(self, *args, **options):
+        candidates = [pbkdf2_candidate(n) for n in options['pbkdf2']]
+        candidates.append(('current policy (pbkdf2)', TunedPBKDF2PasswordHasher()))
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            if options['argon2']:
+                self.stderr.write('未安装 argon2-cffi，跳过 Argon2 候选配置')
+        else:
+            candidates += [argon2_candidate(spec) for spec in options['argon2']]
+            candidates.append(('current policy (argon2)', TunedArgon2PasswordHasher()))
+
+        cores = os.cpu_count() or 1
+        results = []
+        for name, hasher in candidates:
+            timings = sorted(measure(hasher, options['rounds']))
+            mean = sum(timings) / len(timings)
+            result = {
+                'name': name,
+                'mean_ms': round(mean * 1000, 2),
+                'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 2),
+                'logins_per_sec_per_core': round(1 / mean, 1),
+                'logins_per_sec_machine': round(cores / mean, 1),
+            }
+            if options['target_ms'] is not None:
+                result['meets_target'] = result['p95_ms'] <= options['target_ms']
+            results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'cpu_count': cores, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f'CPU 核数: {cores}')
+        self.stdout.write(f'{"配置":<36}{"平均(ms)":>10}{"p95(ms)":>10}{"次/秒/核":>12}{"次/秒/机":>12}')
+        for result in results:
+            line = (
+                f'{result["name"]:<36}{result["mean_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["logins_per_sec_per_core"]:>12}{result["logins_per_sec_machine"]:>12}'
+            )
+            if result.get('meets_target') is False:
+                self.stdout.write(self.style.WARNING(line + '  超出目标延迟'))
+            else:
+                self.stdout.write(line)
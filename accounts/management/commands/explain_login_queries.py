@@ -0,0 +1,120 @@
+"""
+检查登录记录相关查询的执行计划
+
+对登录记录列表、仪表板统计和后台 changelist 使用的查询执行 EXPLAIN，
+任何一条查询退化为全表扫描时命令以非零状态退出。
+
+用法:
+    python manage.py explain_login_queries
+    python manage.py explain_login_queries --verbose
+"""
+
+from datetime import timedelta
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from accounts.models import LoginRecord
+
+
+def login_record_queries(user_id):
+    """
+    返回 (名称, 查询集, 是否为计数查询) 列表，与视图和后台中的查询形状保持一致
+    """
+    now = timezone.now()
+    records = LoginRecord.objects.for_user(user_id)
+    model_admin = admin.site._registry[LoginRecord]
+    request = RequestFactory().get('/admin/accounts/loginrecord/')
+    changelist = model_admin.get_queryset(request).order_by('-login_time', '-pk')
+
+    return [
+        ('login-records 列表',
+         records.since(now - timedelta(days=30)).recent_first(), False),
+        ('login-records 键集分页',
+         records.since(now - timedelta(days=30)).keyset_before(now - timedelta(days=1), 1)[:21], False),
+        ('login-records 键集分页（向前）',
+         records.since(now - timedelta(days=30)).keyset_after(now - timedelta(days=1), 1)[:21], False),
+        ('dashboard total_logins', records, True),
+        ('dashboard recent_logins', records.since(now - timedelta(days=30)), True),
+        ('dashboard successful_logins', records.filter(is_successful=True), True),
+        ('dashboard failed_logins', records.filter(is_successful=False), True),
+        ('admin changelist',
+         changelist[:model_admin.list_per_page], False),
+        ('admin date_hierarchy 按月筛选',
+         changelist.filter(login_time__gte=now - timedelta(days=31), login_time__lt=now)
+         [:model_admin.list_per_page], False),
+    ]
+
+
+def explain(queryset, count=False):
+    """返回查询的执行计划（每个计划节点一行）"""
+    sql, params = queryset.values('pk').query.sql_with_params() if count \
+        else queryset.query.sql_with_params()
+    if count:
+        sql = f'SELECT COUNT(*) FROM ({sql}) subquery'
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        rows = cursor.fetchall()
+    # SQLite 返回 (id, parent, notused, detail)，其它数据库每行只有一列文本
+    return [str(row[-1]) for row in rows]
+
+
+def find_full_scans(plan, table, vendor):
+    """返回计划中对 table 做全表扫描的节点"""
+    if vendor == 'sqlite':
+        return [
+            line for line in plan
+            if line.startswith('SCAN ') and table in line.split()[1:2]
+            and 'INDEX' not in line
+        ]
+    if vendor == 'postgresql':
+        return [line for line in plan if f'Seq Scan on {table}' in line]
+    return []
+
+
+class Command(BaseCommand):
+    help = '对登录记录相关查询执行 EXPLAIN，出现全表扫描时失败'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id', type=int, default=1,
+            help='生成查询时使用的用户ID（不要求真实存在）'
+        )
+        parser.add_argument(
+            '--verbose', action='store_true',
+            help='输出每条查询的完整执行计划'
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'不支持的数据库: {vendor}')
+
+        table = LoginRecord._meta.db_table
+        failures = []
+
+        with transaction.atomic():
+            if vendor == 'postgresql':
+                # 小表上 PostgreSQL 总会选择顺序扫描，这里只检查“能否走索引”
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset, count in login_record_queries(options['user_id']):
+                plan = explain(queryset, count=count)
+                scans = find_full_scans(plan, table, vendor)
+                if options['verbose'] or scans:
+                    self.stdout.write(f'-- {name}')
+                    for line in plan:
+                        self.stdout.write(f'   {line}')
+                if scans:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f'✗ {name}: 全表扫描'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'✓ {name}'))
+
+        if failures:
+            raise CommandError(f'以下查询出现全表扫描: {", ".join(failures)}')
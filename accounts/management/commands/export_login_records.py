@@ -0,0 +1,63 @@
+"""
+导出登录记录（CSV 或 NDJSON）
+
+用法:
+    python manage.py export_login_records --output records.csv
+    python manage.py export_login_records --format ndjson --user-id 1 --start 2024-01-01 --end 2024-01-31
+    python manage.py export_login_records --failed > failed.csv
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.export import EXPORT_FORMATS, export_rows, iter_export, parse_time_bound
+
+
+class Command(BaseCommand):
+    help = '以流的方式导出登录记录，字段与登录记录接口一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', dest='export_format')
+        parser.add_argument('--output', '-o', default='-', help='输出文件，默认写到标准输出')
+        parser.add_argument('--user-id', type=int, help='只导出指定用户的记录')
+        parser.add_argument('--start', help='起始日期或时间（含）')
+        parser.add_argument('--end', help='结束日期或时间（含）')
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--successful', action='store_const', const=True, dest='is_successful')
+        group.add_argument('--failed', action='store_const', const=False, dest='is_successful')
+        parser.add_argument('--chunk-size', type=int, help='每次从数据库读取的行数')
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_rows(
+                user_id=options['user_id'],
+                start=parse_time_bound(options['start']),
+                end=parse_time_bound(options['end'], end=True),
+                is_successful=options['is_successful'],
+                chunk_size=options['chunk_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output'] == '-':
+            for chunk in iter_export(options['export_format'], rows):
+                self.stdout.write(chunk, ending='')
+            return
+
+        counter = _Counter(rows)
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in iter_export(options['export_format'], counter):
+                f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"已导出 {counter.count} 条登录记录到 {options['output']}"))
+
+
+class _Counter:
+    """统计经过的行数"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
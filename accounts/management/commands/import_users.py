@@ -0,0 +1,68 @@
+"""
+从 CSV 或 JSON 批量导入用户
+
+CSV 首行为表头，列名：username,email,password[,first_name,last_name,phone,birth_date,bio,location,website,gender]
+JSON 为对象数组或 NDJSON（每行一个对象），键名与 CSV 列名相同。
+
+用法:
+    python manage.py import_users users.csv
+    python manage.py import_users users.ndjson --workers 8 --batch-size 5000 --errors errors.ndjson
+    python manage.py import_users users.csv --dry-run
+"""
+
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import UserImporter, open_users
+
+
+class Command(BaseCommand):
+    help = '批量导入用户：按批查重、多进程计算密码哈希、批量插入用户和用户资料'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV/JSON/NDJSON 文件，- 表示从标准输入读取 CSV')
+        parser.add_argument('--batch-size', type=int, help='每批处理的行数，默认 USER_IMPORT_BATCH_SIZE')
+        parser.add_argument('--workers', type=int, help='计算密码哈希的进程数，默认 CPU 核数')
+        parser.add_argument('--errors', help='把出错的行以 NDJSON 写入该文件，默认输出到标准错误')
+        parser.add_argument(
+            '--skip-password-validation', action='store_true',
+            help='不执行 AUTH_PASSWORD_VALIDATORS（只检查最小长度）'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='只校验和查重，不写入数据库')
+
+    def handle(self, *args, **options):
+        errors_file = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+
+        def on_error(number, errors):
+            line = json.dumps({'row': number, 'errors': errors}, ensure_ascii=False)
+            if errors_file is not None:
+                errors_file.write(line + '\n')
+            else:
+                self.stderr.write(line)
+
+        importer = UserImporter(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            validate_passwords=not options['skip_password_validation'],
+            dry_run=options['dry_run'],
+            on_error=on_error,
+            max_errors=0,
+        )
+        try:
+            if options['path'] == '-':
+                report = importer.run(open_users(sys.stdin))
+            else:
+                with open(options['path'], 'rb') as f:
+                    report = importer.run(open_users(f, options['path']))
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(f'读取导入文件失败: {e}')
+        finally:
+            if errors_file is not None:
+                errors_file.close()
+
+        action = '可导入' if options['dry_run'] else '已导入'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {report['created']} 个用户，失败 {report['failed']} 行"
+        ))
@@ -0,0 +1,40 @@
+"""
+处理未生成缩略图的头像
+
+用法:
+    python manage.py process_avatars              # 处理 pending 状态的头像（进程重启前未处理完的）
+    python manage.py process_avatars --all        # 包括上线缩略图之前上传、尚未处理过的头像
+
+处理失败的头像会删除原始上传文件，需要用户重新上传。
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from accounts.avatars import process_avatar
+from accounts.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = '为上传后尚未处理的头像生成缩略图'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='同时处理从未处理过的历史头像'
+        )
+
+    def handle(self, *args, **options):
+        statuses = [UserProfile.AVATAR_PENDING]
+        if options['all']:
+            statuses.append('')
+        profiles = UserProfile.objects.exclude(Q(avatar='') | Q(avatar=None)).filter(avatar_status__in=statuses)
+
+        processed = failed = 0
+        for profile_id in list(profiles.values_list('pk', flat=True)):
+            UserProfile.objects.filter(pk=profile_id).update(avatar_status=UserProfile.AVATAR_PENDING)
+            if process_avatar(profile_id):
+                processed += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f'已处理 {processed} 个头像，失败 {failed} 个'))
@@ -0,0 +1,28 @@
+"""
+清理已过期的 refresh token 黑名单记录
+
+用法:
+    python manage.py purge_token_blacklist
+    python manage.py purge_token_blacklist --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+
+from accounts.blacklist import get_blacklist
+
+
+class Command(BaseCommand):
+    help = '按批删除已过期的 refresh token 黑名单记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='每批删除的记录数，默认使用 TOKEN_BLACKLIST 中的 PURGE_BATCH_SIZE'
+        )
+
+    def handle(self, *args, **options):
+        store = get_blacklist().store
+        if options['batch_size'] and hasattr(store, 'purge_batch_size'):
+            store.purge_batch_size = options['batch_size']
+        deleted = store.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'已删除 {deleted} 条过期黑名单记录'))
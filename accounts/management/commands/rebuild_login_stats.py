@@ -0,0 +1,32 @@
+"""
+根据原始登录记录重建用户登录统计
+
+用法:
+    python manage.py rebuild_login_stats
+    python manage.py rebuild_login_stats --user-id 1 --user-id 2
+"""
+
+from django.core.management.base import BaseCommand
+
+from accounts.stats import rebuild_login_stats
+
+
+class Command(BaseCommand):
+    help = '根据原始登录记录重新计算 LoginStats 统计行'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id', type=int, action='append', dest='user_ids',
+            help='只重建指定用户（可重复指定），默认重建全部'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='每批处理的用户数'
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_login_stats(
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'已重建 {rebuilt} 个用户的登录统计'))
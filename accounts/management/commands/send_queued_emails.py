@@ -0,0 +1,76 @@
+"""
+发送发件箱中的邮件
+
+用法:
+    python manage.py send_queued_emails                  # 常驻运行，Ctrl+C 停止
+    python manage.py send_queued_emails --workers 4
+    python manage.py send_queued_emails --once           # 发送当前到期的邮件后退出（适合 cron）
+    python manage.py send_queued_emails --once --purge-days 30
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.mailer import OutboxDelivery, OutboxWorkerPool, get_outbox_conf, purge_sent_emails
+
+
+class Command(BaseCommand):
+    help = '从发件箱批量发送邮件，失败的邮件按退避策略重试'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='工作线程数，默认使用 EMAIL_OUTBOX 中的 WORKERS'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='每次领取的邮件数，默认使用 EMAIL_OUTBOX 中的 BATCH_SIZE'
+        )
+        parser.add_argument(
+            '--backend', default=None,
+            help='邮件后端导入路径，例如 django.core.mail.backends.console.EmailBackend'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='在当前进程内发送完到期的邮件后退出'
+        )
+        parser.add_argument(
+            '--purge-days', type=int, default=None,
+            help='同时删除发送成功超过指定天数的邮件'
+        )
+
+    def handle(self, *args, **options):
+        conf = get_outbox_conf()
+        if options['batch_size']:
+            conf['BATCH_SIZE'] = options['batch_size']
+        if options['backend']:
+            conf['BACKEND'] = options['backend']
+
+        if options['purge_days'] is not None:
+            deleted = purge_sent_emails(timezone.now() - timedelta(days=options['purge_days']))
+            self.stdout.write(f'已删除 {deleted} 封已发送的邮件')
+
+        if options['once']:
+            delivery = OutboxDelivery(conf)
+            try:
+                delivery.drain()
+            finally:
+                delivery.close()
+            stats = {'sent': delivery.sent, 'failed': delivery.failed}
+        else:
+            pool = OutboxWorkerPool(options['workers'], conf)
+            pool.start()
+            self.stdout.write(f'发件箱已启动（{pool.workers} 个工作线程），按 Ctrl+C 停止')
+            try:
+                pool.wait()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                pool.stop()
+            stats = pool.stats()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"发送成功 {stats['sent']} 封，失败 {stats['failed']} 次"
+        ))
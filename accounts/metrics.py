@@ -0,0 +1,523 @@
+"""
+请求指标
+
+RequestMetricsMiddleware 为每个请求创建一个 RequestMetrics 收集器（放在 contextvars 中，
+异步视图和 sync_to_async 的线程里同样能取到），请求结束后按视图名汇总到进程内的直方图：
+    - 请求耗时、SQL 条数和 SQL 耗时（每个数据库连接建立时挂上 execute_wrapper）
+    - 密码哈希耗时（timed('password_hash')）、序列化耗时（timed('serializer')）
+    - 缓存命中/未命中次数（record_cache）
+另外记录日志队列丢弃的记录数（见 accounts.structured_logging）。
+/metrics 以 Prometheus 文本格式输出。gunicorn 等多进程部署时配置 METRICS['MULTIPROC_DIR']，
+每个进程定期把自己的累计值写入该目录下的 <pid>-<启动时间>.json，/metrics 汇总所有进程的文件。
+
+超过 SLOW_REQUEST_MS 毫秒或 SLOW_QUERY_COUNT 条 SQL 的请求记录一条警告日志，
+附带最慢的几条 SQL。
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MULTIPROC_DIR': '',
+    'FLUSH_INTERVAL': 5.0,
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_QUERY_COUNT': 50,
+    'SLOW_QUERY_LOG_LIMIT': 5,
+    'ALLOWED_NETWORKS': ['127.0.0.0/8', '::1/128'],
+}
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 名称: (类型, 说明, 标签, 直方图分桶)
+DEFINITIONS = {
+    'accounts_requests_total': (
+        'counter', '请求数', ('view', 'method', 'status'), None),
+    'accounts_request_duration_seconds': (
+        'histogram', '请求耗时', ('view',), TIME_BUCKETS),
+    'accounts_request_sql_queries': (
+        'histogram', '每个请求执行的 SQL 条数', ('view',), COUNT_BUCKETS),
+    'accounts_request_sql_duration_seconds': (
+        'histogram', '每个请求的 SQL 总耗时', ('view',), TIME_BUCKETS),
+    'accounts_request_password_hash_duration_seconds': (
+        'histogram', '每个请求的密码哈希耗时（只统计做了哈希的请求）', ('view',), TIME_BUCKETS),
+    'accounts_request_serializer_duration_seconds': (
+        'histogram', '每个请求的序列化耗时（只统计用到序列化器的请求）', ('view',), TIME_BUCKETS),
+    'accounts_cache_requests_total': (
+        'counter', '缓存查询次数', ('view', 'cache', 'result'), None),
+    'accounts_log_records_dropped_total': (
+        'counter', '丢弃的日志记录数（队列已满或被抽样）', ('logger', 'reason'), None),
+}
+
+# 请求方法作为标签时只保留标准方法，客户端可以发送任意方法名，不能让标签取值无限增长
+HTTP_METHODS = frozenset({'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS'})
+
+TIMING_METRICS = {
+    'password_hash': 'accounts_request_password_hash_duration_seconds',
+    'serializer': 'accounts_request_serializer_duration_seconds',
+}
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def get_metrics_conf():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class RequestMetrics:
+    """一个请求的指标收集器"""
+
+    def __init__(self, slow_query_limit=5):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.timings = defaultdict(float)
+        self.caches = defaultdict(int)
+        self.active = set()
+        self.slowest = []
+        self.slow_query_limit = slow_query_limit
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, elapsed):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_time += elapsed
+            # 只保留最慢的几条，按耗时升序
+            if len(self.slowest) < self.slow_query_limit or elapsed > self.slowest[0][0]:
+                bisect.insort(self.slowest, (elapsed, sql))
+                del self.slowest[:-self.slow_query_limit]
+
+
+def current_metrics():
+    """当前请求的收集器，不在请求中时返回 None"""
+    return _current.get()
+
+
+class timed:
+    """
+    把代码块的耗时计入当前请求的某一类耗时
+
+    同一类别嵌套时只计最外层（嵌套序列化器不会重复计时）；不在请求中时不做任何事。
+    """
+
+    __slots__ = ('category', 'collector', 'start')
+
+    def __init__(self, category):
+        self.category = category
+        self.collector = None
+
+    def __enter__(self):
+        collector = _current.get()
+        if collector is not None and self.category not in collector.active:
+            collector.active.add(self.category)
+            self.collector = collector
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.collector is not None:
+            self.collector.timings[self.category] += time.perf_counter() - self.start
+            self.collector.active.discard(self.category)
+            self.collector = None
+        return False
+
+
+def record_cache(name, hit):
+    """记录一次缓存查询"""
+    collector = _current.get()
+    if collector is not None:
+        collector.caches[(name, 'hit' if hit else 'miss')] += 1
+
+
+def _record_sql(execute, sql, params, many, context):
+    collector = _current.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        collector.add_query(sql, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def install_sql_recorder(sender, connection, **kwargs):
+    """
+    每个数据库连接挂上 SQL 记录器
+
+    连接对象按线程创建，在这里挂而不是在中间件里用 execute_wrapper()，
+    异步视图经 sync_to_async 在其他线程执行的查询也能记录到。
+    """
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+class MetricsRegistry:
+    """进程内的计数器和直方图（直方图各桶存非累计值）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[(name, labels)] += amount
+
+    def observe(self, name, labels, value):
+        buckets = DEFINITIONS[name][3]
+        with self._lock:
+            data = self.histograms.get((name, labels))
+            if data is None:
+                data = self.histograms[(name, labels)] = [[0] * (len(buckets) + 1), 0.0, 0]
+            data[0][bisect.bisect_left(buckets, value)] += 1
+            data[1] += value
+            data[2] += 1
+
+    def snapshot(self):
+        """可以 JSON 序列化的累计值"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), list(data[0]), data[1], data[2]]
+                    for (name, labels), data in self.histograms.items()
+                ],
+            }
+
+    def record_request(self, view, method, status_code, elapsed, collector):
+        method = method if method in HTTP_METHODS else 'other'
+        self.inc('accounts_requests_total', (view, method, str(status_code)))
+        self.observe('accounts_request_duration_seconds', (view,), elapsed)
+        self.observe('accounts_request_sql_queries', (view,), collector.sql_count)
+        self.observe('accounts_request_sql_duration_seconds', (view,), collector.sql_time)
+        for category, seconds in collector.timings.items():
+            if category in TIMING_METRICS:
+                self.observe(TIMING_METRICS[category], (view,), seconds)
+        for (cache, result), count in collector.caches.items():
+            self.inc('accounts_cache_requests_total', (view, cache, result), count)
+
+
+def merge_snapshots(snapshots):
+    """把多个进程的快照相加"""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            counters[(name, tuple(labels))] += value
+        for name, labels, buckets, total, count in snapshot.get('histograms', []):
+            key = (name, tuple(labels))
+            if key not in histograms:
+                histograms[key] = [list(buckets), total, count]
+            else:
+                data = histograms[key]
+                data[0] = [a + b for a, b in zip(data[0], buckets)]
+                data[1] += total
+                data[2] += count
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), *data] for (name, labels), data in histograms.items()],
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(snapshot):
+    """渲染为 Prometheus 文本格式（0.0.4）"""
+    counters = defaultdict(list)
+    for name, labels, value in snapshot['counters']:
+        counters[name].append((labels, value))
+    histograms = defaultdict(list)
+    for name, labels, buckets, total, count in snapshot['histograms']:
+        histograms[name].append((labels, buckets, total, count))
+
+    lines = []
+    for name, (kind, help_text, label_names, bounds) in DEFINITIONS.items():
+        samples = counters[name] if kind == 'counter' else histograms[name]
+        if not samples:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample in sorted(samples, key=lambda item: item[0]):
+            if kind == 'counter':
+                labels, value = sample
+                lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+                continue
+            labels, buckets, total, count = sample
+            cumulative = 0
+            for bound, bucket in zip((*bounds, float('inf')), buckets):
+                cumulative += bucket
+                le = (('le', '+Inf' if bound == float('inf') else repr(float(bound))),)
+                lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    多进程汇总
+
+    每个进程定期把快照原子地写入 MULTIPROC_DIR/<pid>-<启动时间>.json；导出时读取目录下所有文件，
+    本进程用内存中的最新值。文件名带启动时间，PID 被新进程复用时不会覆盖旧进程的文件。
+
+    已退出的进程的累计值不能丢（否则计数器会因为 worker 重启而回退），但文件也不能无限增加：
+    每个进程第一次写文件前把已退出进程（PID 不存在，或与本进程 PID 相同的旧文件）的文件
+    合并进 dead.json 后删除。合并和导出时的读取用目录下 .lock 文件的 flock 互斥，
+    读取方不会看到同一份数据既在 dead.json 中又在原文件中。要求所有进程在同一台机器上。
+    """
+
+    DEAD_FILE = 'dead.json'
+
+    def __init__(self, registry, directory='', flush_interval=5.0):
+        self.registry = registry
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.started = time.time_ns()
+        self._last_flush = 0.0
+        self._compacted = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'{os.getpid()}-{self.started}.json')
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        with self._lock:
+            if not self._compacted:
+                self._compacted = True
+                self.compact()
+            self._last_flush = time.monotonic()
+            try:
+                _write_json(self.path, self.registry.snapshot())
+            except OSError as e:
+                logger.warning("写入指标文件失败: %s", e)
+
+    def compact(self):
+        """把已退出进程的文件合并进 dead.json"""
+        dead_path = os.path.join(self.directory, self.DEAD_FILE)
+        try:
+            with _directory_lock(self.directory, exclusive=True):
+                folded, snapshots = [], []
+                for path in glob.glob(os.path.join(self.directory, '*.json')):
+                    pid = _file_pid(path)
+                    if path == self.path or pid is None:
+                        continue
+                    if pid == os.getpid() or not _pid_alive(pid):
+                        try:
+                            with open(path) as f:
+                                snapshots.append(json.load(f))
+                        except ValueError as e:
+                            logger.warning("丢弃损坏的指标文件: %s - %s", path, e)
+                        folded.append(path)
+                if not folded:
+                    return
+                if os.path.exists(dead_path):
+                    with open(dead_path) as f:
+                        snapshots.append(json.load(f))
+                _write_json(dead_path, merge_snapshots(snapshots))
+                for path in folded:
+                    os.remove(path)
+        except (OSError, ValueError) as e:
+            logger.warning("合并已退出进程的指标文件失败: %s", e)
+
+    def collect(self):
+        """所有进程汇总后的快照"""
+        snapshots = [self.registry.snapshot()]
+        if self.directory:
+            own = self.path
+            try:
+                with _directory_lock(self.directory, exclusive=False):
+                    for path in glob.glob(os.path.join(self.directory, '*.json')):
+                        if path == own:
+                            continue
+                        try:
+                            with open(path) as f:
+                                snapshots.append(json.load(f))
+                        except (OSError, ValueError) as e:
+                            logger.warning("读取指标文件失败: %s - %s", path, e)
+            except OSError as e:
+                logger.warning("读取指标目录失败: %s", e)
+        return merge_snapshots(snapshots)
+
+    def render(self):
+        return render_prometheus(self.collect())
+
+
+def _write_json(path, data):
+    """先写临时文件再改名，读取方不会读到写了一半的文件"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _file_pid(path):
+    """<pid>-<启动时间>.json（以及旧版本的 <pid>.json）中的 PID，其它文件返回 None"""
+    name = os.path.basename(path)[:-len('.json')]
+    try:
+        return int(name.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但属于其他用户
+        return True
+    return True
+
+
+@contextmanager
+def _directory_lock(directory, exclusive):
+    """指标目录的文件锁；没有 fcntl 的平台（Windows）不加锁"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """进程内共享的指标导出器"""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                conf = get_metrics_conf()
+                _exporter = MetricsExporter(MetricsRegistry(), conf['MULTIPROC_DIR'], conf['FLUSH_INTERVAL'])
+    return _exporter
+
+
+@atexit.register
+def _flush_at_exit():
+    """进程退出时写入最后一次快照"""
+    if _exporter is not None:
+        _exporter.flush()
+
+
+@receiver(setting_changed)
+def reset_exporter(setting, **kwargs):
+    """测试中修改配置时重新创建导出器"""
+    global _exporter
+    if setting == 'METRICS':
+        _exporter = None
+
+
+class RequestMetricsMiddleware:
+    """
+    记录每个请求的指标，同时支持同步和异步请求
+
+    放在 MIDDLEWARE 的第一位，耗时包含其余中间件。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        conf = get_metrics_conf()
+        if not conf['ENABLED']:
+            return self.get_response(request)
+        collector = RequestMetrics(conf['SLOW_QUERY_LOG_LIMIT'])
+        token = _current.set(collector)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            _current.reset(token)
+            self._finish(request, response, time.perf_counter() - start, collector, conf)
+
+    async def __acall__(self, request):
+        conf = get_metrics_conf()
+        if not conf['ENABLED']:
+            return await self.get_response(request)
+        collector = RequestMetrics(conf['SLOW_QUERY_LOG_LIMIT'])
+        token = _current.set(collector)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            _current.reset(token)
+            self._finish(request, response, time.perf_counter() - start, collector, conf)
+
+    def _finish(self, request, response, elapsed, collector, conf):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        status_code = response.status_code if response is not None else 500
+        exporter = get_exporter()
+        exporter.registry.record_request(view, request.method, status_code, elapsed, collector)
+        exporter.maybe_flush()
+
+        if elapsed * 1000 >= conf['SLOW_REQUEST_MS'] or collector.sql_count >= conf['SLOW_QUERY_COUNT']:
+            slowest = '; '.join(
+                f'{seconds * 1000:.1f}ms {sql[:200]}' for seconds, sql in reversed(collector.slowest)
+            )
+            logger.warning(
+                "慢请求: %s %s (%s) %d %.1fms, SQL %d 条 %.1fms, 最慢: %s",
+                request.method, request.path, view, status_code, elapsed * 1000,
+                collector.sql_count, collector.sql_time * 1000, slowest or '-',
+            )
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('avatar', models.ImageField(blank=True, null=True, upload_to='avatars/', verbose_name='头像')),
+                ('phone', models.CharField(blank=True, max_length=20, null=True, verbose_name='手机号')),
+                ('birth_date', models.DateField(blank=True, null=True, verbose_name='生日')),
+                ('bio', models.TextField(blank=True, max_length=500, verbose_name='个人简介')),
+                ('location', models.CharField(blank=True, max_length=100, verbose_name='所在地')),
+                ('website', models.URLField(blank=True, verbose_name='个人网站')),
+                ('gender', models.CharField(blank=True, choices=[('M', '男'), ('F', '女'), ('O', '其他')], max_length=1, null=True, verbose_name='性别')),
+                ('is_verified', models.BooleanField(default=False, verbose_name='是否已验证')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户资料',
+                'verbose_name_plural': '用户资料',
+                'db_table': 'user_profile',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoginRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField(verbose_name='IP地址')),
+                ('user_agent', models.TextField(blank=True, verbose_name='用户代理')),
+                ('login_time', models.DateTimeField(auto_now_add=True, verbose_name='登录时间')),
+                ('login_method', models.CharField(choices=[('password', '密码登录'), ('social', '社交登录'), ('sms', '短信登录')], default='password', max_length=20, verbose_name='登录方式')),
+                ('is_successful', models.BooleanField(default=True, verbose_name='是否成功')),
+                ('failure_reason', models.CharField(blank=True, max_length=100, verbose_name='失败原因')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_records', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '登录记录',
+                'verbose_name_plural': '登录记录',
+                'db_table': 'login_record',
+                'ordering': ['-login_time'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loginrecord',
+            name='username',
+            field=models.CharField(blank=True, max_length=150, verbose_name='登录账号'),
+        ),
+        migrations.AlterField(
+            model_name='loginrecord',
+            name='login_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='登录时间'),
+        ),
+        migrations.AlterField(
+            model_name='loginrecord',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='login_records', to=settings.AUTH_USER_MODEL, verbose_name='用户'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0002_loginrecord_buffered_writes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loginrecord',
+            index=models.Index(fields=['user', '-login_time'], name='login_rec_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginrecord',
+            index=models.Index(fields=['user', 'is_successful'], name='login_rec_user_success_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginrecord',
+            index=models.Index(fields=['-login_time'], name='login_rec_time_idx'),
+        ),
+        # 复合索引建好之后再去掉 user_id 单列索引
+        migrations.AlterField(
+            model_name='loginrecord',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='login_records', to=settings.AUTH_USER_MODEL, verbose_name='用户'),
+        ),
+    ]
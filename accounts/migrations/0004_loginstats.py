@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('accounts', '0003_loginrecord_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='login_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('total_logins', models.PositiveIntegerField(default=0, verbose_name='登录总次数')),
+                ('successful_logins', models.PositiveIntegerField(default=0, verbose_name='成功次数')),
+                ('failed_logins', models.PositiveIntegerField(default=0, verbose_name='失败次数')),
+                ('recent_daily', models.JSONField(default=dict, verbose_name='近期每日登录次数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '登录统计',
+                'verbose_name_plural': '登录统计',
+                'db_table': 'login_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    为用户名/邮箱登录添加 LOWER(email) 函数索引
+
+    auth_user 属于 django.contrib.auth，无法在模型 Meta 中声明索引，这里直接建索引。
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('accounts', '0004_loginstats'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email))',
+            reverse_sql='DROP INDEX auth_user_email_lower_idx',
+        ),
+    ]
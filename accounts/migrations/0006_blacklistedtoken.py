@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_auth_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlacklistedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=255, unique=True, verbose_name='JTI')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='过期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='拉黑时间')),
+            ],
+            options={
+                'verbose_name': 'Token 黑名单',
+                'verbose_name_plural': 'Token 黑名单',
+                'db_table': 'jwt_blacklist',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0006_blacklistedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('total_logins', models.PositiveIntegerField(default=0, verbose_name='登录次数')),
+                ('successful_logins', models.PositiveIntegerField(default=0, verbose_name='成功次数')),
+                ('failed_logins', models.PositiveIntegerField(default=0, verbose_name='失败次数')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='login_rollups', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '每日登录汇总',
+                'verbose_name_plural': '每日登录汇总',
+                'db_table': 'login_daily_rollup',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='logindailyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='login_rollup_user_date_uniq'),
+        ),
+    ]
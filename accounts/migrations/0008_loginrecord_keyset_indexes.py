@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_logindailyrollup'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='loginrecord',
+            name='login_rec_user_time_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='loginrecord',
+            name='login_rec_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='loginrecord',
+            index=models.Index(fields=['user', '-login_time', '-id'], name='login_rec_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginrecord',
+            index=models.Index(fields=['-login_time', '-id'], name='login_rec_time_idx'),
+        ),
+    ]
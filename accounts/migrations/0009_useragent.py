@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_loginrecord_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True, verbose_name='哈希')),
+                ('raw', models.TextField(verbose_name='原始字符串')),
+                ('browser', models.CharField(blank=True, max_length=50, verbose_name='浏览器')),
+                ('browser_version', models.CharField(blank=True, max_length=20, verbose_name='浏览器版本')),
+                ('os', models.CharField(blank=True, max_length=50, verbose_name='操作系统')),
+                ('os_version', models.CharField(blank=True, max_length=20, verbose_name='系统版本')),
+                ('device', models.CharField(choices=[('desktop', '桌面'), ('mobile', '手机'), ('tablet', '平板'), ('bot', '爬虫/脚本'), ('other', '其他')], default='other', max_length=10, verbose_name='设备类型')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='首次出现时间')),
+            ],
+            options={
+                'verbose_name': '用户代理',
+                'verbose_name_plural': '用户代理',
+                'db_table': 'user_agent',
+            },
+        ),
+        # 先以临时名称加外键，0010 回填后由 0011 替换原来的文本列
+        migrations.AddField(
+            model_name='loginrecord',
+            name='user_agent_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='login_records', to='accounts.useragent', verbose_name='用户代理'),
+        ),
+    ]
@@ -0,0 +1,159 @@
+"""
+把登录记录中的 UA 文本转换为 user_agent 表的外键
+
+按 id 分批处理，每批一个事务：取出本批记录的 UA 文本，缺失的 UA 一次
+bulk_create（解析结果在插入时计算），再按 UA 分组批量 UPDATE。
+迁移本身不包在一个大事务里，大表上中断后重新执行会从未回填的记录继续。
+
+哈希和解析规则是编写本迁移时 accounts.user_agents 的副本，字段长度取自历史模型；
+以后修改 accounts.user_agents 不会影响本迁移，也不要在这里导入它。
+"""
+
+import hashlib
+import re
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 2000
+# 已知 UA 到 id 的映射上限，超过后清空重新查询
+MAX_KNOWN = 100000
+
+BROWSER_RULES = [
+    ('Edge', re.compile(r'(?:Edg|Edge|EdgA|EdgiOS)/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('WeChat', re.compile(r'MicroMessenger/(\d+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/(\d+)')),
+    ('UC Browser', re.compile(r'UCBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+)[\d.]* (?:Mobile/\S+ )?Safari/')),
+    ('IE', re.compile(r'(?:MSIE |Trident/.*rv:)(\d+)')),
+    ('curl', re.compile(r'^curl/(\d+)')),
+    ('python-requests', re.compile(r'^python-requests/(\d+)')),
+    ('Postman', re.compile(r'^PostmanRuntime/(\d+)')),
+]
+
+OS_RULES = [
+    ('Windows', re.compile(r'Windows NT (\d+\.\d+)')),
+    ('iOS', re.compile(r'(?:iPhone|CPU) OS (\d+)')),
+    ('HarmonyOS', re.compile(r'HarmonyOS(?:/| )?(\d*)')),
+    ('Android', re.compile(r'Android (\d+)')),
+    ('Chrome OS', re.compile(r'CrOS \S+ (\d+)')),
+    ('macOS', re.compile(r'Mac OS X (\d+[_.]\d+)')),
+    ('Linux', re.compile(r'Linux()')),
+]
+
+WINDOWS_VERSIONS = {'10.0': '10', '6.3': '8.1', '6.2': '8', '6.1': '7'}
+
+BOT_RE = re.compile(r'bot|spider|crawl|slurp|^curl/|^python-|^Go-http-client|^PostmanRuntime|^Wget', re.I)
+TABLET_RE = re.compile(r'iPad|Tablet|Tab\b')
+MOBILE_RE = re.compile(r'Mobile|iPhone|Android|HarmonyOS')
+
+
+def user_agent_hash(raw):
+    return hashlib.sha256(raw.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def parse_user_agent(raw, max_lengths):
+    """解析 UA 字符串，返回 UserAgent 的字段值，各字段截断到 max_lengths"""
+    browser = browser_version = os_name = os_version = ''
+    for name, pattern in BROWSER_RULES:
+        match = pattern.search(raw)
+        if match:
+            browser, browser_version = name, match.group(1)
+            break
+    for name, pattern in OS_RULES:
+        match = pattern.search(raw)
+        if match:
+            os_name, os_version = name, match.group(1).replace('_', '.')
+            break
+    if os_name == 'Windows':
+        os_version = WINDOWS_VERSIONS.get(os_version, os_version)
+
+    if BOT_RE.search(raw):
+        device = 'bot'
+    elif TABLET_RE.search(raw) or (os_name == 'Android' and 'Mobile' not in raw):
+        device = 'tablet'
+    elif MOBILE_RE.search(raw):
+        device = 'mobile'
+    elif os_name in ('Windows', 'macOS', 'Linux', 'Chrome OS'):
+        device = 'desktop'
+    else:
+        device = 'other'
+    values = {
+        'browser': browser, 'browser_version': browser_version,
+        'os': os_name, 'os_version': os_version, 'device': device,
+    }
+    return {name: value[:max_lengths[name]] for name, value in values.items()}
+
+
+def backfill_user_agents(apps, schema_editor):
+    db = schema_editor.connection.alias
+    LoginRecord = apps.get_model('accounts', 'LoginRecord')
+    UserAgent = apps.get_model('accounts', 'UserAgent')
+    max_lengths = {
+        name: UserAgent._meta.get_field(name).max_length
+        for name in ('browser', 'browser_version', 'os', 'os_version', 'device')
+    }
+    pending = LoginRecord.objects.using(db).filter(user_agent_ref=None).exclude(user_agent='')
+
+    known = {}
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db):
+            rows = list(
+                pending.filter(id__gt=last_id).order_by('id').values_list('id', 'user_agent')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            if len(known) > MAX_KNOWN:
+                known.clear()
+            missing = {user_agent_hash(raw): raw for _, raw in rows if raw not in known}
+            if missing:
+                UserAgent.objects.using(db).bulk_create([
+                    UserAgent(hash=digest, raw=raw, **parse_user_agent(raw, max_lengths))
+                    for digest, raw in missing.items()
+                ], ignore_conflicts=True)
+                for digest, pk in UserAgent.objects.using(db).filter(
+                    hash__in=list(missing)
+                ).values_list('hash', 'id'):
+                    known[missing[digest]] = pk
+
+            groups = defaultdict(list)
+            for pk, raw in rows:
+                groups[known[raw]].append(pk)
+            for agent_id, ids in groups.items():
+                LoginRecord.objects.using(db).filter(id__in=ids).update(user_agent_ref_id=agent_id)
+
+
+def restore_user_agents(apps, schema_editor):
+    db = schema_editor.connection.alias
+    LoginRecord = apps.get_model('accounts', 'LoginRecord')
+    UserAgent = apps.get_model('accounts', 'UserAgent')
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db):
+            agents = list(
+                UserAgent.objects.using(db).filter(id__gt=last_id).order_by('id').values_list('id', 'raw')[:BATCH_SIZE]
+            )
+            if not agents:
+                break
+            last_id = agents[-1][0]
+            for agent_id, raw in agents:
+                LoginRecord.objects.using(db).filter(user_agent_ref_id=agent_id).update(user_agent=raw)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0009_useragent'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_agents, restore_user_agents),
+    ]
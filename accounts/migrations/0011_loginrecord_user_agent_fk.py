@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_backfill_user_agents'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='loginrecord',
+            name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='loginrecord',
+            old_name='user_agent_ref',
+            new_name='user_agent',
+        ),
+    ]
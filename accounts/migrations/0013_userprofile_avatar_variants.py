@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:42
+
+import accounts.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_status',
+            field=models.CharField(blank=True, choices=[('pending', '处理中'), ('ready', '已处理'), ('failed', '处理失败')], max_length=10, verbose_name='头像状态'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='头像缩略图'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to=accounts.models.avatar_upload_to, verbose_name='头像'),
+        ),
+    ]
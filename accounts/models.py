@@ -2,16 +2,36 @@
 用户相关模型
 """
 
+import os
+import uuid
+from datetime import timedelta
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, Q
 from django.utils import timezone
 
 
+def avatar_upload_to(instance, filename):
+    """原始上传文件的存储路径，不使用客户端提供的文件名"""
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f'avatars/{instance.user_id}/upload-{uuid.uuid4().hex[:12]}{extension}'
+
+
 class UserProfile(models.Model):
     """
     用户扩展信息模型
     如果不需要自定义用户模型，可以使用这个模型来扩展用户信息
     """
+    AVATAR_PENDING = 'pending'
+    AVATAR_READY = 'ready'
+    AVATAR_FAILED = 'failed'
+    AVATAR_STATUS_CHOICES = [
+        (AVATAR_PENDING, '处理中'),
+        (AVATAR_READY, '已处理'),
+        (AVATAR_FAILED, '处理失败'),
+    ]
+
     user = models.OneToOneField(
         'auth.User', 
         on_delete=models.CASCADE, 
@@ -19,11 +39,24 @@ class UserProfile(models.Model):
         verbose_name='用户'
     )
     avatar = models.ImageField(
-        upload_to='avatars/', 
+        upload_to=avatar_upload_to,
         null=True, 
         blank=True, 
         verbose_name='头像'
     )
+    # 上传后为 pending，由后台线程生成缩略图后变为 ready
+    avatar_status = models.CharField(
+        max_length=10,
+        choices=AVATAR_STATUS_CHOICES,
+        blank=True,
+        verbose_name='头像状态'
+    )
+    # {尺寸名称: {格式: 存储路径}}
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='头像缩略图'
+    )
     phone = models.CharField(
         max_length=20, 
         null=True, 
@@ -98,6 +131,123 @@ class UserProfile(models.Model):
         return self.user.get_full_name() or self.user.username
 
 
+class UserAgent(models.Model):
+    """
+    用户代理字符串
+
+    同一个 UA 字符串只保存一行，登录记录通过外键引用。以原始字符串的
+    SHA-256 作为唯一键（TextField 无法直接建唯一索引），解析出的浏览器、
+    操作系统和设备类型在插入时计算一次。
+    """
+    DEVICE_CHOICES = [
+        ('desktop', '桌面'),
+        ('mobile', '手机'),
+        ('tablet', '平板'),
+        ('bot', '爬虫/脚本'),
+        ('other', '其他'),
+    ]
+
+    hash = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='哈希'
+    )
+    raw = models.TextField(
+        verbose_name='原始字符串'
+    )
+    browser = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name='浏览器'
+    )
+    browser_version = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name='浏览器版本'
+    )
+    os = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name='操作系统'
+    )
+    os_version = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name='系统版本'
+    )
+    device = models.CharField(
+        max_length=10,
+        choices=DEVICE_CHOICES,
+        default='other',
+        verbose_name='设备类型'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='首次出现时间'
+    )
+
+    class Meta:
+        db_table = 'user_agent'
+        verbose_name = '用户代理'
+        verbose_name_plural = '用户代理'
+
+    def __str__(self):
+        return self.raw[:50] + "..." if len(self.raw) > 50 else self.raw
+
+
+class LoginRecordQuerySet(models.QuerySet):
+    """
+    登录记录查询集
+
+    视图、后台和 explain_login_queries 命令共用这里的查询形状，
+    保证索引和实际查询一致
+    """
+
+    def for_user(self, user):
+        """某个用户的登录记录"""
+        return self.filter(user=user)
+
+    def since(self, start_time):
+        """某个时间点之后的登录记录"""
+        return self.filter(login_time__gte=start_time)
+
+    def recent_first(self):
+        """按登录时间倒序，同一时间按 id 倒序（与索引顺序一致）"""
+        return self.order_by('-login_time', '-id')
+
+    def keyset_before(self, login_time, pk):
+        """
+        按 (login_time, id) 排在游标之后的记录（时间倒序翻页）
+
+        login_time <= ? 走索引范围扫描，同一时间的记录再按 id 区分
+        """
+        return self.filter(login_time__lte=login_time).filter(
+            Q(login_time__lt=login_time) | Q(id__lt=pk)
+        ).order_by('-login_time', '-id')
+
+    def keyset_after(self, login_time, pk):
+        """按 (login_time, id) 排在游标之前的记录，按时间正序返回（向前翻页）"""
+        return self.filter(login_time__gte=login_time).filter(
+            Q(login_time__gt=login_time) | Q(id__gt=pk)
+        ).order_by('login_time', 'id')
+
+    def stats(self, recent_since):
+        """用一条条件聚合查询计算仪表板的四个统计数字"""
+        return self.aggregate(**self._stats_aggregates(recent_since))
+
+    async def astats(self, recent_since):
+        return await self.aaggregate(**self._stats_aggregates(recent_since))
+
+    @staticmethod
+    def _stats_aggregates(recent_since):
+        return {
+            'total_logins': Count('id'),
+            'recent_logins': Count('id', filter=Q(login_time__gte=recent_since)),
+            'successful_logins': Count('id', filter=Q(is_successful=True)),
+            'failed_logins': Count('id', filter=Q(is_successful=False)),
+        }
+
+
 class LoginRecord(models.Model):
     """
     登录记录模型
@@ -106,17 +256,30 @@ class LoginRecord(models.Model):
         'auth.User',
         on_delete=models.CASCADE,
         related_name='login_records',
+        null=True,
+        blank=True,
+        # 由 (user, -login_time) 复合索引覆盖，不再单独建索引
+        db_index=False,
         verbose_name='用户'
     )
+    username = models.CharField(
+        max_length=150,
+        blank=True,
+        verbose_name='登录账号'
+    )
     ip_address = models.GenericIPAddressField(
         verbose_name='IP地址'
     )
-    user_agent = models.TextField(
-        verbose_name='用户代理',
-        blank=True
+    user_agent = models.ForeignKey(
+        UserAgent,
+        on_delete=models.PROTECT,
+        related_name='login_records',
+        null=True,
+        blank=True,
+        verbose_name='用户代理'
     )
     login_time = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
         verbose_name='登录时间'
     )
     login_method = models.CharField(
@@ -139,15 +302,267 @@ class LoginRecord(models.Model):
         verbose_name='失败原因'
     )
 
+    objects = LoginRecordQuerySet.as_manager()
+
     class Meta:
         db_table = 'login_record'
         verbose_name = '登录记录'
         verbose_name_plural = '登录记录'
         ordering = ['-login_time']
+        indexes = [
+            # 登录记录列表：user = ? AND login_time >= ? ORDER BY login_time DESC, id DESC
+            # （末尾的 id 让键集分页的排序直接由索引给出）
+            # 仪表板：user = ? AND login_time >= ? 的计数
+            models.Index(fields=['user', '-login_time', '-id'], name='login_rec_user_time_idx'),
+            # 仪表板：user = ? AND is_successful = ? 的计数
+            models.Index(fields=['user', 'is_successful'], name='login_rec_user_success_idx'),
+            # 后台 date_hierarchy 和按时间倒序的全表分页（ORDER BY login_time DESC, id DESC）
+            models.Index(fields=['-login_time', '-id'], name='login_rec_time_idx'),
+        ]
 
     def __str__(self):
         status = "成功" if self.is_successful else "失败"
-        return f"{self.user.username} - {self.login_time.strftime('%Y-%m-%d %H:%M:%S')} - {status}"
+        username = self.user.username if self.user_id else (self.username or '未知用户')
+        return f"{username} - {self.login_time.strftime('%Y-%m-%d %H:%M:%S')} - {status}"
+
+
+class LoginStats(models.Model):
+    """
+    用户登录统计
+
+    写入登录记录时增量更新，仪表板只需读取这一行。
+    recent_daily 以本地日期为键保存最近 RECENT_DAYS 天的每日登录次数。
+    """
+    RECENT_DAYS = 30
+
+    user = models.OneToOneField(
+        'auth.User',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='login_stats',
+        verbose_name='用户'
+    )
+    total_logins = models.PositiveIntegerField(
+        default=0,
+        verbose_name='登录总次数'
+    )
+    successful_logins = models.PositiveIntegerField(
+        default=0,
+        verbose_name='成功次数'
+    )
+    failed_logins = models.PositiveIntegerField(
+        default=0,
+        verbose_name='失败次数'
+    )
+    recent_daily = models.JSONField(
+        default=dict,
+        verbose_name='近期每日登录次数'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='更新时间'
+    )
+
+    class Meta:
+        db_table = 'login_stats'
+        verbose_name = '登录统计'
+        verbose_name_plural = '登录统计'
+
+    def __str__(self):
+        return f"{self.user_id} - {self.total_logins}"
+
+    @classmethod
+    def recent_start_date(cls, now=None):
+        """近期统计窗口的起始日期（含）"""
+        now = now or timezone.now()
+        return timezone.localdate(now - timedelta(days=cls.RECENT_DAYS))
+
+    @property
+    def recent_logins(self):
+        """最近 RECENT_DAYS 天的登录次数（按天粒度）"""
+        start = self.recent_start_date().isoformat()
+        return sum(count for day, count in self.recent_daily.items() if day >= start)
+
+    def as_dict(self):
+        """仪表板使用的统计字典"""
+        return {
+            'total_logins': self.total_logins,
+            'recent_logins': self.recent_logins,
+            'successful_logins': self.successful_logins,
+            'failed_logins': self.failed_logins,
+        }
+
+
+class LoginDailyRollup(models.Model):
+    """
+    按用户、按天汇总的登录次数
+
+    原始登录记录超过保留期被归档后，历史统计从这里读取。
+    """
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='login_rollups',
+        # 由 (user, date) 唯一约束覆盖
+        db_index=False,
+        verbose_name='用户'
+    )
+    date = models.DateField(
+        verbose_name='日期'
+    )
+    total_logins = models.PositiveIntegerField(
+        default=0,
+        verbose_name='登录次数'
+    )
+    successful_logins = models.PositiveIntegerField(
+        default=0,
+        verbose_name='成功次数'
+    )
+    failed_logins = models.PositiveIntegerField(
+        default=0,
+        verbose_name='失败次数'
+    )
+
+    class Meta:
+        db_table = 'login_daily_rollup'
+        verbose_name = '每日登录汇总'
+        verbose_name_plural = '每日登录汇总'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='login_rollup_user_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.date} - {self.total_logins}"
+
+
+class BlacklistedToken(models.Model):
+    """
+    已拉黑的 refresh token（按 JTI）
+
+    expires_at 为 token 自身的过期时间，过期后的记录会被自动清理。
+    """
+    jti = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='JTI'
+    )
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name='过期时间'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='拉黑时间'
+    )
+
+    class Meta:
+        db_table = 'jwt_blacklist'
+        verbose_name = 'Token 黑名单'
+        verbose_name_plural = 'Token 黑名单'
+
+    def __str__(self):
+        return self.jti
+
+
+class OutboundEmailQuerySet(models.QuerySet):
+    """待发邮件查询"""
+
+    def due(self, now):
+        """到期待发的邮件，以及租约已过期（发送进程中途退出）的邮件"""
+        return self.filter(
+            Q(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            | Q(status=OutboundEmail.STATUS_SENDING, locked_until__lt=now)
+        )
+
+
+class OutboundEmail(models.Model):
+    """
+    待发邮件（发件箱）
+
+    业务代码只写入一行，由 send_queued_emails 命令的工作线程批量领取、
+    复用 SMTP 连接发送，失败后按指数退避重试，超过最大次数标记为失败。
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '待发送'),
+        (STATUS_SENDING, '发送中'),
+        (STATUS_SENT, '已发送'),
+        (STATUS_FAILED, '发送失败'),
+    ]
+
+    subject = models.CharField(
+        max_length=255,
+        verbose_name='主题'
+    )
+    body = models.TextField(
+        verbose_name='正文'
+    )
+    from_email = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='发件人'
+    )
+    to = models.JSONField(
+        default=list,
+        verbose_name='收件人'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='状态'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='尝试次数'
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='下次尝试时间'
+    )
+    # 领取时写入，租约过期前其它工作线程不会再领取
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='租约到期时间'
+    )
+    claim_token = models.CharField(
+        max_length=32,
+        blank=True,
+        verbose_name='领取标记'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='最近一次错误'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='发送时间'
+    )
+
+    objects = OutboundEmailQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'email_outbox'
+        verbose_name = '待发邮件'
+        verbose_name_plural = '待发邮件'
+        indexes = [
+            # 领取：status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx'),
+            models.Index(fields=['claim_token'], name='email_outbox_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{', '.join(self.to)} - {self.subject}"
 
 
 # 如果需要完全自定义用户模型，可以使用下面的代码
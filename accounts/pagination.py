@@ -0,0 +1,157 @@
+"""
+登录记录分页
+
+    - LoginRecordPagination: 默认沿用页码分页；请求带 paginate=cursor 或 cursor 参数时
+      切换为 (login_time, id) 键集分页，不执行 COUNT(*)，也不用 OFFSET，
+      翻到多深都只是一次索引范围扫描。响应结构不变，count 为 null。
+      apaginate_queryset 是供异步视图使用的版本（异步 ORM），链接和响应与同步版本一致。
+    - BoundedCountPaginator: 后台 changelist 使用，计数最多扫描 count_limit 行。
+"""
+
+import base64
+import binascii
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class LoginRecordPagination(PageNumberPagination):
+    """登录记录列表分页，支持按需切换为键集分页"""
+
+    cursor_query_param = 'cursor'
+    mode_query_param = 'paginate'
+    invalid_cursor_message = '无效的游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        cursor, records = self._keyset_query(queryset, request)
+        return self._keyset_page(list(records[:page_size + 1]), cursor, page_size)
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset 的异步版本，request 为 DRF Request"""
+        self.keyset = (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        if self.keyset:
+            cursor, records = self._keyset_query(queryset, request)
+            return self._keyset_page([record async for record in records[:page_size + 1]], cursor, page_size)
+
+        # 先异步计数并写入分页器，之后的页码计算不再访问数据库
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.__dict__['count'] = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [record async for record in self.page.object_list]
+        return list(self.page)
+
+    def _keyset_query(self, queryset, request):
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return None, queryset.order_by('-login_time', '-id')
+        reverse, login_time, pk = cursor
+        records = queryset.keyset_after(login_time, pk) if reverse \
+            else queryset.keyset_before(login_time, pk)
+        return cursor, records
+
+    def _keyset_page(self, results, cursor, page_size):
+        reverse = cursor is not None and cursor[0]
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page_results = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[0], reverse=True)
+
+    def encode_cursor(self, record, reverse):
+        # record 为模型实例或 values() 行
+        if isinstance(record, dict):
+            login_time, pk = record['login_time'], record['id']
+        else:
+            login_time, pk = record.login_time, record.pk
+        token = f"{'r' if reverse else 'f'}|{login_time.isoformat()}|{pk}"
+        encoded = base64.urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """返回 (reverse, login_time, id)；没有游标时返回 None，游标无效时 404"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, login_time, pk = base64.urlsafe_b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii').split('|')
+            if direction not in ('f', 'r'):
+                raise ValueError(direction)
+            return direction == 'r', datetime.fromisoformat(login_time), int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class BoundedCountPaginator(Paginator):
+    """
+    计数最多扫描 count_limit 行的分页器
+
+    超过上限时按上限计算页数，后台只需要“是否还有更多”，不需要精确总数。
+    """
+
+    def __init__(self, *args, count_limit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_limit = count_limit or getattr(settings, 'LOGIN_RECORD_ADMIN_COUNT_LIMIT', 10000)
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.count_limit].count()
@@ -0,0 +1,132 @@
+"""
+密码校验进程池
+
+开启 PASSWORD_HASH_OFFLOAD 后，登录时的密码哈希计算放到有界进程池中执行，
+异步登录视图 await 结果，慢哈希不会占住处理 /me/、/refresh/ 等 I/O 请求的 worker。
+正在排队和执行的校验数达到 PASSWORD_HASH_POOL_MAX_PENDING 时直接抛出
+PasswordPoolBusy，由视图返回 503，而不是无限堆积。
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordPoolBusy(Exception):
+    """待处理的密码校验过多"""
+
+
+def _init_worker(settings_module):
+    """子进程初始化：以 spawn 方式启动时需要重新加载 Django"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+_dummy_encoded = None
+
+
+def _check_password(password, encoded):
+    """
+    在子进程中校验密码，返回 (是否正确, 需要升级时的新哈希)
+
+    encoded 为 None（用户不存在）时对一个固定的假哈希做一次校验，
+    使响应时间与存在的用户一致。
+    """
+    global _dummy_encoded
+    from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+
+    if encoded is None:
+        if _dummy_encoded is None:
+            _dummy_encoded = make_password(None)
+        check_password(password, _dummy_encoded)
+        return False, None
+
+    if not check_password(password, encoded):
+        return False, None
+
+    # 与 Django 的 check_password(setter=...) 相同的升级条件
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return True, None
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        return True, make_password(password)
+    return True, None
+
+
+class PasswordPool:
+    """有界的密码校验进程池"""
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = self.max_workers * 4 if max_pending is None else max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        initializer=_init_worker,
+                        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'settings'),),
+                    )
+        return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordPoolBusy(f'待处理的密码校验已达上限 {self.max_pending}')
+            self.pending += 1
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+
+    async def acheck_password(self, password, encoded):
+        """异步校验密码，返回 (是否正确, 需要升级时的新哈希)"""
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            # 计入的是等待时间（含排队），哈希本身在子进程中执行
+            with timed('password_hash'):
+                return await loop.run_in_executor(self._get_executor(), _check_password, password, encoded)
+        finally:
+            self._release()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_password_pool():
+    """获取进程内共享的密码校验进程池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordPool(
+                    max_workers=getattr(settings, 'PASSWORD_HASH_POOL_SIZE', None),
+                    max_pending=getattr(settings, 'PASSWORD_HASH_POOL_MAX_PENDING', None),
+                )
+    return _pool
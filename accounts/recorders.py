@@ -0,0 +1,213 @@
+"""
+登录记录写入器
+
+登录请求只负责把登录记录放入内存缓冲区，由后台线程按数量或时间阈值
+批量 bulk_create 落库，进程退出时保证把剩余记录刷写完毕。
+设置 LOGIN_RECORD_ASYNC = False 时退回到同步逐条写入。
+
+写入失败时：
+    - 数据库暂时不可用（连接断开、database is locked 等）：整批放回缓冲区，
+      按指数退避重试，缓冲区仍受 max_buffer 限制
+    - 个别记录违反约束（外键、非空等）：改为逐条写入，只丢弃出错的记录
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DataError, DatabaseError, IntegrityError, close_old_connections, transaction
+
+from .models import LoginRecord
+from .stats import update_login_stats
+from .user_agents import intern_user_agent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BUFFER = 50000
+# 数据库不可用时重试间隔的上限（秒）
+MAX_RETRY_DELAY = 60.0
+
+
+class LoginRecordWriter:
+    """
+    缓冲式登录记录写入器
+
+    - 缓冲区达到 batch_size 时唤醒后台线程立即刷写
+    - 否则每隔 flush_interval 秒刷写一次
+    - 数据库不可用时记录放回缓冲区，按 flush_interval 的指数倍退避重试
+    - 缓冲区超过 max_buffer（例如数据库长时间不可用）时丢弃最旧的记录
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_buffer=DEFAULT_MAX_BUFFER):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self.failures = 0
+        self._retry_at = 0.0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def submit(self, record):
+        """放入一条未保存的 LoginRecord 实例"""
+        with self._lock:
+            if self._stopping:
+                # 已经在关闭流程中，直接同步写入
+                stopped = True
+            else:
+                stopped = False
+                self._buffer.append(record)
+                self._trim()
+                if len(self._buffer) >= self.batch_size:
+                    self._wakeup.set()
+                self._ensure_thread()
+        if stopped:
+            self._write([record])
+
+    def pending(self):
+        """当前缓冲区中尚未落库的记录数"""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self, force=False):
+        """把缓冲区中的记录全部写入数据库，返回写入条数；退避期间不写入，除非 force"""
+        with self._flush_lock:
+            if not force and time.monotonic() < self._retry_at:
+                return 0
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return 0
+            return self._write(records)
+
+    def shutdown(self, timeout=None):
+        """停止后台线程并刷写剩余记录"""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush(force=True)
+
+    def _trim(self):
+        # 调用方需持有 self._lock
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+            logger.warning("登录记录缓冲区已满，丢弃 %d 条记录", overflow)
+
+    def _insert(self, records):
+        try:
+            with transaction.atomic():
+                LoginRecord.objects.bulk_create(records, batch_size=self.batch_size)
+                # bulk_create 不会发送 post_save，这里直接累加统计
+                update_login_stats(records)
+        except DatabaseError:
+            # 事务已回滚，bulk_create 可能已经填了主键，恢复为未保存状态以便重试
+            for record in records:
+                record.pk = None
+                record._state.adding = True
+            raise
+
+    def _write(self, records):
+        try:
+            self._insert(records)
+        except (IntegrityError, DataError) as e:
+            logger.warning("批量写入登录记录失败，改为逐条写入: %s", e)
+            return self._write_each(records)
+        except DatabaseError as e:
+            self._retry_later(records, e)
+            return 0
+        self.failures = 0
+        return len(records)
+
+    def _write_each(self, records):
+        written = 0
+        for index, record in enumerate(records):
+            try:
+                self._insert([record])
+            except (IntegrityError, DataError) as e:
+                self.dropped += 1
+                logger.error("登录记录无法写入，已丢弃: %s", e)
+            except DatabaseError as e:
+                self._retry_later(records[index:], e)
+                return written
+            else:
+                written += 1
+        self.failures = 0
+        return written
+
+    def _retry_later(self, records, error):
+        """把写入失败的记录放回缓冲区头部，按指数退避推迟下次刷写"""
+        self.failures += 1
+        delay = min(self.flush_interval * 2 ** (self.failures - 1), MAX_RETRY_DELAY)
+        self._retry_at = time.monotonic() + delay
+        logger.error("写入登录记录失败，%d 条记录 %.1f 秒后重试: %s", len(records), delay, error)
+        with self._lock:
+            self._buffer[:0] = records
+            self._trim()
+
+    def _ensure_thread(self):
+        # 调用方需持有 self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='login-record-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                close_old_connections()
+                self.flush()
+                if self._stopping:
+                    break
+        finally:
+            close_old_connections()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """获取进程内共享的登录记录写入器"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LoginRecordWriter(
+                    batch_size=getattr(settings, 'LOGIN_RECORD_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                    flush_interval=getattr(settings, 'LOGIN_RECORD_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                    max_buffer=getattr(settings, 'LOGIN_RECORD_MAX_BUFFER', DEFAULT_MAX_BUFFER),
+                )
+                atexit.register(_writer.shutdown)
+    return _writer
+
+
+def record_login(**fields):
+    """
+    记录一次登录尝试
+
+    fields 为 LoginRecord 的字段值；user 可以为 None（未知用户的失败登录），
+    user_agent 可以直接传 UA 字符串，写入前换成去重后的 UserAgent 行。
+    """
+    if isinstance(fields.get('user_agent'), str):
+        fields['user_agent'] = intern_user_agent(fields['user_agent'])
+    if getattr(settings, 'LOGIN_RECORD_ASYNC', False):
+        get_writer().submit(LoginRecord(**fields))
+    else:
+        LoginRecord.objects.create(**fields)
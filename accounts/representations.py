@@ -0,0 +1,98 @@
+"""
+只读接口的快速序列化
+
+登录响应、/me/、/profile/ GET、仪表板和 /login-records/ 列表只输出数据，用不到 DRF 序列化器的
+字段声明、校验和逐字段 get_attribute。这里的函数直接从模型属性（登录记录则从 values() 行）
+一次拼出普通 dict，输出与对应的序列化器逐字节一致（tests 中有对照测试）：
+    - user_representation      UserSimpleSerializer
+    - profile_representation   UserProfileSerializer
+    - login_record_rows        LoginRecordSerializer(many=True)，输入为 login_record_values() 的行
+日期时间仍交给 DRF 字段的 to_representation，遵循 REST_FRAMEWORK['DATETIME_FORMAT'] 和当前时区。
+修改上述序列化器的字段时要同步修改这里。
+"""
+
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import serializers
+
+from .avatars import avatar_url, variant_urls
+from .metrics import timed
+
+LOGIN_RECORD_VALUES = (
+    'id', 'user__username', 'ip_address', 'user_agent__raw',
+    'login_time', 'login_method', 'is_successful', 'failure_reason',
+)
+
+_datetime = serializers.DateTimeField().to_representation
+_date = serializers.DateField().to_representation
+
+
+def profile_representation(profile, request=None):
+    """与 UserProfileSerializer(profile, context={'request': request}).data 相同"""
+    with timed('serializer'):
+        user = profile.user
+        return {
+            'username': user.username,
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'avatar': avatar_url(profile, request),
+            'avatar_status': profile.avatar_status,
+            'avatar_variants': variant_urls(profile, request),
+            'phone': profile.phone,
+            'birth_date': _date(profile.birth_date),
+            'bio': profile.bio,
+            'location': profile.location,
+            'website': profile.website,
+            'gender': profile.gender,
+            'is_verified': profile.is_verified,
+            'age': profile.age,
+            'full_name': profile.get_full_name(),
+            'created_at': _datetime(profile.created_at),
+            'updated_at': _datetime(profile.updated_at),
+            'date_joined': _datetime(user.date_joined),
+            'last_login': _datetime(user.last_login),
+        }
+
+
+def user_representation(user, request=None):
+    """与 UserSimpleSerializer(user, context={'request': request}).data 相同；没有资料时 profile 为 None"""
+    with timed('serializer'):
+        try:
+            profile = profile_representation(user.profile, request)
+        except ObjectDoesNotExist:
+            profile = None
+        return {
+            'id': user.pk,
+            'username': user.username,
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'is_active': user.is_active,
+            'date_joined': _datetime(user.date_joined),
+            'last_login': _datetime(user.last_login),
+            'profile': profile,
+        }
+
+
+def login_record_values(queryset):
+    """登录记录查询集只取列表需要的列（用户名和 UA 通过 JOIN 取出）"""
+    return queryset.values(*LOGIN_RECORD_VALUES)
+
+
+def login_record_rows(rows):
+    """与 LoginRecordSerializer(records, many=True).data 相同，rows 为 login_record_values() 的行"""
+    with timed('serializer'):
+        data = []
+        for row in rows:
+            item = {'id': row['id']}
+            # 未关联用户的记录（尝试登录不存在的账号）和序列化器一样不输出 username
+            if row['user__username'] is not None:
+                item['username'] = row['user__username']
+            item['ip_address'] = row['ip_address']
+            item['user_agent'] = row['user_agent__raw'] or ''
+            item['login_time'] = _datetime(row['login_time'])
+            item['login_method'] = row['login_method']
+            item['is_successful'] = row['is_successful']
+            item['failure_reason'] = row['failure_reason']
+            data.append(item)
+        return data
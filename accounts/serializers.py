@@ -7,11 +7,23 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
 import re
 
+from .avatars import avatar_url, clear_avatar, schedule_avatar, validate_avatar, variant_urls
+from .cache import invalidate_user
+from .metrics import timed
 from .models import UserProfile, LoginRecord
 
 
+class TimedRepresentationMixin:
+    """输出序列化耗时计入请求指标（嵌套的序列化器只计最外层）"""
+
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """
     用户注册序列化器
@@ -35,6 +47,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('username', 'email', 'password', 'password_confirm', 'first_name', 'last_name')
+        # 唯一性已在 validate_username 中检查，去掉模型自带的 UniqueValidator，避免重复查询
+        extra_kwargs = {'username': {'validators': []}}
 
     def validate_username(self, value):
         """验证用户名"""
@@ -48,8 +62,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return value
 
     def validate_email(self, value):
-        """验证邮箱"""
-        if User.objects.filter(email=value).exists():
+        """验证邮箱（不区分大小写，与邮箱登录和 LOWER(email) 索引一致）"""
+        if User.objects.annotate(email_lower=Lower('email')).filter(email_lower=value.lower()).exists():
             raise serializers.ValidationError("邮箱已被注册")
         return value
 
@@ -83,15 +97,14 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             last_name=validated_data.get('last_name', '')
         )
         
-        # 创建用户扩展信息
-        UserProfile.objects.create(user=user)
+        # 用户扩展信息由 post_save 信号 create_user_profile 创建
         
         return user
 
 
-class UserLoginSerializer(serializers.Serializer):
+class LoginCredentialsSerializer(serializers.Serializer):
     """
-    用户登录序列化器
+    登录凭据字段校验（不做认证）
     """
     username = serializers.CharField(
         max_length=150,
@@ -103,30 +116,24 @@ class UserLoginSerializer(serializers.Serializer):
         help_text='密码'
     )
 
+
+class UserLoginSerializer(LoginCredentialsSerializer):
+    """
+    用户登录序列化器
+    """
+
     def validate(self, attrs):
         """验证登录信息"""
         username = attrs.get('username')
         password = attrs.get('password')
 
         if username and password:
-            # 尝试使用用户名登录
+            # UsernameOrEmailBackend 一次查询解析用户名或邮箱，密码只校验一次
             user = authenticate(
                 request=self.context.get('request'),
                 username=username,
                 password=password
             )
-            
-            # 如果用户名登录失败，尝试使用邮箱登录
-            if not user:
-                try:
-                    user_obj = User.objects.get(email=username)
-                    user = authenticate(
-                        request=self.context.get('request'),
-                        username=user_obj.username,
-                        password=password
-                    )
-                except User.DoesNotExist:
-                    pass
 
             if not user:
                 msg = '用户名/邮箱或密码错误'
@@ -143,7 +150,7 @@ class UserLoginSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code='authorization')
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """
     用户资料序列化器
     """
@@ -155,16 +162,26 @@ class UserProfileSerializer(serializers.ModelSerializer):
     last_login = serializers.DateTimeField(source='user.last_login', read_only=True)
     age = serializers.ReadOnlyField()
     full_name = serializers.CharField(source='get_full_name', read_only=True)
+    avatar = serializers.SerializerMethodField()
+    avatar_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
         fields = (
             'username', 'email', 'first_name', 'last_name',
-            'avatar', 'phone', 'birth_date', 'bio', 'location', 
+            'avatar', 'avatar_status', 'avatar_variants', 'phone', 'birth_date', 'bio', 'location', 
             'website', 'gender', 'is_verified', 'age', 'full_name',
             'created_at', 'updated_at', 'date_joined', 'last_login'
         )
-        read_only_fields = ('is_verified', 'created_at', 'updated_at')
+        read_only_fields = ('avatar_status', 'is_verified', 'created_at', 'updated_at')
+
+    def get_avatar(self, obj):
+        """处理完成的头像地址；处理中或失败时不输出原始上传文件"""
+        return avatar_url(obj, self.context.get('request'))
+
+    def get_avatar_variants(self, obj):
+        """各尺寸、各格式缩略图的地址"""
+        return variant_urls(obj, self.context.get('request'))
 
 
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
@@ -181,18 +198,45 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
             'website', 'gender', 'first_name', 'last_name'
         )
 
+    def validate_avatar(self, value):
+        """按图片内容校验头像（格式、大小、像素尺寸）"""
+        if value:
+            try:
+                validate_avatar(value)
+            except ValidationError as e:
+                raise serializers.ValidationError(list(e.messages))
+        return value
+
     def update(self, instance, validated_data):
         """更新用户资料"""
+        # 新头像交给后台生成缩略图；删除头像时一并删除缩略图
+        avatar_uploaded = False
+        if 'avatar' in validated_data:
+            if validated_data['avatar']:
+                validated_data['avatar_status'] = UserProfile.AVATAR_PENDING
+                avatar_uploaded = True
+            else:
+                clear_avatar(instance)
+                validated_data['avatar_status'] = ''
+                validated_data['avatar_variants'] = {}
+
         # 处理用户基本信息
         user_data = validated_data.pop('user', {})
-        for attr, value in user_data.items():
-            setattr(instance.user, attr, value)
-        instance.user.save()
-
-        # 处理用户扩展信息
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        if user_data:
+            for attr, value in user_data.items():
+                setattr(instance.user, attr, value)
+            instance.user.save(update_fields=list(user_data))
+
+        # 处理用户扩展信息，只更新提交的字段
+        if validated_data:
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save(update_fields=[*validated_data, 'updated_at'])
+        if avatar_uploaded:
+            schedule_avatar(instance)
+
+        # 失效 /me/、/profile/、/dashboard/ 的缓存响应
+        invalidate_user(instance.user_id)
 
         return instance
 
@@ -245,15 +289,16 @@ class ChangePasswordSerializer(serializers.Serializer):
         """保存新密码"""
         user = self.context['request'].user
         user.set_password(self.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         return user
 
 
-class LoginRecordSerializer(serializers.ModelSerializer):
+class LoginRecordSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """
     登录记录序列化器
     """
     username = serializers.CharField(source='user.username', read_only=True)
+    user_agent = serializers.CharField(source='user_agent.raw', default='', read_only=True)
 
     class Meta:
         model = LoginRecord
@@ -264,7 +309,7 @@ class LoginRecordSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'username', 'login_time')
 
 
-class UserSimpleSerializer(serializers.ModelSerializer):
+class UserSimpleSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """
     用户简单信息序列化器
     """
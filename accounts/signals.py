@@ -3,40 +3,77 @@
 """
 
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 
-from .models import UserProfile
+from .authentication import invalidate_cached_user
+from .cache import invalidate_user
+from .models import UserProfile, LoginRecord, LoginStats
+from .stats import update_login_stats
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
     """
-    用户创建时自动创建用户资料
+    用户创建时自动创建用户资料（唯一创建用户资料的地方）
     """
-    if created:
+    if created and not raw:
         try:
             UserProfile.objects.create(user=instance)
-            logger.info(f"为用户 {instance.username} 创建了用户资料")
+            logger.info("为用户 %s 创建了用户资料", instance.username)
         except Exception as e:
-            logger.error(f"创建用户资料失败: {e}")
+            logger.error("创建用户资料失败: %s", e)
 
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """
-    用户保存时保存用户资料
+    用户保存时失效缓存响应和认证缓存（停用账户、修改密码等）
+
+    不再连带保存用户资料：登录只更新 last_login，不应写 user_profile；
+    用户资料由各自的更新入口单独保存。
+    """
+    invalidate_user(instance.pk)
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def delete_user_caches(sender, instance, **kwargs):
+    """
+    用户删除时清除缓存
+    """
+    invalidate_user(instance.pk)
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_cache(sender, instance, **kwargs):
+    """
+    用户资料保存时失效该用户的缓存响应
+    """
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=LoginStats)
+def invalidate_stats_cache(sender, instance, **kwargs):
+    """
+    登录统计变化时失效该用户的缓存响应（仪表板）
+    """
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=LoginRecord)
+def update_login_stats_on_record(sender, instance, created, raw=False, **kwargs):
+    """
+    单条写入登录记录时增量更新登录统计
+    （批量写入由 LoginRecordWriter 负责）
     """
-    try:
-        if hasattr(instance, 'profile'):
-            instance.profile.save()
-    except UserProfile.DoesNotExist:
-        # 如果用户资料不存在，创建一个
-        UserProfile.objects.create(user=instance)
+    if created and not raw:
+        update_login_stats([instance])
 
 
 @receiver(user_logged_in)
@@ -44,7 +81,7 @@ def user_logged_in_handler(sender, request, user, **kwargs):
     """
     用户登录信号处理
     """
-    logger.info(f"用户登录信号: {user.username} from {request.META.get('REMOTE_ADDR', 'unknown')}")
+    logger.info("用户登录信号: %s from %s", user.username, request.META.get('REMOTE_ADDR', 'unknown'))
 
 
 @receiver(user_logged_out)
@@ -53,6 +90,6 @@ def user_logged_out_handler(sender, request, user, **kwargs):
     用户注销信号处理
     """
     if user:
-        logger.info(f"用户注销信号: {user.username}")
+        logger.info("用户注销信号: %s", user.username)
     else:
         logger.info("匿名用户注销") 
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+SQLite 数据库后端
+
+与 Django 自带后端相同，只增加 OPTIONS['transaction_mode']（Django 5.1 起内置的同名选项）：
+设为 IMMEDIATE 时 atomic() 以 BEGIN IMMEDIATE 开始事务，进入事务时就取得写锁。
+默认的 BEGIN（DEFERRED）在事务中先读后写时需要把读锁升级为写锁，其他连接刚提交过
+写入时升级会立即失败（database is locked），不会等待 busy_timeout；
+IMMEDIATE 让并发写入在 BEGIN 处排队等待。
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        mode = params.pop('transaction_mode', None)
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode 只能是 {", ".join(TRANSACTION_MODES)}，当前为 {mode}'
+            )
+        self.transaction_mode = mode.upper() if mode else None
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            self.cursor().execute('BEGIN')
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
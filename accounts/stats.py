@@ -0,0 +1,191 @@
+"""
+用户登录统计
+
+写入登录记录时增量维护 LoginStats，仪表板读取一行即可得到统计数字；
+统计行不存在或关闭计数器时，退回到一条条件聚合查询。
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import invalidate_user
+from .models import LoginDailyRollup, LoginRecord, LoginStats
+
+logger = logging.getLogger(__name__)
+
+# 已归档的每日汇总行的合计
+ARCHIVED_AGGREGATES = {
+    'total_logins': Sum('total_logins'),
+    'successful_logins': Sum('successful_logins'),
+    'failed_logins': Sum('failed_logins'),
+}
+
+
+def _summarize(records):
+    """按用户汇总一批登录记录的增量"""
+    deltas = defaultdict(lambda: {'total': 0, 'successful': 0, 'failed': 0, 'daily': defaultdict(int)})
+    for record in records:
+        if not record.user_id:
+            continue
+        delta = deltas[record.user_id]
+        delta['total'] += 1
+        if record.is_successful:
+            delta['successful'] += 1
+        else:
+            delta['failed'] += 1
+        delta['daily'][timezone.localdate(record.login_time).isoformat()] += 1
+    return deltas
+
+
+def _apply(stats, delta, start):
+    stats.total_logins += delta['total']
+    stats.successful_logins += delta['successful']
+    stats.failed_logins += delta['failed']
+    daily = {day: count for day, count in stats.recent_daily.items() if day >= start}
+    for day, count in delta['daily'].items():
+        if day >= start:
+            daily[day] = daily.get(day, 0) + count
+    stats.recent_daily = daily
+
+
+def update_login_stats(records):
+    """
+    把一批新写入的登录记录累加到对应用户的统计行上
+
+    未关联用户的记录（未知用户的失败登录）不计入统计。
+    """
+    deltas = _summarize(records)
+    if not deltas:
+        return
+    start = LoginStats.recent_start_date().isoformat()
+    for user_id, delta in deltas.items():
+        try:
+            with transaction.atomic():
+                stats = LoginStats.objects.select_for_update().filter(user_id=user_id).first()
+                if stats is None:
+                    stats = LoginStats(user_id=user_id)
+                    _apply(stats, delta, start)
+                    stats.save(force_insert=True)
+                else:
+                    _apply(stats, delta, start)
+                    stats.save()
+        except IntegrityError:
+            # 并发创建了同一用户的统计行，重试一次走更新分支
+            with transaction.atomic():
+                stats = LoginStats.objects.select_for_update().get(user_id=user_id)
+                _apply(stats, delta, start)
+                stats.save()
+
+
+def get_login_stats(user):
+    """
+    获取仪表板使用的登录统计
+
+    优先读取增量维护的统计行；LOGIN_STATS_USE_COUNTERS 为 False 或统计行
+    不存在时，用一条条件聚合查询现算。
+    """
+    if getattr(settings, 'LOGIN_STATS_USE_COUNTERS', True):
+        stats = LoginStats.objects.filter(user=user).first()
+        if stats is not None:
+            return stats.as_dict()
+    stats = LoginRecord.objects.for_user(user).stats(
+        recent_since=timezone.now() - timedelta(days=LoginStats.RECENT_DAYS)
+    )
+    # 已归档的记录只剩每日汇总行；保留期长于近期窗口，近期次数不受影响
+    archived = LoginDailyRollup.objects.filter(user=user).aggregate(**ARCHIVED_AGGREGATES)
+    return _add_archived(stats, archived)
+
+
+async def aget_login_stats(user):
+    """get_login_stats 的异步版本（异步 ORM）"""
+    if getattr(settings, 'LOGIN_STATS_USE_COUNTERS', True):
+        stats = await LoginStats.objects.filter(user=user).afirst()
+        if stats is not None:
+            return stats.as_dict()
+    stats = await LoginRecord.objects.for_user(user).astats(
+        recent_since=timezone.now() - timedelta(days=LoginStats.RECENT_DAYS)
+    )
+    archived = await LoginDailyRollup.objects.filter(user=user).aaggregate(**ARCHIVED_AGGREGATES)
+    return _add_archived(stats, archived)
+
+
+def _add_archived(stats, archived):
+    for key, value in archived.items():
+        stats[key] += value or 0
+    return stats
+
+
+def rebuild_login_stats(user_ids=None, batch_size=1000):
+    """
+    根据原始登录记录和已归档的每日汇总重新计算统计行，返回重建的用户数
+
+    user_ids 为空时重建所有有登录记录的用户。
+    """
+    records = LoginRecord.objects.exclude(user=None)
+    rollups = LoginDailyRollup.objects.all()
+    if user_ids is not None:
+        records = records.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+    all_ids = sorted(
+        set(records.values_list('user_id', flat=True).distinct())
+        | set(rollups.values_list('user_id', flat=True).distinct())
+    )
+    start_date = LoginStats.recent_start_date()
+    tz = timezone.get_current_timezone()
+
+    if user_ids is not None:
+        # 已经没有登录记录的用户直接清掉统计行
+        LoginStats.objects.filter(user_id__in=user_ids).exclude(user_id__in=all_ids).delete()
+
+    rebuilt = 0
+    for offset in range(0, len(all_ids), batch_size):
+        chunk = all_ids[offset:offset + batch_size]
+        chunk_records = LoginRecord.objects.filter(user_id__in=chunk)
+        totals = defaultdict(lambda: {'total': 0, 'successful': 0, 'failed': 0})
+        for row in chunk_records.order_by().values('user_id').annotate(
+            total=Count('id'),
+            successful=Count('id', filter=Q(is_successful=True)),
+            failed=Count('id', filter=Q(is_successful=False)),
+        ).union(
+            LoginDailyRollup.objects.filter(user_id__in=chunk).order_by().values('user_id').annotate(
+                total=Sum('total_logins'),
+                successful=Sum('successful_logins'),
+                failed=Sum('failed_logins'),
+            ),
+            all=True,
+        ):
+            for key in ('total', 'successful', 'failed'):
+                totals[row['user_id']][key] += row[key]
+        daily = defaultdict(dict)
+        recent = chunk_records.order_by().filter(
+            login_time__gte=timezone.now() - timedelta(days=LoginStats.RECENT_DAYS + 1)
+        ).annotate(day=TruncDate('login_time', tzinfo=tz)).values('user_id', 'day').annotate(n=Count('id'))
+        for row in recent:
+            if row['day'] >= start_date:
+                daily[row['user_id']][row['day'].isoformat()] = row['n']
+
+        rows = [
+            LoginStats(
+                user_id=user_id,
+                total_logins=row['total'],
+                successful_logins=row['successful'],
+                failed_logins=row['failed'],
+                recent_daily=daily.get(user_id, {}),
+            )
+            for user_id, row in totals.items()
+        ]
+        with transaction.atomic():
+            LoginStats.objects.filter(user_id__in=chunk).delete()
+            LoginStats.objects.bulk_create(rows)
+        for user_id in chunk:
+            invalidate_user(user_id)
+        rebuilt += len(rows)
+        logger.info("已重建 %d/%d 个用户的登录统计", rebuilt, len(all_ids))
+    return rebuilt
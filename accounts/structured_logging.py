@@ -0,0 +1,192 @@
+"""
+非阻塞的结构化日志
+
+settings.LOGGING_CONFIG 指向 configure_logging：按 LOGGING 配置完日志后，如果 LOG_QUEUE['ENABLED']，
+把 LOGGING['loggers'] 中各个日志器（以及根日志器）原有的处理器换成同一个有界队列上的
+BoundedQueueHandler，由一个后台线程（RoutingQueueListener）把记录交给原来的处理器写文件和控制台。
+请求线程只做一次 put_nowait：
+    - 队列满时直接丢弃并计数（accounts_log_records_dropped_total{reason="queue_full"}），
+      日志永远不会阻塞请求
+    - 消息不在请求线程中格式化：logger.info("...: %s", value) 的 %s 和 extra 中的可调用对象
+      都在后台线程写出时才求值（因此不要在参数里传之后还会修改的对象）
+    - LOG_QUEUE['SAMPLING'] 按日志器和消息模板抽样，例如 {'accounts.views': {'用户登录成功: %s': 10}}
+      表示每 10 条保留 1 条，'*' 匹配该日志器的所有消息，规则对子日志器同样生效；
+      WARNING 及以上级别不抽样。被抽掉的记录计入 reason="sampled"，保留的记录带 sample_rate 字段
+
+JSONFormatter 把记录输出为一行 JSON，配合 RotatingFileHandler 按大小轮转。
+多进程部署时每个进程各自轮转同一个文件会互相干扰，应让每个进程写不同的文件，或只输出到控制台。
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.config
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAXSIZE': 10000,
+    'SAMPLING': {},
+}
+
+# LogRecord 自带的属性，其余属性都是 extra 传入的字段
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_log_queue_conf():
+    return {**DEFAULTS, **getattr(settings, 'LOG_QUEUE', {})}
+
+
+def count_dropped(record, reason):
+    """记录一条被丢弃的日志"""
+    # 日志在应用加载前就已配置，这里才导入指标模块
+    from accounts.metrics import get_exporter
+    get_exporter().registry.inc('accounts_log_records_dropped_total', (record.name, reason))
+
+
+class JSONFormatter(logging.Formatter):
+    """一条记录输出一行 JSON；extra 中的可调用对象在格式化时才调用"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+        }
+        for key, value in record.__dict__.items():
+            if key in RESERVED_ATTRS or key.startswith('_'):
+                continue
+            data[key] = value() if callable(value) else value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """按日志器和消息模板抽样，每 N 条保留 1 条"""
+
+    def __init__(self, rules=None):
+        super().__init__()
+        self.rules = rules or {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get_rate(self, record):
+        name = record.name
+        while name:
+            rule = self.rules.get(name)
+            if rule:
+                rate = rule.get(record.msg) if isinstance(record.msg, str) else None
+                rate = rate or rule.get('*')
+                if rate:
+                    return rate
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rules:
+            return True
+        rate = self.get_rate(record)
+        if rate is None or rate <= 1:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else '*')
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, itertools.count())
+        # itertools.count 的 next() 在 CPython 中是原子的
+        if next(counter) % rate:
+            count_dropped(record, 'sampled')
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """把记录连同原来的处理器放进有界队列，队列满时丢弃"""
+
+    def __init__(self, log_queue, targets):
+        super().__init__(log_queue)
+        self.targets = tuple(targets)
+
+    def handle(self, record):
+        # 队列本身是线程安全的，不需要处理器锁
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def prepare(self, record):
+        # 不格式化，留给后台线程
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait((self.targets, record))
+        except queue.Full:
+            count_dropped(record, 'queue_full')
+
+
+class RoutingQueueListener(QueueListener):
+    """后台线程：把每条记录交给它原来的处理器"""
+
+    def handle(self, item):
+        targets, record = item
+        for handler in targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def enqueue_sentinel(self):
+        # 队列满时也要等到停止标记放进去，保证已排队的记录全部写出
+        self.queue.put(self._sentinel)
+
+
+def install_queue(logger_names, conf):
+    """把这些日志器的处理器换成队列处理器，并启动后台线程"""
+    global _listener
+    with _listener_lock:
+        stop_listener()
+        log_queue = queue.Queue(conf['MAXSIZE'])
+        sampling = SamplingFilter(conf['SAMPLING'])
+        for name in logger_names:
+            logger = logging.getLogger(name)
+            if not logger.handlers:
+                continue
+            handler = BoundedQueueHandler(log_queue, logger.handlers)
+            handler.addFilter(sampling)
+            logger.handlers = [handler]
+        _listener = RoutingQueueListener(log_queue)
+        _listener.start()
+    return _listener
+
+
+@atexit.register
+def stop_listener():
+    """停止后台线程，写出队列中剩余的记录"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(logging_settings):
+    """settings.LOGGING_CONFIG：按 LOGGING 配置日志，按需切换到队列模式"""
+    logging.config.dictConfig(logging_settings)
+    conf = get_log_queue_conf()
+    if conf['ENABLED']:
+        install_queue([None, *logging_settings.get('loggers', {})], conf)
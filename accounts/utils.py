@@ -2,21 +2,22 @@
 工具函数
 """
 
+import logging
 import re
-from django.core.mail import send_mail
-from django.conf import settings
+
+from .client_ip import get_resolver
+from .mailer import enqueue_email
+
+logger = logging.getLogger(__name__)
 
 
 def get_client_ip(request):
     """
     获取客户端IP地址
+
+    只在直连地址属于 TRUSTED_PROXIES 时采用 X-Forwarded-For（见 client_ip.py）
     """
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    return get_resolver().resolve(request.META)
 
 
 def get_user_agent(request):
@@ -36,7 +37,7 @@ def validate_phone_number(phone):
 
 def send_verification_email(user, verification_code):
     """
-    发送验证邮件
+    发送验证邮件（写入发件箱，由 send_queued_emails 命令异步发送）
     """
     subject = '账户验证'
     message = f'''
@@ -54,22 +55,16 @@ def send_verification_email(user, verification_code):
     '''
     
     try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
+        enqueue_email(subject, message, [user.email])
         return True
     except Exception as e:
-        print(f"邮件发送失败: {e}")
+        logger.error("邮件加入发送队列失败: %s", e)
         return False
 
 
 def send_password_reset_email(user, reset_link):
     """
-    发送密码重置邮件
+    发送密码重置邮件（写入发件箱，由 send_queued_emails 命令异步发送）
     """
     subject = '密码重置'
     message = f'''
@@ -88,16 +83,10 @@ def send_password_reset_email(user, reset_link):
     '''
     
     try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
+        enqueue_email(subject, message, [user.email])
         return True
     except Exception as e:
-        print(f"邮件发送失败: {e}")
+        logger.error("邮件加入发送队列失败: %s", e)
         return False
 
 
@@ -3,18 +3,23 @@
 """
 
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout
 from django.utils import timezone
 from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 
 from .models import UserProfile, LoginRecord
 from .serializers import (
@@ -26,6 +31,18 @@ from .serializers import (
     LoginRecordSerializer,
     UserSimpleSerializer
 )
+from .blacklist import blacklist_token, is_blacklisted
+from .cache import cached_response, get_response_cache
+from .client_ip import UNKNOWN_IP, TrustedNetworks, parse_ip
+from .db import replica_reads
+from .export import EXPORT_FORMATS, export_rows, iter_export, parse_flag, parse_time_bound
+from .importer import UserImporter, open_users
+from .metrics import get_exporter, get_metrics_conf
+from .pagination import LoginRecordPagination
+from .recorders import record_login
+from .representations import login_record_rows, login_record_values, profile_representation, user_representation
+from .stats import get_login_stats
+from .throttling import get_login_throttle
 from .utils import get_client_ip, get_user_agent
 
 logger = logging.getLogger(__name__)
@@ -49,7 +66,7 @@ class UserRegistrationView(generics.CreateAPIView):
             user = serializer.save()
             
             # 记录注册日志
-            logger.info(f"用户注册成功: {user.username} ({user.email})")
+            logger.info("用户注册成功: %s (%s)", user.username, user.email)
             
             # 生成JWT token
             refresh = RefreshToken.for_user(user)
@@ -79,63 +96,123 @@ class UserLoginView(APIView):
 
     def post(self, request):
         """用户登录"""
+        throttled = self.check_throttle(request, request.data.get('username', ''))
+        if throttled is not None:
+            response = Response(self.throttled_payload(throttled), status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(throttled.retry_after)
+            return response
+
         serializer = UserLoginSerializer(data=request.data, context={'request': request})
         
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            
-            # 记录登录信息
-            self._record_login(request, user, True)
-            
-            # 更新最后登录时间
-            user.last_login = timezone.now()
-            user.save(update_fields=['last_login'])
-            
-            # 生成JWT token
-            refresh = RefreshToken.for_user(user)
-            
-            # 获取用户资料
-            try:
-                profile = user.profile
-            except UserProfile.DoesNotExist:
-                # 如果用户没有资料，创建一个
-                profile = UserProfile.objects.create(user=user)
-            
-            logger.info(f"用户登录成功: {user.username}")
-            
-            return Response({
-                'message': '登录成功',
-                'user': UserSimpleSerializer(user).data,
-                'tokens': {
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                }
-            }, status=status.HTTP_200_OK)
+            return Response(self.login_succeeded(request, user), status=status.HTTP_200_OK)
         else:
-            # 记录登录失败
             username = request.data.get('username', '')
-            self._record_login(request, None, False, '登录信息验证失败')
-            
-            logger.warning(f"用户登录失败: {username} - {serializer.errors}")
-            
-            return Response({
-                'message': '登录失败',
-                'errors': serializer.errors
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                self.login_failed(request, username, serializer.errors),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def check_throttle(self, request, username):
+        """在校验密码之前检查登录限流，被拒绝时返回 Throttled(scope, retry_after)"""
+        throttle = get_login_throttle()
+        if throttle is None:
+            return None
+        try:
+            throttled = throttle.check(get_client_ip(request), username)
+        except Exception as e:
+            logger.warning("登录限流检查失败: %s", e)
+            return None
+        if throttled is not None:
+            logger.warning("登录请求被限流: %s (%s, %ss)", username, throttled.scope, throttled.retry_after)
+        return throttled
+
+    @staticmethod
+    def throttled_payload(throttled):
+        """被限流时的响应数据"""
+        return {
+            'message': '登录尝试过于频繁，请稍后重试',
+            'retry_after': throttled.retry_after,
+        }
 
-    def _record_login(self, request, user, is_successful, failure_reason=''):
-        """记录登录信息"""
+    def _update_throttle(self, request, is_successful, *identifiers):
+        """登录成功清掉账号的失败计数，失败则累计 IP 和账号的失败次数"""
+        throttle = get_login_throttle()
+        if throttle is None:
+            return
         try:
-            LoginRecord.objects.create(
+            if is_successful:
+                throttle.record_success(get_client_ip(request), *identifiers)
+            else:
+                throttle.record_failure(get_client_ip(request), identifiers[0])
+        except Exception as e:
+            logger.warning("更新登录限流计数失败: %s", e)
+
+    def login_succeeded(self, request, user):
+        """登录成功：记录登录、更新最后登录时间并返回响应数据"""
+        # 记录登录信息
+        self._record_login(request, user, True)
+        self._update_throttle(request, True, user.username, user.email)
+        
+        # 更新最后登录时间
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        
+        # 生成JWT token
+        refresh = RefreshToken.for_user(user)
+        
+        # 获取用户资料
+        try:
+            profile = user.profile
+        except UserProfile.DoesNotExist:
+            # 如果用户没有资料，创建一个
+            profile = UserProfile.objects.create(user=user)
+        
+        logger.info("用户登录成功: %s", user.username)
+        
+        return {
+            'message': '登录成功',
+            'user': user_representation(user),
+            'tokens': {
+                'refresh': str(refresh),
+                'access': str(refresh.access_token),
+            }
+        }
+
+    def login_failed(self, request, username, errors, user=None):
+        """
+        登录失败：记录失败并返回响应数据
+
+        账号存在（只是密码错误或账户被禁用）时记录关联到该用户，计入其失败次数；
+        user 未传入时取认证后端解析到的 request.login_candidate。
+        """
+        if user is None:
+            user = getattr(request, 'login_candidate', None)
+        self._record_login(request, user, False, '登录信息验证失败', username=username)
+        self._update_throttle(request, False, username)
+        
+        logger.warning("用户登录失败: %s - %s", username, errors)
+        
+        return {
+            'message': '登录失败',
+            'errors': errors
+        }
+
+    def _record_login(self, request, user, is_successful, failure_reason='', username=''):
+        """记录登录信息（默认进入缓冲区批量写入）"""
+        try:
+            record_login(
                 user=user,
-                ip_address=get_client_ip(request),
+                username=user.username if user else str(username)[:150],
+                ip_address=get_client_ip(request) or UNKNOWN_IP,
                 user_agent=get_user_agent(request),
                 login_method='password',
                 is_successful=is_successful,
                 failure_reason=failure_reason
             )
         except Exception as e:
-            logger.error(f"记录登录信息失败: {e}")
+            logger.error("记录登录信息失败: %s", e)
 
 
 class UserLogoutView(APIView):
@@ -151,15 +228,15 @@ class UserLogoutView(APIView):
             refresh_token = request.data.get("refresh")
             if refresh_token:
                 token = RefreshToken(refresh_token)
-                token.blacklist()
+                blacklist_token(token)
             
-            logger.info(f"用户注销: {request.user.username}")
+            logger.info("用户注销: %s", request.user.username)
             
             return Response({
                 'message': '注销成功'
             }, status=status.HTTP_200_OK)
         except Exception as e:
-            logger.error(f"用户注销失败: {e}")
+            logger.error("用户注销失败: %s", e)
             return Response({
                 'message': '注销失败',
                 'error': str(e)
@@ -177,8 +254,18 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         """获取当前用户的资料"""
         profile, created = UserProfile.objects.get_or_create(user=self.request.user)
+        # 复用已认证的用户对象，避免序列化 user.* 字段时再查一次
+        profile.user = self.request.user
         return profile
 
+    def retrieve(self, request, *args, **kwargs):
+        """获取用户资料（按用户缓存）"""
+        data = cached_response(
+            request.user, 'profile',
+            lambda: profile_representation(self.get_object(), request)
+        )
+        return Response(data)
+
     def get_serializer_class(self):
         """根据请求方法返回不同的序列化器"""
         if self.request.method in ['PUT', 'PATCH']:
@@ -187,6 +274,15 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 
     def update(self, request, *args, **kwargs):
         """更新用户资料"""
+        # 在解析请求体之前拒绝超大的上传，避免先把整个文件写入临时文件
+        max_size = getattr(settings, 'AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_size + 64 * 1024:
+            return Response({'error': '上传的文件过大'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
@@ -195,7 +291,7 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         with transaction.atomic():
             self.perform_update(serializer)
             
-        logger.info(f"用户资料更新: {request.user.username}")
+        logger.info("用户资料更新: %s", request.user.username)
         
         return Response({
             'message': '资料更新成功',
@@ -217,7 +313,7 @@ class ChangePasswordView(APIView):
         if serializer.is_valid():
             serializer.save()
             
-            logger.info(f"用户修改密码: {request.user.username}")
+            logger.info("用户修改密码: %s", request.user.username)
             
             return Response({
                 'message': '密码修改成功'
@@ -241,14 +337,25 @@ class UserInfoView(generics.RetrieveAPIView):
         """返回当前登录用户"""
         return self.request.user
 
+    def retrieve(self, request, *args, **kwargs):
+        """获取当前用户信息（按用户缓存，缓存从主库填充；未启用缓存时读副本）"""
+        with replica_reads():
+            data = cached_response(
+                request.user, 'me',
+                lambda: user_representation(self.get_object(), request)
+            )
+        return Response(data)
+
 
 class LoginRecordListView(generics.ListAPIView):
     """
     用户登录记录列表视图
     GET /api/auth/login-records/
+    GET /api/auth/login-records/?paginate=cursor - 键集分页（按 next/previous 链接翻页）
     """
     serializer_class = LoginRecordSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LoginRecordPagination
 
     def get_queryset(self):
         """获取当前用户的登录记录"""
@@ -260,10 +367,59 @@ class LoginRecordListView(generics.ListAPIView):
         
         start_date = timezone.now() - timedelta(days=days)
         
-        return LoginRecord.objects.filter(
-            user=self.request.user,
-            login_time__gte=start_date
-        ).order_by('-login_time')
+        return LoginRecord.objects.for_user(
+            self.request.user
+        ).since(start_date).select_related('user', 'user_agent').recent_first()
+
+    def list(self, request, *args, **kwargs):
+        """登录记录只读，从副本查询；只取需要的列，不创建模型实例"""
+        with replica_reads():
+            queryset = login_record_values(self.filter_queryset(self.get_queryset()))
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(login_record_rows(page))
+            return Response(login_record_rows(queryset))
+
+
+class LoginRecordExportView(APIView):
+    """
+    登录记录导出视图
+    GET /api/auth/login-records/export/?export_format=csv|ndjson&start=&end=&is_successful=
+
+    以流的形式输出，内存占用与导出行数无关。普通用户只能导出自己的记录；
+    管理员可以用 user 参数指定用户，不指定时导出全部。
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        export_format = params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({
+                'error': f'不支持的导出格式: {export_format}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            filters = {
+                'start': parse_time_bound(params.get('start')),
+                'end': parse_time_bound(params.get('end'), end=True),
+                'is_successful': parse_flag(params.get('is_successful')),
+            }
+            if request.user.is_staff:
+                filters['user_id'] = int(params['user']) if params.get('user') else None
+            else:
+                filters['user_id'] = request.user.pk
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            iter_export(export_format, export_rows(**filters)),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        filename = f"login_records_{timezone.localtime():%Y%m%d%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        logger.info("导出登录记录: %s %s", request.user.username, filters)
+        return response
 
 
 @api_view(['POST'])
@@ -281,10 +437,22 @@ def refresh_token_view(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         refresh = RefreshToken(refresh_token)
-        
-        return Response({
-            'access': str(refresh.access_token)
-        }, status=status.HTTP_200_OK)
+        if is_blacklisted(refresh):
+            return Response({
+                'error': 'Token已失效'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                blacklist_token(refresh)
+            # 与 simplejwt 的 TokenRefreshSerializer 相同：换新的 jti 和有效期
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return Response(data, status=status.HTTP_200_OK)
         
     except Exception as e:
         return Response({
@@ -299,14 +467,16 @@ def dashboard_stats_view(request):
     用户仪表板统计信息
     GET /api/auth/dashboard/
     """
-    user = request.user
-    
-    # 获取用户统计信息
-    login_records = LoginRecord.objects.filter(user=user)
-    recent_logins = login_records.filter(
-        login_time__gte=timezone.now() - timedelta(days=30)
-    )
-    
+    with replica_reads():
+        data = cached_response(
+            request.user, 'dashboard',
+            lambda: _build_dashboard_stats(request.user)
+        )
+    return Response(data)
+
+
+def _build_dashboard_stats(user):
+    """生成仪表板统计数据"""
     stats = {
         'user_info': {
             'username': user.username,
@@ -315,22 +485,117 @@ def dashboard_stats_view(request):
             'last_login': user.last_login,
             'is_active': user.is_active,
         },
-        'login_stats': {
-            'total_logins': login_records.count(),
-            'recent_logins': recent_logins.count(),
-            'successful_logins': login_records.filter(is_successful=True).count(),
-            'failed_logins': login_records.filter(is_successful=False).count(),
-        }
+        # 读取增量维护的统计行，缺失时退回单条聚合查询
+        'login_stats': get_login_stats(user),
     }
     
     # 获取用户资料
     try:
         profile = user.profile
-        stats['profile'] = UserProfileSerializer(profile).data
+        stats['profile'] = profile_representation(profile)
     except UserProfile.DoesNotExist:
         stats['profile'] = None
     
-    return Response(stats)
+    return stats
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def response_cache_stats_view(request):
+    """
+    响应缓存命中统计（仅管理员）
+    GET /api/auth/cache-stats/
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return Response({'enabled': False})
+    return Response({'enabled': True, **cache.stats()})
+
+
+class UserImportView(APIView):
+    """
+    批量导入用户（仅管理员）
+    POST /api/auth/users/import/
+
+    上传 CSV/JSON/NDJSON 文件（字段 file），或直接提交 JSON 对象数组。
+    单行出错（包括无法解析的行）不影响其它行，响应中返回每个出错行的行号和错误信息。
+    导入在请求线程中同步进行，请求体超过 USER_IMPORT_API_MAX_SIZE 时返回 413，
+    大文件请在服务器上使用 manage.py import_users 导入。
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def post(self, request):
+        # 在解析请求体之前拒绝超大的导入，避免长时间占用 Web 工作进程
+        max_size = getattr(settings, 'USER_IMPORT_API_MAX_SIZE', 1024 * 1024)
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_size:
+            return Response({
+                'error': f'导入数据超过 {max_size} 字节，请使用 manage.py import_users 命令导入'
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            rows = open_users(upload, upload.name)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return Response({
+                'error': '需要上传 file 或提交用户对象数组'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = UserImporter(
+            workers=getattr(settings, 'USER_IMPORT_API_WORKERS', 1),
+            dry_run=str(request.query_params.get('dry_run', '')).lower() in ('1', 'true'),
+            max_errors=getattr(settings, 'USER_IMPORT_MAX_REPORTED_ERRORS', 1000),
+        )
+        try:
+            report = importer.run(rows)
+        except ValueError as e:
+            # 只有整体载入的 JSON 数组会在这里失败，此时还没有导入任何一行
+            return Response({'error': f'无法解析导入文件: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info("批量导入用户: %s 创建 %s，失败 %s", request.user.username, report['created'], report['failed'])
+        return Response(report, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def login_throttle_view(request):
+    """
+    登录限流状态（仅管理员）
+    GET /api/auth/throttle/ - 当前被锁定的 IP 和账号
+    POST /api/auth/throttle/ - 解除锁定，参数 key（例如 ip:1.2.3.4 或 username:alice）
+    """
+    throttle = get_login_throttle()
+    if throttle is None:
+        return Response({'enabled': False})
+
+    if request.method == 'POST':
+        key = request.data.get('key')
+        if not key:
+            return Response({'error': '需要提供 key'}, status=status.HTTP_400_BAD_REQUEST)
+        throttle.unlock(key)
+        logger.info("管理员 %s 解除登录限流: %s", request.user.username, key)
+        return Response({'message': '已解除锁定', 'key': key})
+
+    now = timezone.now().timestamp()
+    return Response({
+        'enabled': True,
+        'locked': [
+            {
+                'key': lock.key,
+                'scope': lock.key.split(':', 1)[0],
+                'locked_until': datetime.fromtimestamp(lock.until, tz=dt_timezone.utc),
+                'retry_after': max(int(lock.until - now), 0),
+                'strikes': lock.strikes,
+            }
+            for lock in throttle.locks()
+        ],
+    })
 
 
 @api_view(['POST'])
@@ -354,10 +619,27 @@ def deactivate_account_view(request):
     
     # 停用用户账户
     user.is_active = False
-    user.save()
+    user.save(update_fields=['is_active'])
     
-    logger.info(f"用户停用账户: {user.username}")
+    logger.info("用户停用账户: %s", user.username)
     
     return Response({
         'message': '账户已停用'
-    }, status=status.HTTP_200_OK) 13123
\ No newline at end of file
+    }, status=status.HTTP_200_OK) 
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus 指标（多进程部署时为所有进程的汇总）
+    GET /metrics
+
+    只允许 METRICS['ALLOWED_NETWORKS'] 中的地址直接访问，不读取代理转发头。
+    """
+    conf = get_metrics_conf()
+    if not conf['ENABLED']:
+        raise Http404
+    remote = parse_ip(request.META.get('REMOTE_ADDR', ''))
+    if remote is None or remote not in TrustedNetworks(conf['ALLOWED_NETWORKS']):
+        return HttpResponseForbidden()
+    return HttpResponse(get_exporter().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,16 @@
+"""
+ASGI 入口
+
+    ASYNC_VIEWS=True uvicorn asgi:application --workers 4
+
+开启 ASYNC_VIEWS 后读多写少的接口使用 accounts.async_views 中的异步视图；
+其余同步视图由 Django 放到线程池中执行，行为不变。
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+application = get_asgi_application()
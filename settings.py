@@ -5,7 +5,7 @@ Django settings for DRF Login System
 import os
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -37,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 放在第一位，请求耗时包含其余中间件
+    'accounts.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -66,15 +68,44 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'wsgi.application'
+ASGI_APPLICATION = 'asgi.application'
 
 # Database
+# CONN_MAX_AGE 秒内复用连接（每个线程一个），CONN_HEALTH_CHECKS 在复用前检查连接是否可用；
+# transaction_mode=IMMEDIATE：事务开始时就取得写锁，并发写入排队等待而不是报 database is locked
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'accounts.sqlite_backend',
+        'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE'),
+        },
     }
 }
 
+# 只读副本：逗号分隔的数据库文件路径（由外部复制工具与主库同步），
+# 依次注册为 replica1、replica2……；测试时副本指向测试主库
+for _index, _name in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{_index}'] = {**DATABASES['default'], 'NAME': _name, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['accounts.db.ReadReplicaRouter']
+DATABASE_PRIMARY = 'default'
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != DATABASE_PRIMARY]
+# 只读接口中允许读副本的应用
+REPLICA_APPS = ('accounts', 'auth')
+
+# 每个 SQLite 连接建立后执行的 PRAGMA（WAL 模式下读写并发、写入排队等待锁）
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=64 * 1024 * 1024, cast=int),
+    'cache_size': -16000,
+    'temp_store': 'memory',
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -91,6 +122,41 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# 认证后端：一次索引查询解析用户名或邮箱（邮箱忽略大小写）
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.UsernameOrEmailBackend',
+]
+
+# 密码哈希策略：pbkdf2 或 argon2（argon2 需要安装 argon2-cffi）
+# 首选哈希器排第一，其余只用于校验旧哈希；参数或算法变化后，
+# 用户下一次登录成功时自动按新策略重新哈希
+PASSWORD_HASH_POLICY = config('PASSWORD_HASH_POLICY', default='pbkdf2')
+PASSWORD_HASH_PBKDF2_ITERATIONS = config('PASSWORD_HASH_PBKDF2_ITERATIONS', default=600000, cast=int)
+PASSWORD_HASH_ARGON2_TIME_COST = config('PASSWORD_HASH_ARGON2_TIME_COST', default=2, cast=int)
+PASSWORD_HASH_ARGON2_MEMORY_COST = config('PASSWORD_HASH_ARGON2_MEMORY_COST', default=102400, cast=int)
+PASSWORD_HASH_ARGON2_PARALLELISM = config('PASSWORD_HASH_ARGON2_PARALLELISM', default=8, cast=int)
+
+_PASSWORD_HASHER_POLICIES = {
+    'pbkdf2': 'accounts.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'accounts.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHER_POLICIES[PASSWORD_HASH_POLICY],
+    *[path for name, path in _PASSWORD_HASHER_POLICIES.items() if name != PASSWORD_HASH_POLICY],
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# 密码校验卸载：开启后登录使用异步视图，哈希在有界进程池中计算；
+# 排队中的校验数达到 MAX_PENDING 时直接返回 503
+PASSWORD_HASH_OFFLOAD = config('PASSWORD_HASH_OFFLOAD', default=False, cast=bool)
+PASSWORD_HASH_POOL_SIZE = config('PASSWORD_HASH_POOL_SIZE', default=os.cpu_count() or 1, cast=int)
+PASSWORD_HASH_POOL_MAX_PENDING = config('PASSWORD_HASH_POOL_MAX_PENDING', default=(os.cpu_count() or 1) * 4, cast=int)
+
+# 异步视图：ASGI 部署时开启，用户信息、仪表板、登录记录、刷新和注销使用异步版本
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 # Internationalization
 LANGUAGE_CODE = 'zh-hans'
 TIME_ZONE = 'Asia/Shanghai'
@@ -110,7 +176,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
@@ -155,6 +221,134 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# 登录记录写入配置
+# LOGIN_RECORD_ASYNC 为 True 时登录记录先进入内存缓冲区，由后台线程批量写入；
+# 为 False 时在请求内同步写入
+LOGIN_RECORD_ASYNC = config('LOGIN_RECORD_ASYNC', default=True, cast=bool)
+LOGIN_RECORD_BATCH_SIZE = config('LOGIN_RECORD_BATCH_SIZE', default=500, cast=int)
+LOGIN_RECORD_FLUSH_INTERVAL = config('LOGIN_RECORD_FLUSH_INTERVAL', default=1.0, cast=float)
+LOGIN_RECORD_MAX_BUFFER = config('LOGIN_RECORD_MAX_BUFFER', default=50000, cast=int)
+
+# 登录记录保留期：早于 LOGIN_RECORD_RETENTION_DAYS 天的记录由 archive_login_records 命令
+# 汇总到每日汇总表并写入按月划分的归档文件（LOGIN_RECORD_ARCHIVE_DIR 为空时不保留原始记录）
+LOGIN_RECORD_RETENTION_DAYS = config('LOGIN_RECORD_RETENTION_DAYS', default=180, cast=int)
+LOGIN_RECORD_ARCHIVE_DIR = config('LOGIN_RECORD_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'login_records'))
+LOGIN_RECORD_ARCHIVE_BATCH_SIZE = config('LOGIN_RECORD_ARCHIVE_BATCH_SIZE', default=1000, cast=int)
+
+# 登录记录导出时每次从数据库读取的行数（iterator 的 chunk_size）
+LOGIN_RECORD_EXPORT_CHUNK_SIZE = config('LOGIN_RECORD_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# 后台登录记录列表的计数上限，超过后按上限分页，避免大表上的 COUNT(*)
+LOGIN_RECORD_ADMIN_COUNT_LIMIT = config('LOGIN_RECORD_ADMIN_COUNT_LIMIT', default=10000, cast=int)
+
+# 登录记录的 UA 字符串去重保存在 user_agent 表中，进程内缓存最近使用的 USER_AGENT_CACHE_SIZE 个
+USER_AGENT_CACHE_SIZE = config('USER_AGENT_CACHE_SIZE', default=10000, cast=int)
+
+# 仪表板登录统计：True 时读取增量维护的 LoginStats 行，False 时用原始记录和每日汇总的聚合查询现算
+LOGIN_STATS_USE_COUNTERS = config('LOGIN_STATS_USE_COUNTERS', default=True, cast=bool)
+
+# 按用户的接口响应缓存（/me/、/profile/、/dashboard/）
+# BACKEND: locmem（进程内 LRU）、redis，或自定义后端类的导入路径
+ACCOUNTS_RESPONSE_CACHE = {
+    'ENABLED': config('RESPONSE_CACHE_ENABLED', default=True, cast=bool),
+    'BACKEND': config('RESPONSE_CACHE_BACKEND', default='locmem' if DEBUG else 'redis'),
+    'LOCATION': config('RESPONSE_CACHE_REDIS_URL', default='redis://127.0.0.1:6379/1'),
+    'TTL': config('RESPONSE_CACHE_TTL', default=60, cast=int),
+    'MAX_ENTRIES': config('RESPONSE_CACHE_MAX_ENTRIES', default=10000, cast=int),
+    'KEY_PREFIX': 'accounts:resp',
+}
+
+# JWT 认证用户缓存：校验签名后先查进程内 LRU（及可选的共享缓存），命中时不查 auth_user
+# SHARED_CACHE 填 CACHES 中的别名（例如 Redis），None 表示只用进程内缓存
+JWT_USER_CACHE = {
+    'ENABLED': config('JWT_USER_CACHE_ENABLED', default=True, cast=bool),
+    'LOCAL_TTL': config('JWT_USER_CACHE_LOCAL_TTL', default=5, cast=int),
+    'MAX_ENTRIES': config('JWT_USER_CACHE_MAX_ENTRIES', default=10000, cast=int),
+    'SHARED_CACHE': config('JWT_USER_CACHE_SHARED', default=None),
+    'SHARED_TTL': config('JWT_USER_CACHE_SHARED_TTL', default=60, cast=int),
+}
+
+# Refresh token 黑名单：STORE 为精确存储（db / redis），FILTER 为前置的分桶布隆过滤器
+# （local / redis / none）。local 过滤器按主键从数据库增量同步其它进程拉黑的 JTI，其它进程的拉黑
+# 最多延迟 SYNC_INTERVAL 秒生效；为 0（默认）时 db 存储不启用 local 过滤器，每次直接按 jti 查表。
+# db 存储的过期记录用 purge_token_blacklist 命令定期清理
+TOKEN_BLACKLIST = {
+    'STORE': config('TOKEN_BLACKLIST_STORE', default='db'),
+    'FILTER': config('TOKEN_BLACKLIST_FILTER', default='local'),
+    'REDIS_URL': config('TOKEN_BLACKLIST_REDIS_URL', default='redis://127.0.0.1:6379/2'),
+    'BUCKET_SECONDS': config('TOKEN_BLACKLIST_BUCKET_SECONDS', default=3600, cast=int),
+    'BITS_PER_BUCKET': config('TOKEN_BLACKLIST_BITS_PER_BUCKET', default=1 << 20, cast=int),
+    'HASHES': config('TOKEN_BLACKLIST_HASHES', default=7, cast=int),
+    'SYNC_INTERVAL': config('TOKEN_BLACKLIST_SYNC_INTERVAL', default=0.0, cast=float),
+    'PURGE_BATCH_SIZE': config('TOKEN_BLACKLIST_PURGE_BATCH_SIZE', default=1000, cast=int),
+}
+
+# 可信反向代理网段：只有直连地址在这些网段内时才读取 X-Forwarded-For，
+# 并从右往左跳过其中的代理地址。逗号分隔，例如 10.0.0.0/8,172.16.0.0/12
+TRUSTED_PROXIES = config('TRUSTED_PROXIES', default='127.0.0.0/8,::1/128', cast=Csv())
+
+# 登录限流：*_RATE 为 (次数上限, 窗口秒数)。全局计数所有登录请求，IP 和账号计数失败次数，
+# 失败超限后锁定 LOCKOUT_BASE 秒，连续锁定时按 LOCKOUT_MULTIPLIER 倍增长，最长 LOCKOUT_MAX 秒
+LOGIN_THROTTLE = {
+    'ENABLED': config('LOGIN_THROTTLE_ENABLED', default=True, cast=bool),
+    'BACKEND': config('LOGIN_THROTTLE_BACKEND', default='locmem' if DEBUG else 'redis'),
+    'REDIS_URL': config('LOGIN_THROTTLE_REDIS_URL', default='redis://127.0.0.1:6379/3'),
+    'GLOBAL_RATE': (config('LOGIN_THROTTLE_GLOBAL_LIMIT', default=200, cast=int), 1),
+    'IP_RATE': (config('LOGIN_THROTTLE_IP_LIMIT', default=20, cast=int), 300),
+    'USERNAME_RATE': (config('LOGIN_THROTTLE_USERNAME_LIMIT', default=5, cast=int), 300),
+    'LOCKOUT_BASE': config('LOGIN_THROTTLE_LOCKOUT_BASE', default=60, cast=int),
+    'LOCKOUT_MULTIPLIER': 2,
+    'LOCKOUT_MAX': config('LOGIN_THROTTLE_LOCKOUT_MAX', default=3600, cast=int),
+}
+
+# 批量导入用户：每批行数、计算密码哈希的进程数（默认 CPU 核数）、接口响应中最多返回的错误行数
+USER_IMPORT_BATCH_SIZE = config('USER_IMPORT_BATCH_SIZE', default=1000, cast=int)
+USER_IMPORT_WORKERS = config('USER_IMPORT_WORKERS', default=os.cpu_count() or 1, cast=int)
+USER_IMPORT_MAX_REPORTED_ERRORS = config('USER_IMPORT_MAX_REPORTED_ERRORS', default=1000, cast=int)
+# 导入接口在请求线程中同步执行：请求体上限（字节，更大的文件用 import_users 命令）和计算哈希的进程数
+USER_IMPORT_API_MAX_SIZE = config('USER_IMPORT_API_MAX_SIZE', default=1024 * 1024, cast=int)
+USER_IMPORT_API_WORKERS = config('USER_IMPORT_API_WORKERS', default=1, cast=int)
+
+# 邮件：开发环境默认输出到控制台，生产环境配置 SMTP；
+# filebased 后端把每封邮件写入 EMAIL_FILE_PATH 目录，适合无网络环境下检查邮件内容
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@localhost')
+
+# 邮件发件箱：业务代码只写入 email_outbox 表，由 send_queued_emails 命令的工作线程发送。
+# BACKEND 为空时使用 EMAIL_BACKEND；失败后按 RETRY_BASE * 2^(n-1) 秒退避（最长 RETRY_MAX），
+# 共尝试 MAX_ATTEMPTS 次。ENABLED 为 False 时在请求中同步发送
+EMAIL_OUTBOX = {
+    'ENABLED': config('EMAIL_OUTBOX_ENABLED', default=True, cast=bool),
+    'BACKEND': config('EMAIL_OUTBOX_BACKEND', default=''),
+    'BATCH_SIZE': config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int),
+    'WORKERS': config('EMAIL_OUTBOX_WORKERS', default=2, cast=int),
+    'POLL_INTERVAL': config('EMAIL_OUTBOX_POLL_INTERVAL', default=2.0, cast=float),
+    'LEASE': config('EMAIL_OUTBOX_LEASE', default=300, cast=int),
+    'MAX_ATTEMPTS': config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int),
+    'RETRY_BASE': config('EMAIL_OUTBOX_RETRY_BASE', default=30, cast=int),
+    'RETRY_MAX': config('EMAIL_OUTBOX_RETRY_MAX', default=3600, cast=int),
+}
+
+# 上传文件超过 FILE_UPLOAD_MAX_MEMORY_SIZE 时按块写入临时文件，不在内存中缓冲整个文件
+FILE_UPLOAD_MAX_MEMORY_SIZE = config('FILE_UPLOAD_MAX_MEMORY_SIZE', default=256 * 1024, cast=int)
+
+# 头像：按图片内容校验格式、大小和像素数，上传后由后台线程（AVATAR_WORKERS 个）生成
+# AVATAR_SIZES 中每种尺寸的 AVATAR_FORMATS 格式缩略图；AVATAR_PROCESSING_ASYNC 为 False 时
+# 在请求的事务提交后同步处理。进程重启后未处理的头像由 process_avatars 命令补处理
+AVATAR_MAX_UPLOAD_SIZE = config('AVATAR_MAX_UPLOAD_SIZE', default=5 * 1024 * 1024, cast=int)
+AVATAR_MAX_PIXELS = config('AVATAR_MAX_PIXELS', default=4096 * 4096, cast=int)
+AVATAR_SIZES = {'small': 64, 'medium': 128, 'large': 256}
+AVATAR_FORMATS = ('webp', 'jpeg')
+AVATAR_PROCESSING_ASYNC = config('AVATAR_PROCESSING_ASYNC', default=True, cast=bool)
+AVATAR_WORKERS = config('AVATAR_WORKERS', default=1, cast=int)
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -169,6 +363,8 @@ CORS_ALLOW_CREDENTIALS = True
 # AUTH_USER_MODEL = 'accounts.User'
 
 # Logging configuration
+# 文件日志为按大小轮转的 JSON 行；LOG_QUEUE 开启时由后台线程写出（见 accounts.structured_logging）
+LOGGING_CONFIG = 'accounts.structured_logging.configure_logging'
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -181,13 +377,19 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'accounts.structured_logging.JSONFormatter',
+        },
     },
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'logging.handlers.RotatingFileHandler',
             'filename': BASE_DIR / 'logs' / 'django.log',
-            'formatter': 'verbose',
+            'maxBytes': config('LOG_MAX_BYTES', default=50 * 1024 * 1024, cast=int),
+            'backupCount': config('LOG_BACKUP_COUNT', default=5, cast=int),
+            'encoding': 'utf-8',
+            'formatter': 'json',
         },
         'console': {
             'level': 'DEBUG',
@@ -211,4 +413,28 @@ LOGGING = {
             'propagate': False,
         },
     },
-} 
\ No newline at end of file
+} 
+
+# 日志队列：请求线程只把记录放进有界队列（满了丢弃并计数），后台线程负责格式化和写出；
+# SAMPLING 按日志器和消息模板每 N 条保留 1 条
+LOG_QUEUE = {
+    'ENABLED': config('LOG_QUEUE_ENABLED', default=True, cast=bool),
+    'MAXSIZE': config('LOG_QUEUE_MAXSIZE', default=10000, cast=int),
+    'SAMPLING': {
+        'accounts.views': {
+            '用户登录成功: %s': config('LOG_SAMPLE_LOGIN_SUCCESS', default=1, cast=int),
+        },
+    },
+}
+
+# 请求指标（/metrics）：多进程部署时 MULTIPROC_DIR 设为同一台机器上所有 worker 共享的目录，
+# 已退出 worker 的文件由新启动的 worker 合并进 dead.json；超过阈值的请求记录警告日志并附带最慢的 SQL
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', default=True, cast=bool),
+    'MULTIPROC_DIR': config('METRICS_MULTIPROC_DIR', default=''),
+    'FLUSH_INTERVAL': config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float),
+    'SLOW_REQUEST_MS': config('METRICS_SLOW_REQUEST_MS', default=500, cast=int),
+    'SLOW_QUERY_COUNT': config('METRICS_SLOW_QUERY_COUNT', default=50, cast=int),
+    'SLOW_QUERY_LOG_LIMIT': 5,
+    'ALLOWED_NETWORKS': config('METRICS_ALLOWED_NETWORKS', default='127.0.0.0/8,::1/128', cast=Csv()),
+}
@@ -8,6 +8,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.documentation import include_docs_urls
 
+from accounts.views import metrics_view
+
 urlpatterns = [
     # Django Admin
     path('admin/', admin.site.urls),
@@ -20,6 +22,9 @@ urlpatterns = [
     
     # API 根路径
     path('api/', include('accounts.urls')),
+
+    # Prometheus 指标
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # 在开发环境中提供媒体文件服务
@@ -30,6 +35,4 @@ if settings.DEBUG:
 # 设置 Admin 标题
 admin.site.site_header = "DRF 登录系统管理"
 admin.site.site_title = "DRF 管理"
-admin.site.index_title = "欢迎使用 DRF 登录系统" 
-
-dssad
\ No newline at end of file
+admin.site.index_title = "欢迎使用 DRF 登录系统"
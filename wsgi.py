@@ -0,0 +1,13 @@
+"""
+WSGI 入口
+
+    gunicorn wsgi:application --workers 4 --threads 8
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+application = get_wsgi_application()